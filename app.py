@@ -1,30 +1,73 @@
 import os
+import json
 import time
 import uuid
 import threading
 import logging
 import shutil
-import random
-from flask import Flask, render_template, request, jsonify, session
+import mimetypes
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, send_from_directory, abort
+from werkzeug.security import safe_join
 from flask_cors import CORS
-from utils.text_processor import process_text
-from utils.image_generator import generate_images, preload_model
-from utils.audio_generator import generate_audio, get_available_voices
-from utils.video_creator import create_video, create_video_with_transitions
+from werkzeug.utils import secure_filename
+from utils.text_processing import split_text_into_scenes, generate_scene_descriptions, generate_prompts, generate_negative_prompts
+from utils.text_processing import open_text_file, read_lines, iter_chapters, iter_scenes
+from utils.image_generation import generate_images_for_scenes, seed_from_text, preload_model, model_manager, image_cache, embedding_cache
+from utils.image_generation import image_flight, image_backend
+from utils.audio_generation import generate_audio_for_scenes, get_available_voices, audio_cache, speech_flight
+from utils.video_creation import create_video, concatenate_segments, HLSPlaylist
+from utils.task_scheduler import TaskScheduler, QueueFullError
+from utils.scene_pipeline import run_scene_pipeline
+from utils.task_manifest import TaskManifest, text_hash
+from utils.task_store import create_task_store, task_status
+from utils.event_hub import create_event_hub
+from utils.cancellation import CancellationToken, TaskCancelled
+from utils.quality_tiers import select_quality_tier
+from utils.storage_manager import StorageManager
+from utils.single_flight import RequestRegistry, request_fingerprint
 import config
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# HLS分片的MIME类型，系统默认把 .ts 识别为其他格式
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
 # 创建Flask应用
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.SECRET_KEY
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB上传限制
+app.config['MAX_CONTENT_LENGTH'] = config.UPLOAD_MAX_MB * 1024 * 1024  # 上传文件大小限制
+app.config['USE_X_SENDFILE'] = config.USE_X_SENDFILE
 CORS(app)
 
-# 全局任务字典，用于跟踪任务状态
-tasks = {}
+# 任务状态存储，保存在进程外部，重启后不丢失，多个Web进程共享
+task_store = create_task_store(config.TASK_STORE_BACKEND, db_path=config.TASK_DB_PATH, redis_url=config.REDIS_URL)
+
+# 任务事件中心，进度更新时推送给所有订阅该任务的客户端
+event_hub = create_event_hub(config.EVENT_HUB_BACKEND, redis_url=config.REDIS_URL)
+
+# 本进程中正在执行的任务的取消令牌
+cancel_tokens = {}
+
+# 任务结束后的状态
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# 任务调度器：固定数量的工作线程 + 有界等待队列 + 分阶段并发限制
+scheduler = TaskScheduler(
+    num_workers=config.PIPELINE_WORKERS,
+    max_queue_size=config.TASK_QUEUE_SIZE,
+    stage_limits={
+        'image': config.IMAGE_STAGE_CONCURRENCY,
+        'tts': config.TTS_STAGE_CONCURRENCY,
+        'encode': config.ENCODE_STAGE_CONCURRENCY
+    },
+    estimated_task_seconds=config.ESTIMATED_TASK_SECONDS,
+    # 有任务出队或被取消时，排在后面的任务的排队位置和预计时间随之变化
+    on_queue_change=lambda task_ids: [publish_status(task_id) for task_id in task_ids]
+)
+scheduler.start()
 
 # 确保输出目录存在
 os.makedirs(config.UPLOAD_FOLDER, exist_ok=True)
@@ -35,6 +78,46 @@ os.makedirs(config.TEMPLATE_FOLDER, exist_ok=True)
 # 在后台线程中预加载模型
 threading.Thread(target=preload_model, daemon=True).start()
 
+# 任务目录被回收时删除任务记录、上传的文本文件和事件通道
+def remove_task_record(task_id):
+    task = task_store.get(task_id)
+    upload_path = task.get('upload_path') if task else None
+    if upload_path and os.path.exists(upload_path):
+        os.remove(upload_path)
+    task_store.delete(task_id)
+    event_hub.discard(task_id)
+
+# 中间产物被回收时HLS播放列表和分片也已删除，不再返回播放列表地址（完整视频仍可播放）
+def clear_playlist_url(task_id):
+    if (task_store.get(task_id) or {}).get('playlist_url'):
+        task_store.update(task_id, playlist_url=None)
+
+# 输出目录后台回收：按配额和保留时间删除任务产物，正在排队或执行的任务不回收
+storage_manager = StorageManager(
+    config.OUTPUT_FOLDER,
+    quota_bytes=config.OUTPUT_QUOTA_MB * 1024 * 1024,
+    ttl_seconds=config.OUTPUT_TTL_HOURS * 3600,
+    interval_seconds=config.STORAGE_REAP_INTERVAL,
+    is_active=lambda task_id: (task_store.get(task_id) or {}).get('status') in ('queued', 'processing'),
+    on_remove=remove_task_record,
+    on_trim=clear_playlist_url
+)
+storage_manager.start()
+
+# 请求去重：文本和全部生成参数都相同的请求关联到已有任务，不重复生成
+# 登记保存在任务存储中，多个Web进程共享；保留时间与输出目录一致，视频被回收后登记也不再有用
+request_registry = RequestRegistry(task_store, ttl_seconds=config.OUTPUT_TTL_HOURS * 3600 or 86400)
+DEDUP_OPTIONS = ('style', 'voice', 'use_transitions', 'add_background_music', 'deterministic', 'quality')
+
+# 登记的任务仍可复用：正在排队或执行，或已完成且视频文件仍在
+def is_reusable_task(task_id):
+    task = task_store.get(task_id)
+    if task is None or task.get('cancel_requested'):
+        return False
+    if task['status'] in ('queued', 'processing'):
+        return True
+    return task['status'] == 'completed' and os.path.exists(os.path.join(config.OUTPUT_FOLDER, task_id, 'output.mp4'))
+
 # 主页路由
 @app.route('/')
 def index():
@@ -56,10 +139,6 @@ def generate():
         # 获取请求数据
         data = request.json
         text = data.get('text', '')
-        style = data.get('style', 'default')
-        voice = data.get('voice', config.DEFAULT_VOICE)
-        use_transitions = data.get('use_transitions', True)  # 是否使用过渡效果
-        add_background_music = data.get('add_background_music', False)  # 是否添加背景音乐
         
         # 验证输入
         if not text:
@@ -68,6 +147,10 @@ def generate():
         if len(text) > config.MAX_TEXT_LENGTH:
             return jsonify({'error': f'文本长度超过限制（{config.MAX_TEXT_LENGTH}字）'}), 400
         
+        options, error = parse_generation_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
         # 生成任务ID
         task_id = str(uuid.uuid4())
         
@@ -76,112 +159,729 @@ def generate():
         os.makedirs(task_output_folder, exist_ok=True)
         
         # 初始化任务状态
-        tasks[task_id] = {
-            'status': 'processing',
+        task_store.create(task_id, {
+            'status': 'queued',
             'progress': 0,
             'start_time': time.time(),
             'output_folder': task_output_folder,
             'text': text[:100] + '...' if len(text) > 100 else text,  # 存储截断的文本用于历史记录
-            'style': style
-        }
+            'style': options['style'],
+            'quality': options['quality'],
+            'playlist_url': create_task_playlist(task_id, options['pipeline_mode']),
+            'attachers': 1  # 等待该任务结果的客户端数，相同的请求关联到该任务时增加
+        })
+        
+        # 相同的请求正在进行或已完成（如重复点击提交）：直接关联到已有任务，force 为真时总是新建任务
+        # 先创建任务记录再登记，同时到达的相同请求能看到对方的记录
+        if config.REQUEST_DEDUP_ENABLED and not parse_bool(data.get('force'), False):
+            fingerprint = request_fingerprint(text=text, model_id=config.DEFAULT_MODEL,
+                                              **{key: options[key] for key in DEDUP_OPTIONS})
+            existing_id = request_registry.claim(fingerprint, task_id, is_reusable_task)
+            if existing_id != task_id:
+                task_store.delete(task_id)
+                shutil.rmtree(task_output_folder, ignore_errors=True)
+                return attach_to_task(existing_id)
+            # 记录指纹，任务未能进入队列时撤销登记
+            task_store.update(task_id, fingerprint=fingerprint)
+        
+        # 分布式模式：投递到Celery队列，由独立的worker执行
+        if config.TASK_EXECUTION_MODE == 'celery':
+            from celery_app import submit_task
+            submit_task(task_id, text, options['style'], options['voice'], options['use_transitions'],
+                        options['add_background_music'], options['deterministic'], options['quality'])
+            remember_task(task_id)
+            return jsonify({'task_id': task_id, 'status': 'queued', 'quality': options['quality']})
+        
+        return enqueue_task(
+            task_id, process_task, text, options['style'], options['voice'], options['use_transitions'],
+            options['add_background_music'], options['pipeline_mode'], options['deterministic'], options['quality']
+        )
+        
+    except Exception as e:
+        logger.error(f"处理失败: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# API路由 - 上传小说文本文件生成视频，不受 MAX_TEXT_LENGTH 限制，按章节流式处理
+@app.route('/api/upload', methods=['POST'])
+def upload():
+    try:
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify({'error': '请上传文本文件'}), 400
         
-        # 在会话中保存最近的任务ID
-        if 'recent_tasks' not in session:
-            session['recent_tasks'] = []
+        if not file.filename.lower().endswith('.txt'):
+            return jsonify({'error': '只支持 .txt 格式的文本文件'}), 400
         
-        recent_tasks = session['recent_tasks']
-        if task_id not in recent_tasks:
-            recent_tasks.insert(0, task_id)
+        # 整本小说的处理依赖按章节读取文件，只在本机工作线程中执行
+        if config.TASK_EXECUTION_MODE == 'celery':
+            return jsonify({'error': '分布式模式下不支持上传文件，请直接提交文本'}), 400
         
-        # 只保留最近的10个任务
-        session['recent_tasks'] = recent_tasks[:10]
+        options, error = parse_generation_options(request.form)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # 启动后台处理线程
-        threading.Thread(target=process_task, args=(task_id, text, style, voice, use_transitions, add_background_music)).start()
+        task_id = str(uuid.uuid4())
+        task_output_folder = os.path.join(config.OUTPUT_FOLDER, task_id)
+        os.makedirs(task_output_folder, exist_ok=True)
         
-        # 返回任务ID
-        return jsonify({
-            'task_id': task_id,
-            'status': 'processing'
+        # 文件以任务ID命名保存，原始文件名只用于显示
+        upload_path = os.path.join(config.UPLOAD_FOLDER, f"{task_id}.txt")
+        file.save(upload_path)
+        
+        task_store.create(task_id, {
+            'status': 'queued',
+            'progress': 0,
+            'start_time': time.time(),
+            'output_folder': task_output_folder,
+            'upload_path': upload_path,
+            'text': secure_filename(file.filename) or file.filename,
+            'style': options['style'],
+            'quality': options['quality'],
+            'playlist_url': create_task_playlist(task_id, 'streaming')
         })
         
+        return enqueue_task(
+            task_id, process_upload_task, upload_path, options['style'], options['voice'], options['use_transitions'],
+            options['add_background_music'], options['deterministic'], options['quality']
+        )
+        
     except Exception as e:
-        logger.error(f"处理失败: {str(e)}")
+        logger.error(f"上传处理失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# 后台处理任务
-def process_task(task_id, text, style, voice, use_transitions=True, add_background_music=False):
+# 读取并校验生成参数，JSON请求体和上传表单共用
+def parse_generation_options(data):
+    options = {
+        'style': data.get('style', 'default'),
+        'voice': data.get('voice', config.DEFAULT_VOICE),
+        'use_transitions': parse_bool(data.get('use_transitions'), True),  # 是否使用过渡效果
+        'add_background_music': parse_bool(data.get('add_background_music'), False),  # 是否添加背景音乐
+        'pipeline_mode': data.get('pipeline_mode', config.PIPELINE_MODE),  # 流水线模式：streaming 或 staged
+        'deterministic': parse_bool(data.get('deterministic'), config.DETERMINISTIC_SEEDS),  # 是否使用由文本决定的随机种子
+        'quality': data.get('quality', config.DEFAULT_QUALITY)  # 质量档位：draft、standard、final 或 auto
+    }
+    
+    if options['pipeline_mode'] not in ('streaming', 'staged'):
+        return None, f"不支持的流水线模式: {options['pipeline_mode']}"
+    
+    if options['quality'] != 'auto' and options['quality'] not in config.QUALITY_TIERS:
+        return None, f"不支持的质量档位: {options['quality']}"
+    
+    # 自动档位：根据当前排队情况和目标完成时间选择，负载高时降低画质以缩短等待
+    if options['quality'] == 'auto':
+        options['quality'] = choose_auto_quality()
+    
+    return options, None
+
+# 流水线模式下先创建空的HLS播放列表，提交后即可返回播放地址，场景片段编码完成后陆续追加
+def create_task_playlist(task_id, pipeline_mode):
+    if not config.HLS_ENABLED or pipeline_mode != 'streaming' or config.TASK_EXECUTION_MODE == 'celery':
+        return None
+    HLSPlaylist(os.path.join(config.OUTPUT_FOLDER, task_id, 'hls'))
+    return f'/outputs/{task_id}/hls/playlist.m3u8'
+
+# 表单中的布尔值是字符串
+def parse_bool(value, default):
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 't', 'on')
+    return bool(value)
+
+# 提交到任务队列，队列已满时拒绝并清理已创建的任务
+def enqueue_task(task_id, func, *args):
+    try:
+        queue_position = scheduler.submit(task_id, func, *args)
+    except QueueFullError as e:
+        task = task_store.get(task_id) or {}
+        if task.get('fingerprint'):
+            request_registry.release(task['fingerprint'], task_id)
+        task_store.delete(task_id)
+        shutil.rmtree(os.path.join(config.OUTPUT_FOLDER, task_id), ignore_errors=True)
+        if task.get('upload_path') and os.path.exists(task['upload_path']):
+            os.remove(task['upload_path'])
+        response = jsonify({
+            'error': '任务队列已满，请稍后重试',
+            'queue_size': e.queue_size,
+            'retry_after': int(e.retry_after)
+        })
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after)))
+        return response, 429
+    
+    remember_task(task_id)
+    task = task_store.get(task_id) or {}
+    
+    # 返回任务ID和排队信息
+    return jsonify({
+        'task_id': task_id,
+        'status': 'queued',
+        'quality': task.get('quality'),
+        'playlist_url': task.get('playlist_url'),
+        'queue_position': queue_position,
+        'eta': int(scheduler.estimate_completion(queue_position))  # 预计完成时间，与状态接口一致
+    })
+
+# 返回已有任务的状态，客户端按新提交的任务一样订阅其事件
+def attach_to_task(task_id):
+    logger.info(f"相同的请求已有任务，直接关联，任务ID: {task_id}")
+    storage_manager.touch(task_id)
+    remember_task(task_id)
+    task = task_store.get(task_id)
+    if task['status'] not in FINISHED_STATUSES:
+        # 多一个客户端等待该任务，其中一个客户端取消时不影响其他客户端
+        task_store.increment(task_id, 'attachers')
+    response = build_task_status(task_id, task)
+    response.update(task_id=task_id, quality=task.get('quality'), deduplicated=True)
+    return jsonify(response)
+
+# 根据排队等待时间和目标完成时间选择质量档位
+def choose_auto_quality():
+    # Celery模式下排队情况由各worker队列决定，本进程无法估算，按只有当前任务估算
+    if config.TASK_EXECUTION_MODE == 'celery':
+        wait_seconds = 0
+    else:
+        wait_seconds = scheduler.estimate_wait(scheduler.stats()['queued'] + 1)
+    return select_quality_tier(wait_seconds, scheduler.average_task_seconds(), config.LATENCY_SLO_SECONDS)
+
+# 在会话中保存最近的任务ID
+def remember_task(task_id):
+    if 'recent_tasks' not in session:
+        session['recent_tasks'] = []
+    
+    recent_tasks = session['recent_tasks']
+    if task_id not in recent_tasks:
+        recent_tasks.insert(0, task_id)
+    
+    # 只保留最近的10个任务
+    session['recent_tasks'] = recent_tasks[:10]
+
+# 更新任务状态并推送给订阅者
+def update_task(task_id, **fields):
+    task_store.update(task_id, **fields)
+    publish_status(task_id)
+    # 任务结束后重新统计输出目录的占用
+    if fields.get('status') in FINISHED_STATUSES:
+        storage_manager.refresh(task_id)
+
+# 推送从任务存储读回的完整任务状态
+def publish_status(task_id):
+    task = task_store.get(task_id)
+    if task is not None:
+        event_hub.publish(task_id, 'status', **build_task_status(task_id, task))
+
+# 只在进度前进时更新，比较和写入由任务存储原子完成，并发的场景回调不会让进度回退；
+# 进度没有变化时不推送事件
+def advance_progress(task_id, progress):
+    if task_store.advance(task_id, 'progress', progress):
+        publish_status(task_id)
+
+# 推送单个场景某个阶段完成的事件
+def publish_scene_event(task_id, stage_name, scene_index, total):
+    event_hub.publish(task_id, 'scene', stage=stage_name, scene=scene_index, total=total)
+
+# 推送扩散推理步骤事件
+def publish_step_event(task_id, scene_indices, step, total_steps):
+    event_hub.publish(task_id, 'step', scenes=scene_indices, step=step, total=total_steps)
+
+# 创建任务的取消令牌：本进程内直接取消，其他进程通过任务存储中的取消标记取消
+def create_cancel_token(task_id):
+    def is_cancelled():
+        task = task_store.get(task_id)
+        return task is None or task.get('cancel_requested', False)
+    return CancellationToken(is_cancelled, check_interval=config.CANCEL_CHECK_INTERVAL)
+
+# 后台处理任务，revise_from 为被修改的原任务ID：只重新生成文本或参数有变化的场景
+def process_task(task_id, text, style, voice, use_transitions=True, add_background_music=False, pipeline_mode='staged',
+                 deterministic=False, quality=None, revise_from=None):
+    cancel_token = create_cancel_token(task_id)
+    cancel_tokens[task_id] = cancel_token
     try:
-        task_output_folder = tasks[task_id]['output_folder']
+        # 排队期间可能已被其他进程取消
+        cancel_token.raise_if_cancelled()
+        update_task(task_id, status='processing', run_start_time=time.time())
         
         # 处理文本
         logger.info(f"处理文本，任务ID: {task_id}")
-        segments = process_text(text)
-        tasks[task_id]['progress'] = 10
-        
-        # 生成提示词
-        logger.info(f"生成提示词，任务ID: {task_id}")
-        prompts = generate_prompts(segments, style)
-        tasks[task_id]['progress'] = 20
-        
-        # 生成图像
-        logger.info(f"生成图像，任务ID: {task_id}")
-        image_paths = generate_images(prompts, task_output_folder)
-        tasks[task_id]['progress'] = 60
-        
-        # 生成音频
-        logger.info(f"生成音频，任务ID: {task_id}")
-        audio_data = generate_audio(segments, voice, task_output_folder)
-        tasks[task_id]['progress'] = 80
-        
-        # 创建视频
-        logger.info(f"创建视频，任务ID: {task_id}")
-        if use_transitions:
-            video_path = create_video_with_transitions(image_paths, audio_data, segments, task_output_folder, add_background_music)
+        scenes = split_text_into_scenes(text)
+        
+        # 任务清单记录原文和参数，之后修改任务时据此判断哪些场景需要重新生成
+        manifest = TaskManifest(os.path.join(config.OUTPUT_FOLDER, task_id))
+        manifest.update_options(text=text, style=style, voice=voice, quality=quality, model_id=config.DEFAULT_MODEL,
+                                image_backend=image_backend, low_res_diffusion=config.LOW_RES_DIFFUSION,
+                                low_res_scale=config.LOW_RES_SCALE, upscaler=config.UPSCALER,
+                                use_transitions=use_transitions, add_background_music=add_background_music,
+                                deterministic=deterministic)
+        reuse = None
+        if revise_from:
+            reuse = TaskManifest.load(os.path.join(config.OUTPUT_FOLDER, revise_from)).plan_reuse(scenes, manifest.options())
+            reused = {stage_name: sum(1 for plan in reuse if f'{stage_name}_path' in plan)
+                      for stage_name in ('image', 'audio', 'segment')}
+            logger.info(f"修改任务 {revise_from}，共 {len(scenes)} 个场景，复用 {reused}，任务ID: {task_id}")
+            task_store.update(task_id, reused=reused)
+        update_task(task_id, progress=10)
+        
+        if pipeline_mode == 'streaming':
+            video_path = run_streaming_task(task_id, scenes, style, voice, use_transitions, add_background_music,
+                                            deterministic, cancel_token, quality, manifest=manifest, reuse=reuse)
         else:
-            video_path = create_video(image_paths, audio_data, segments, task_output_folder, add_background_music)
+            video_path = run_staged_task(task_id, scenes, style, voice, use_transitions, add_background_music,
+                                         deterministic, cancel_token, quality, manifest=manifest)
         
         if not video_path:
-            tasks[task_id]['status'] = 'failed'
-            tasks[task_id]['error'] = '视频生成失败'
+            update_task(task_id, status='failed', error='视频生成失败')
             return
         
         # 更新任务状态
-        tasks[task_id]['status'] = 'completed'
-        tasks[task_id]['progress'] = 100
-        tasks[task_id]['video_url'] = f'/outputs/{task_id}/output.mp4'
-        tasks[task_id]['completion_time'] = time.time()
+        update_task(
+            task_id,
+            status='completed',
+            progress=100,
+            video_url=f'/outputs/{task_id}/output.mp4',
+            completion_time=time.time()
+        )
+        
+    except TaskCancelled:
+        logger.info(f"任务已取消，任务ID: {task_id}")
+        update_task(task_id, status='cancelled')
+    except Exception as e:
+        logger.error(f"任务处理失败: {str(e)}")
+        update_task(task_id, status='failed', error=str(e))
+    finally:
+        cancel_tokens.pop(task_id, None)
+
+# 分阶段模式：依次生成全部图像、全部音频，再合成视频
+def run_staged_task(task_id, scenes, style, voice, use_transitions, add_background_music, deterministic, cancel_token=None,
+                    quality=None, manifest=None):
+    task_output_folder = os.path.join(config.OUTPUT_FOLDER, task_id)
+    if manifest is None:
+        manifest = TaskManifest(task_output_folder)
+    
+    # 生成提示词
+    logger.info(f"生成提示词，任务ID: {task_id}")
+    descriptions = generate_scene_descriptions(scenes)
+    prompts = generate_prompts(descriptions, style)
+    negative_prompt = generate_negative_prompts(style)
+    update_task(task_id, progress=20)
+    
+    # 按场景推送完成事件，进度在各阶段的区间内线性推进
+    progress_lock = threading.Lock()
+    completed = {'image': 0, 'audio': 0}
+    
+    def on_progress(stage_name, start, span):
+        def callback(scene_index):
+            with progress_lock:
+                completed[stage_name] += 1
+                done = completed[stage_name]
+            publish_scene_event(task_id, stage_name, scene_index, len(scenes))
+            advance_progress(task_id, start + int(span * done / len(scenes)))
+        return callback
+    
+    # 图像阶段按推理步骤推进进度，批量推理时一个步骤覆盖整批场景
+    def on_step(scene_indices, step, total_steps):
+        publish_step_event(task_id, scene_indices, step, total_steps)
+        with progress_lock:
+            done = completed['image'] + len(scene_indices) * step / total_steps
+        advance_progress(task_id, 20 + int(40 * done / len(scenes)))
+    
+    # 生成图像
+    logger.info(f"生成图像，任务ID: {task_id}")
+    seeds = [seed_from_text(scene) for scene in scenes] if deterministic else None
+    image_timings = {}
+    image_infos = {}
+    with scheduler.stage('image'):
+        image_paths = generate_images_for_scenes(prompts, negative_prompt, task_output_folder, style=style, seeds=seeds,
+                                                 on_progress=on_progress('image', 20, 40), on_step=on_step,
+                                                 cancel_token=cancel_token, quality=quality, timings=image_timings,
+                                                 infos=image_infos)
+    task_store.update(task_id, image_timings=image_timings)
+    logger.info(f"图像阶段耗时，任务ID: {task_id}, {image_timings}")
+    for i, (scene, image_path) in enumerate(zip(scenes, image_paths)):
+        manifest.update_scene(i, text=scene, text_hash=text_hash(scene), prompt=prompts[i],
+                              seed=image_infos.get(i, {}).get('seed'), image_path=image_path)
+    
+    # 生成音频
+    logger.info(f"生成音频，任务ID: {task_id}")
+    with scheduler.stage('tts'):
+        audio_paths = generate_audio_for_scenes(scenes, task_output_folder, voice_name=voice, manifest=manifest,
+                                                on_progress=on_progress('audio', 60, 20), cancel_token=cancel_token)
+    
+    # 创建视频
+    logger.info(f"创建视频，任务ID: {task_id}")
+    with scheduler.stage('encode'):
+        return create_video(
+            image_paths,
+            audio_paths,
+            os.path.join(task_output_folder, 'output.mp4'),
+            use_transitions=use_transitions,
+            add_background_music=add_background_music,
+            durations=manifest.durations(),
+            cancel_token=cancel_token
+        )
+
+# 流水线模式：每个场景的图像、音频和片段编码并行推进，最后只拼接片段
+def run_streaming_task(task_id, scenes, style, voice, use_transitions, add_background_music, deterministic,
+                       cancel_token=None, quality=None, manifest=None, reuse=None):
+    task_output_folder = os.path.join(config.OUTPUT_FOLDER, task_id)
+    # 图像、音频回调来自不同线程，计数需要加锁
+    progress_lock = threading.Lock()
+    completed = {'image': 0, 'audio': 0, 'segment': 0}
+    
+    def on_progress(stage_name, scene_index, total):
+        with progress_lock:
+            completed[stage_name] += 1
+            done = sum(completed.values())
+        # 10%~95% 按三个阶段的完成数量线性推进，剩余部分留给最终拼接
+        total = total or len(scenes)
+        publish_scene_event(task_id, stage_name, scene_index, total)
+        advance_progress(task_id, 10 + int(85 * done / (3 * total)))
+    
+    def on_step(scene_index, step, total_steps):
+        publish_step_event(task_id, [scene_index], step, total_steps)
+        with progress_lock:
+            done = sum(completed.values()) + step / total_steps
+        advance_progress(task_id, 10 + int(85 * done / (3 * len(scenes))))
+    
+    logger.info(f"流水线生成场景，任务ID: {task_id}")
+    result = run_scene_pipeline(
+        scenes,
+        task_output_folder,
+        style=style,
+        voice_name=voice,
+        add_background_music=add_background_music,
+        use_transitions=use_transitions,
+        deterministic=deterministic,
+        manifest=manifest,
+        stage=scheduler.stage,
+        on_progress=on_progress,
+        on_step=on_step,
+        cancel_token=cancel_token,
+        quality=quality,
+        reuse=reuse
+    )
+    task_store.update(task_id, image_timings=result['image_timings'])
+    logger.info(f"图像阶段耗时，任务ID: {task_id}, {result['image_timings']}")
+    return result['video_path']
+
+# 上传文件的任务：逐章读取文件，每章的场景边解析边送入流水线，每章完成后即可播放，最后拼接整部视频
+def process_upload_task(task_id, upload_path, style, voice, use_transitions=True, add_background_music=False,
+                        deterministic=False, quality=None):
+    cancel_token = create_cancel_token(task_id)
+    cancel_tokens[task_id] = cancel_token
+    task_output_folder = os.path.join(config.OUTPUT_FOLDER, task_id)
+    # 所有章节追加到同一个播放列表，整部小说可以从第一个场景开始连续播放
+    playlist = HLSPlaylist(os.path.join(task_output_folder, 'hls')) if config.HLS_ENABLED else None
+    try:
+        cancel_token.raise_if_cancelled()
+        update_task(task_id, status='processing', run_start_time=time.time())
+        
+        # 按已处理的字节数推进进度（5%~95%），总场景数在读完文件之前未知
+        total_bytes = max(os.path.getsize(upload_path), 1)
+        done_bytes = 0
+        chapters = []
         
+        with open_text_file(upload_path) as f:
+            for index, (title, chapter_text) in enumerate(iter_chapters(read_lines(f))):
+                chapter_bytes = len(chapter_text.encode(f.encoding, errors='replace'))
+                start = 5 + 90 * done_bytes / total_bytes
+                span = 90 * chapter_bytes / total_bytes
+                progress_lock = threading.Lock()
+                completed = {'count': 0}
+                
+                def on_progress(stage_name, scene_index, total):
+                    with progress_lock:
+                        completed['count'] += 1
+                        count = completed['count']
+                    publish_scene_event(task_id, stage_name, scene_index, total)
+                    # 章节的场景总数在解析完之前未知，按已完成的场景数逐步逼近该章的进度区间
+                    expected = 3 * total if total else count + 3
+                    advance_progress(task_id, int(start + span * min(count / expected, 1)))
+                
+                def on_step(scene_index, step, total_steps):
+                    publish_step_event(task_id, [scene_index], step, total_steps)
+                
+                logger.info(f"流水线生成第 {index + 1} 章，任务ID: {task_id}")
+                result = run_scene_pipeline(
+                    iter_scenes([chapter_text]),
+                    os.path.join(task_output_folder, f"chapter_{index:03d}"),
+                    style=style,
+                    voice_name=voice,
+                    use_transitions=use_transitions,
+                    deterministic=deterministic,
+                    stage=scheduler.stage,
+                    on_progress=on_progress,
+                    on_step=on_step,
+                    cancel_token=cancel_token,
+                    quality=quality,
+                    playlist=playlist
+                )
+                if not result['video_path']:
+                    update_task(task_id, status='failed', error=f'第 {index + 1} 章视频生成失败')
+                    return
+                
+                chapters.append({
+                    'title': title,
+                    'video_path': result['video_path'],
+                    'video_url': f'/outputs/{task_id}/chapter_{index:03d}/output.mp4'
+                })
+                done_bytes += chapter_bytes
+                event_hub.publish(task_id, 'chapter', chapter=index, title=title, video_url=chapters[-1]['video_url'])
+                update_task(task_id, chapters=[{'title': c['title'], 'video_url': c['video_url']} for c in chapters],
+                            progress=max(int(5 + 90 * done_bytes / total_bytes), 5))
+        
+        if not chapters:
+            update_task(task_id, status='failed', error='文件中没有可处理的文本')
+            return
+        
+        # 各章节的编码参数相同，直接复制流拼接，背景音乐在整部视频上统一混入
+        cancel_token.raise_if_cancelled()
+        video_path = concatenate_segments(
+            [c['video_path'] for c in chapters],
+            os.path.join(task_output_folder, 'output.mp4'),
+            add_background_music=add_background_music
+        )
+        if not video_path:
+            update_task(task_id, status='failed', error='视频生成失败')
+            return
+        
+        update_task(
+            task_id,
+            status='completed',
+            progress=100,
+            video_url=f'/outputs/{task_id}/output.mp4',
+            completion_time=time.time()
+        )
+        
+    except TaskCancelled:
+        logger.info(f"任务已取消，任务ID: {task_id}")
+        update_task(task_id, status='cancelled')
     except Exception as e:
         logger.error(f"任务处理失败: {str(e)}")
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
+        update_task(task_id, status='failed', error=str(e))
+    finally:
+        if playlist is not None:
+            playlist.finish()
+        cancel_tokens.pop(task_id, None)
+
+# 输出目录中可以对外提供的文件类型：视频、HLS播放列表和分片、场景图像和音频
+# 任务清单（manifest.json）包含原文、提示词和随机种子，不对外提供
+SERVED_OUTPUT_EXTENSIONS = ('.mp4', '.m3u8', '.ts', '.png', '.jpg', '.wav', '.mp3')
+
+# 输出文件路由 - 视频、图像等任务产物
+# 支持Range请求（拖动进度条时只下载需要的部分）、ETag/Last-Modified条件请求；
+# 文件由WSGI服务器的sendfile零拷贝发送，或通过X-Sendfile/X-Accel-Redirect交给反向代理发送
+@app.route('/outputs/<task_id>/<path:filename>', methods=['GET'])
+def serve_output(task_id, filename):
+    # task_id 也来自URL，只接受任务ID格式，并以输出目录为根拼接，不能借 .. 跳出输出目录
+    if not is_task_id(task_id):
+        abort(404)
+    full_path = safe_join(config.OUTPUT_FOLDER, task_id, filename)
+    if full_path is None or not full_path.lower().endswith(SERVED_OUTPUT_EXTENSIONS):
+        abort(404)
+    if not os.path.isfile(full_path):
+        abort(404)
+    relative_path = os.path.relpath(full_path, config.OUTPUT_FOLDER).replace(os.sep, '/')
+    
+    storage_manager.touch(task_id)
+    
+    if config.X_ACCEL_REDIRECT_PREFIX:
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{config.X_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}"
+        return response
+    
+    return send_from_directory(config.OUTPUT_FOLDER, relative_path, conditional=True)
+
+# 检查是否是合法的任务ID（uuid4字符串）
+def is_task_id(value):
+    try:
+        return str(uuid.UUID(value)) == value
+    except (ValueError, TypeError):
+        return False
 
 # API路由 - 获取任务状态
 @app.route('/api/status/<task_id>', methods=['GET'])
 def get_task_status(task_id):
-    if task_id not in tasks:
+    task = task_store.get(task_id)
+    if task is None:
         return jsonify({'error': '任务不存在'}), 404
     
-    task = tasks[task_id]
-    response = {
-        'status': task['status'],
-        'progress': task['progress']
-    }
+    storage_manager.touch(task_id)
+    return jsonify(build_task_status(task_id, task))
+
+# 构建任务状态响应
+def build_task_status(task_id, task):
+    response = task_status(task, scheduler.average_task_seconds())
     
-    if task['status'] == 'completed':
-        response['video_url'] = task['video_url']
-    elif task['status'] == 'failed':
-        response['error'] = task.get('error', '未知错误')
+    if task['status'] == 'queued':
+        # 排队中：返回排队位置和预计完成时间
+        queue_position = scheduler.queue_position(task_id)
+        if queue_position is not None:
+            response['queue_position'] = queue_position
+            response['eta'] = int(scheduler.estimate_completion(queue_position))
     
-    return jsonify(response)
+    return response
+
+# API路由 - 任务事件流（Server-Sent Events），进度更新时由服务端推送，替代客户端轮询
+@app.route('/api/events/<task_id>', methods=['GET'])
+def task_events(task_id):
+    # 先记录当前事件序号再读取状态，读取之后发布的事件不会遗漏
+    since = event_hub.last_seq(task_id)
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    def format_event(event_type, data):
+        return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    def stream(task, since):
+        # 先发送当前状态，之后阻塞等待新事件
+        status = build_task_status(task_id, task)
+        yield format_event('status', status)
+        while status.get('status') not in FINISHED_STATUSES:
+            events = event_hub.wait(task_id, since, timeout=config.SSE_HEARTBEAT_SECONDS)
+            for event in events:
+                since = event['seq']
+                if event['type'] == 'status':
+                    status = event
+                yield format_event(event['type'], event)
+            if events:
+                continue
+            
+            # 一段时间没有事件：其他进程（如Celery worker）的更新可能未经过本进程，重新读取一次任务状态
+            task = task_store.get(task_id)
+            if task is None:
+                return
+            latest = build_task_status(task_id, task)
+            if latest['status'] != status.get('status') or latest['progress'] != status.get('progress'):
+                status = latest
+                yield format_event('status', status)
+            else:
+                yield ': heartbeat\n\n'
+    
+    return Response(
+        stream_with_context(stream(task, since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# API路由 - 长轮询，不支持SSE的客户端使用：有新事件时立即返回，否则等待到超时
+@app.route('/api/events/<task_id>/poll', methods=['GET'])
+def poll_task_events(task_id):
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    since = request.args.get('since', 0, type=int)
+    events = []
+    if task['status'] not in FINISHED_STATUSES:
+        events = event_hub.wait(task_id, since, timeout=config.LONG_POLL_TIMEOUT)
+        task = task_store.get(task_id) or task
+    
+    return jsonify({
+        'events': events,
+        'since': events[-1]['seq'] if events else since,
+        'task': build_task_status(task_id, task)
+    })
+
+# API路由 - 取消任务
+@app.route('/api/tasks/<task_id>', methods=['DELETE'])
+def cancel_task(task_id):
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    if task['status'] in FINISHED_STATUSES:
+        return jsonify({'error': '任务已结束，无法取消', 'status': task['status']}), 409
+    
+    # 相同的请求关联到同一个任务时，只有最后一个等待的客户端取消才真正取消任务
+    remaining = task_store.increment(task_id, 'attachers', -1)
+    if remaining is not None and remaining > 0:
+        return jsonify({'task_id': task_id, 'status': task['status'], 'attachers': remaining})
+    
+    # 还在本进程的等待队列中：直接移出队列
+    if scheduler.cancel(task_id):
+        update_task(task_id, status='cancelled', cancel_requested=True)
+        return jsonify({'task_id': task_id, 'status': 'cancelled'})
+    
+    # 正在执行（可能在其他进程或Celery worker中）：设置取消标记，执行代码在下一个检查点停止并释放占用的阶段名额
+    update_task(task_id, cancel_requested=True)
+    cancel_token = cancel_tokens.get(task_id)
+    if cancel_token is not None:
+        cancel_token.cancel()
+    return jsonify({'task_id': task_id, 'status': 'cancelling'}), 202
+
+# API路由 - 修改任务：提交修改后的文本或参数，与原任务的清单比较，只重新生成有变化的场景和阶段，然后重新拼接
+# 结果作为新任务返回，原任务的视频保持不变
+@app.route('/api/tasks/<task_id>/revise', methods=['POST'])
+def revise_task(task_id):
+    try:
+        task = task_store.get(task_id)
+        if task is None:
+            return jsonify({'error': '任务不存在'}), 404
+        
+        if task['status'] not in FINISHED_STATUSES:
+            return jsonify({'error': '任务尚未结束，无法修改', 'status': task['status']}), 409
+        
+        # 复用原任务的文件依赖本机的输出目录，并按场景流式编码
+        if config.TASK_EXECUTION_MODE == 'celery':
+            return jsonify({'error': '分布式模式下不支持修改任务'}), 400
+        
+        if task.get('upload_path'):
+            return jsonify({'error': '上传文件的任务不支持修改'}), 400
+        
+        manifest = TaskManifest.load(os.path.join(config.OUTPUT_FOLDER, task_id))
+        previous = manifest.options()
+        if not previous.get('text'):
+            return jsonify({'error': '任务清单中没有原文，无法修改'}), 409
+        
+        # 未提交的参数沿用原任务的参数；场景片段只在流水线模式下逐个编码，修改任务总是使用流水线模式
+        data = dict(previous, **(request.json or {}))
+        data['pipeline_mode'] = 'streaming'
+        text = data.get('text', '')
+        if not text:
+            return jsonify({'error': '请提供文本内容'}), 400
+        
+        if len(text) > config.MAX_TEXT_LENGTH:
+            return jsonify({'error': f'文本长度超过限制（{config.MAX_TEXT_LENGTH}字）'}), 400
+        
+        options, error = parse_generation_options(data)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # 原任务的文件在新任务中被复用，刷新其访问时间，避免在修改期间被回收
+        storage_manager.touch(task_id)
+        
+        revision_id = str(uuid.uuid4())
+        task_output_folder = os.path.join(config.OUTPUT_FOLDER, revision_id)
+        os.makedirs(task_output_folder, exist_ok=True)
+        
+        task_store.create(revision_id, {
+            'status': 'queued',
+            'progress': 0,
+            'start_time': time.time(),
+            'output_folder': task_output_folder,
+            'text': text[:100] + '...' if len(text) > 100 else text,
+            'style': options['style'],
+            'quality': options['quality'],
+            'revised_from': task_id,
+            'playlist_url': create_task_playlist(revision_id, options['pipeline_mode'])
+        })
+        
+        return enqueue_task(
+            revision_id, process_task, text, options['style'], options['voice'], options['use_transitions'],
+            options['add_background_music'], options['pipeline_mode'], options['deterministic'], options['quality'],
+            task_id
+        )
+        
+    except Exception as e:
+        logger.error(f"修改任务失败: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
 # API路由 - 获取历史任务
 @app.route('/api/history', methods=['GET'])
 def get_history():
     # 获取最近的10个任务
     recent_tasks = []
-    for task_id, task in sorted(tasks.items(), key=lambda x: x[1].get('start_time', 0), reverse=True)[:10]:
+    for task_id, task in task_store.recent(10):
         recent_tasks.append({
             'task_id': task_id,
             'text': task.get('text', ''),
@@ -199,38 +899,21 @@ def get_voices():
     voices = get_available_voices()
     return jsonify(voices)
 
-# 清理旧任务
-def cleanup_tasks():
-    # 随机触发清理，避免每次请求都检查
-    if random.random() < 0.01:  # 1%的概率触发清理
-        current_time = time.time()
-        to_remove = []
-        
-        for task_id, task in tasks.items():
-            # 清理超过24小时的任务
-            if current_time - task.get('start_time', current_time) > 86400:  # 24小时 = 86400秒
-                to_remove.append(task_id)
-                # 删除任务输出目录
-                task_output_folder = task.get('output_folder')
-                if task_output_folder and os.path.exists(task_output_folder):
-                    try:
-                        shutil.rmtree(task_output_folder)
-                    except Exception as e:
-                        logger.error(f"删除任务目录失败: {str(e)}")
-        
-        # 从任务字典中移除
-        for task_id in to_remove:
-            tasks.pop(task_id, None)
-
-# 生成提示词函数
-def generate_prompts(segments, style):
-    prompts = []
-    for segment in segments:
-        # 根据文本内容生成提示词
-        # 这里可以接入更复杂的提示词生成逻辑，如使用OpenAI API
-        prompt = segment
-        prompts.append(prompt)
-    return prompts
+# API路由 - 运行指标：常驻模型的内存占用、加载耗时和命中率，各缓存的命中情况，以及输出目录的回收情况
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        'models': model_manager.stats(),
+        'image_cache': image_cache.stats(),
+        'embedding_cache': embedding_cache.stats(),
+        'audio_cache': audio_cache.stats(),
+        'storage': storage_manager.stats(),
+        'single_flight': {
+            'requests': request_registry.stats(),
+            'images': image_flight.stats(),
+            'speech': speech_flight.stats()
+        }
+    })
 
 if __name__ == '__main__':
     app.run(debug=config.DEBUG, host=config.HOST, port=config.PORT)
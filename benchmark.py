@@ -0,0 +1,97 @@
+"""
+图像生成后端基准测试：比较各后端的模型加载耗时、单张图像延迟和峰值内存（RSS）
+
+每个后端在独立的子进程中运行，峰值内存互不影响；导出后端第一次运行时包含导出耗时：
+    python benchmark.py --backends torch onnx openvino --runs 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+PROMPT = "a girl standing on a hill at sunset, comic style"
+
+def get_peak_rss_mb():
+    """
+    获取当前进程的峰值内存（MB），Linux上ru_maxrss单位为KB，macOS上为字节
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_backend(args):
+    """
+    子进程：在指定后端上加载模型并多次生成同一张图像，输出一行JSON结果
+    """
+    # 后端和缓存开关在导入时读取，必须在导入image_generation之前设置
+    os.environ['IMAGE_BACKEND'] = args.child
+    os.environ['IMAGE_CACHE_ENABLED'] = 'False'
+    os.environ['PRELOAD_MODELS'] = ''
+    from utils import image_generation
+
+    start = time.time()
+    image_generation.get_pipeline(args.model, None)
+    load_seconds = time.time() - start
+
+    def generate():
+        start = time.time()
+        image_generation.generate_image(PROMPT, width=args.width, height=args.height, model_id=args.model,
+                                        seed=args.seed, quality=args.quality)
+        return time.time() - start
+
+    # 第一次推理包含预热（内存分配、图编译），单独记录
+    warmup_seconds = generate()
+    latencies = [generate() for _ in range(args.runs)]
+    print(json.dumps({
+        'backend': image_generation.image_backend,
+        'load_seconds': round(load_seconds, 2),
+        'warmup_seconds': round(warmup_seconds, 2),
+        'mean_seconds': round(sum(latencies) / len(latencies), 2),
+        'min_seconds': round(min(latencies), 2),
+        'peak_rss_mb': round(get_peak_rss_mb(), 1)
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description='图像生成后端基准测试')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'openvino'], help='要比较的后端')
+    parser.add_argument('--model', default=None, help='模型ID，默认使用配置中的DEFAULT_MODEL')
+    parser.add_argument('--width', type=int, default=512)
+    parser.add_argument('--height', type=int, default=512)
+    parser.add_argument('--quality', default='draft', help='质量档位，决定推理步数')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--runs', type=int, default=3, help='计时的生成次数（不含预热）')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_backend(args)
+        return
+
+    results = []
+    for backend in args.backends:
+        print(f"测试后端 {backend} ...")
+        command = [sys.executable, os.path.abspath(__file__), '--child', backend,
+                   '--width', str(args.width), '--height', str(args.height), '--quality', args.quality,
+                   '--seed', str(args.seed), '--runs', str(args.runs)]
+        if args.model:
+            command += ['--model', args.model]
+        process = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = process.stdout.strip().splitlines()
+        if process.returncode != 0 or not lines:
+            print(f"后端 {backend} 测试失败:\n{process.stderr[-2000:]}")
+            continue
+        result = json.loads(lines[-1])
+        if result['backend'] != backend:
+            print(f"后端 {backend} 不可用，实际使用 {result['backend']}，跳过")
+            continue
+        results.append(result)
+
+    print(f"\n{'后端':<10}{'加载(s)':>10}{'预热(s)':>10}{'平均(s)':>10}{'最快(s)':>10}{'峰值RSS(MB)':>14}")
+    for r in results:
+        print(f"{r['backend']:<10}{r['load_seconds']:>10}{r['warmup_seconds']:>10}{r['mean_seconds']:>10}"
+              f"{r['min_seconds']:>10}{r['peak_rss_mb']:>14}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Celery分布式工作进程入口
+
+文本处理 → 图像生成 → 语音合成 → 视频编码 拆分为独立的Celery任务，分别投递到不同队列：
+    image   图像生成（GPU/CPU密集），每台机器通常只运行一个并发
+    tts     文本处理和语音合成（网络IO密集），可以较高并发
+    encode  视频编码（CPU密集）
+
+启动方式（各类worker可以部署在不同机器上，需共享 outputs 目录和任务存储）：
+    celery -A celery_app worker -Q image --concurrency 1
+    celery -A celery_app worker -Q tts --concurrency 8
+    celery -A celery_app worker -Q encode --concurrency 2
+"""
+import os
+import time
+import logging
+from celery import Celery, chord
+import config
+from utils.text_processing import split_text_into_scenes, generate_scene_descriptions, generate_prompts, generate_negative_prompts
+from utils.image_generation import get_image_size_for_style, generate_scene_image, seed_from_text
+from utils.audio_generation import synthesize_speech, get_audio_extension
+from utils.video_creation import create_video
+from utils.task_manifest import TaskManifest, text_hash
+from utils.task_store import create_task_store, task_status
+from utils.event_hub import create_event_hub
+from utils.cancellation import CancellationToken, TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+def check_result_backend(url, eager=False):
+    """
+    检查结果后端是否支持chord：编码任务由chord在所有场景任务完成后触发，
+    不支持chord的后端上回调永远不会执行，任务会一直停在处理中
+
+    Args:
+        url (str): 结果后端地址
+        eager (bool): 是否在当前进程中直接执行任务
+
+    Raises:
+        RuntimeError: 结果后端未配置或不支持chord
+    """
+    if not url or url.startswith(('rpc://', 'disabled://')):
+        raise RuntimeError(f"Celery结果后端 {url or '(未配置)'} 不支持chord，"
+                           "请将 CELERY_RESULT_BACKEND 设置为 redis://... 或 db+sqlite:///...")
+    # 进程内缓存只在同一个进程中可见，worker之间无法汇总chord的结果
+    if url.startswith('cache+memory://') and not eager:
+        raise RuntimeError("CELERY_RESULT_BACKEND=cache+memory:// 只能与 CELERY_TASK_ALWAYS_EAGER=True 一起使用")
+
+check_result_backend(config.CELERY_RESULT_BACKEND, config.CELERY_TASK_ALWAYS_EAGER)
+
+# SQLite结果后端不会自动创建数据库所在的目录
+if config.CELERY_RESULT_BACKEND.startswith('db+sqlite:///'):
+    os.makedirs(os.path.dirname(config.CELERY_RESULT_BACKEND[len('db+sqlite:///'):]) or '.', exist_ok=True)
+
+celery = Celery('novel_to_comic_video', broker=config.CELERY_BROKER_URL, backend=config.CELERY_RESULT_BACKEND)
+celery.conf.update(
+    task_routes={
+        'comic.prepare': {'queue': 'tts'},
+        'comic.image': {'queue': 'image'},
+        'comic.tts': {'queue': 'tts'},
+        'comic.encode': {'queue': 'encode'}
+    },
+    # 图像任务耗时长，每个worker一次只领取一个任务，完成后再确认，worker异常退出时任务会重新投递
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    task_always_eager=config.CELERY_TASK_ALWAYS_EAGER,
+    task_serializer='json',
+    result_serializer='json',
+    accept_content=['json']
+)
+
+# 文件系统代理：不需要Redis，用于本机测试
+if config.CELERY_BROKER_URL.startswith('filesystem://'):
+    for folder in ('in', 'processed'):
+        os.makedirs(os.path.join(config.CELERY_BROKER_FOLDER, folder), exist_ok=True)
+    celery.conf.broker_transport_options = {
+        'data_folder_in': os.path.join(config.CELERY_BROKER_FOLDER, 'in'),
+        'data_folder_out': os.path.join(config.CELERY_BROKER_FOLDER, 'in'),
+        'processed_folder': os.path.join(config.CELERY_BROKER_FOLDER, 'processed'),
+        'store_processed': False
+    }
+
+task_store = create_task_store(config.TASK_STORE_BACKEND, db_path=config.TASK_DB_PATH, redis_url=config.REDIS_URL)
+
+# 使用Redis事件中心时，worker发布的事件会转发到Web进程，否则Web进程定期从任务存储读取进度
+event_hub = create_event_hub(config.EVENT_HUB_BACKEND, redis_url=config.REDIS_URL)
+
+def submit_task(task_id, text, style, voice, use_transitions=True, add_background_music=False, deterministic=False,
+                quality=None):
+    """
+    将任务投递到Celery队列
+
+    Args:
+        task_id (str): 任务ID（任务记录需已在任务存储中创建）
+        text (str): 小说文本
+        style (str): 漫画风格
+        voice (str): 语音名称
+        use_transitions (bool): 是否使用过渡效果
+        add_background_music (bool): 是否添加背景音乐
+        deterministic (bool): 是否使用由文本决定的随机种子
+        quality (str): 图像质量档位
+    """
+    prepare_task.delay(task_id, text, style, voice, use_transitions, add_background_music, deterministic, quality)
+
+def _update_task(task_id, **fields):
+    task_store.update(task_id, **fields)
+    # 发布从任务存储读回的完整状态，与Web进程的状态事件格式一致（完成时包含 video_url 等）
+    task = task_store.get(task_id)
+    if task is not None:
+        event_hub.publish(task_id, 'status', **task_status(task))
+
+def _mark_failed(task_id, error):
+    if isinstance(error, TaskCancelled):
+        logger.info(f"任务已取消，任务ID: {task_id}")
+        _update_task(task_id, status='cancelled')
+        return
+    logger.error(f"任务处理失败: {error}")
+    _update_task(task_id, status='failed', error=str(error))
+
+def _cancel_token(task_id):
+    # worker与Web进程不在同一进程，通过任务存储中的取消标记感知取消请求
+    def is_cancelled():
+        task = task_store.get(task_id)
+        return task is None or task.get('cancel_requested', False)
+    return CancellationToken(is_cancelled, check_interval=config.CANCEL_CHECK_INTERVAL)
+
+def _scene_done(task_id, stage_name, index):
+    # 每完成一个场景的图像或音频，按完成数量推进进度（10%~90%）
+    done = task_store.increment(task_id, 'scenes_done')
+    task = task_store.get(task_id)
+    if done is None or task is None:
+        return
+    total = max(task.get('scene_count', 1), 1)
+    event_hub.publish(task_id, 'scene', stage=stage_name, scene=index, total=total)
+    _update_task(task_id, status=task['status'], progress=10 + int(80 * done / (2 * total)))
+
+@celery.task(name='comic.prepare')
+def prepare_task(task_id, text, style, voice, use_transitions, add_background_music, deterministic, quality=None):
+    """
+    切分场景、生成提示词，然后为每个场景投递图像和语音任务，全部完成后投递编码任务
+    """
+    try:
+        _cancel_token(task_id).raise_if_cancelled()
+        _update_task(task_id, status='processing', progress=0, run_start_time=time.time())
+        scenes = split_text_into_scenes(text)
+        descriptions = generate_scene_descriptions(scenes)
+        prompts = generate_prompts(descriptions, style)
+        negative_prompt = generate_negative_prompts(style)
+        task_store.update(task_id, scene_count=len(scenes), scenes_done=0)
+        _update_task(task_id, status='processing', progress=10)
+
+        # 每个场景的图像和语音是独立的任务，可以分散到多台机器的worker上并行执行
+        header = []
+        for i, scene in enumerate(scenes):
+            seed = seed_from_text(scene) if deterministic else None
+            header.append(image_task.s(task_id, i, prompts[i], negative_prompt, style, seed, quality))
+            header.append(tts_task.s(task_id, i, scene, voice))
+        callback = encode_task.s(task_id, scenes, use_transitions, add_background_music)
+        chord(header)(callback)
+    except Exception as e:
+        _mark_failed(task_id, e)
+        raise
+
+@celery.task(name='comic.image')
+def image_task(task_id, index, prompt, negative_prompt, style, seed=None, quality=None):
+    """
+    生成单个场景的图像
+
+    Returns:
+        dict: 场景序号、图像路径、提示词和实际使用的随机种子
+    """
+    try:
+        width, height = get_image_size_for_style(style, quality)
+        image_path = os.path.join(config.OUTPUT_FOLDER, task_id, f"scene_{index:03d}.png")
+
+        def on_step(step, total_steps):
+            event_hub.publish(task_id, 'step', scenes=[index], step=step, total=total_steps)
+
+        timings = {}
+        info = {}
+        generate_scene_image(prompt, negative_prompt, image_path, width, height, seed=seed,
+                             on_step=on_step, cancel_token=_cancel_token(task_id), quality=quality, timings=timings,
+                             info=info)
+        logger.info(f"场景图像耗时，任务ID: {task_id}, 场景: {index}, {timings}")
+        _scene_done(task_id, 'image', index)
+        return {'index': index, 'image_path': image_path, 'prompt': prompt, 'seed': info.get('seed')}
+    except Exception as e:
+        _mark_failed(task_id, e)
+        raise
+
+@celery.task(name='comic.tts')
+def tts_task(task_id, index, text, voice):
+    """
+    合成单个场景的语音
+
+    Returns:
+        dict: 场景序号、音频路径（失败时为None）和时长
+    """
+    try:
+        _cancel_token(task_id).raise_if_cancelled()
+        audio_path = os.path.join(config.OUTPUT_FOLDER, task_id, f"scene_{index:03d}{get_audio_extension()}")
+        metadata = synthesize_speech(text=text, output_path=audio_path, voice_name=voice)
+        _scene_done(task_id, 'audio', index)
+        if metadata is None:
+            return {'index': index, 'audio_path': None, 'duration': None}
+        return {'index': index, 'audio_path': audio_path, 'duration': metadata.get('duration')}
+    except Exception as e:
+        _mark_failed(task_id, e)
+        raise
+
+@celery.task(name='comic.encode')
+def encode_task(results, task_id, scenes, use_transitions, add_background_music):
+    """
+    汇总各场景的图像和语音，写入任务清单并合成视频
+
+    Args:
+        results (list): 图像任务和语音任务的返回值
+    """
+    try:
+        task_output_folder = os.path.join(config.OUTPUT_FOLDER, task_id)
+
+        # 清单只在这里写入一次，避免多个worker进程并发写同一个文件
+        manifest = TaskManifest(task_output_folder)
+        for i, scene in enumerate(scenes):
+            manifest.update_scene(i, text=scene, text_hash=text_hash(scene))
+        for result in results:
+            fields = {k: v for k, v in result.items() if k != 'index'}
+            manifest.update_scene(result['index'], **fields)
+
+        records = manifest.scenes()
+        video_path = create_video(
+            [record.get('image_path') for record in records],
+            [record.get('audio_path') for record in records],
+            os.path.join(task_output_folder, 'output.mp4'),
+            use_transitions=use_transitions,
+            add_background_music=add_background_music,
+            durations=manifest.durations(),
+            cancel_token=_cancel_token(task_id)
+        )
+        if not video_path:
+            _update_task(task_id, status='failed', error='视频生成失败')
+            return None
+
+        _update_task(
+            task_id,
+            status='completed',
+            progress=100,
+            video_url=f'/outputs/{task_id}/output.mp4',
+            completion_time=time.time()
+        )
+        return video_path
+    except Exception as e:
+        _mark_failed(task_id, e)
+        raise
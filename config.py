@@ -16,6 +16,7 @@ UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 OUTPUT_FOLDER = os.path.join(BASE_DIR, 'outputs')
 STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
 TEMPLATE_FOLDER = os.path.join(BASE_DIR, 'templates')
+CACHE_FOLDER = os.getenv('CACHE_FOLDER', os.path.join(BASE_DIR, 'cache'))
 
 # API密钥
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -29,15 +30,76 @@ TENCENT_SECRET_KEY = os.getenv('TENCENT_SECRET_KEY', '')
 IMAGE_WIDTH = int(os.getenv('IMAGE_WIDTH', 768))
 IMAGE_HEIGHT = int(os.getenv('IMAGE_HEIGHT', 512))
 DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'runwayml/stable-diffusion-v1-5')
+IMAGE_BATCH_SIZE = int(os.getenv('IMAGE_BATCH_SIZE', 0))  # 批量推理大小，0表示根据可用内存自动选择
+IMAGE_MAX_BATCH_SIZE = int(os.getenv('IMAGE_MAX_BATCH_SIZE', 4))  # 自动选择时的最大批量
+IMAGE_BATCH_MB_PER_MEGAPIXEL = int(os.getenv('IMAGE_BATCH_MB_PER_MEGAPIXEL', 3000))  # 每百万像素图像的推理内存估算（MB）
+DETERMINISTIC_SEEDS = os.getenv('DETERMINISTIC_SEEDS', 'False').lower() in ('true', '1', 't')  # 根据场景文本计算随机种子
+IMAGE_CACHE_ENABLED = os.getenv('IMAGE_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+IMAGE_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'images')
+IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', 2048))  # 图像缓存容量上限，超出后按LRU淘汰
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 256))  # 文本编码结果的内存缓存条目数，0表示不缓存
+
+# 质量档位：推理步数、引导强度、分辨率缩放和采样器
+# draft 用于高负载时快速出图，final 用于追求画质的场景
+QUALITY_TIERS = {
+    'draft': {'label': '草稿', 'steps': 15, 'guidance_scale': 6.0, 'scale': 0.75, 'scheduler': 'dpm'},
+    'standard': {'label': '标准', 'steps': 30, 'guidance_scale': 7.5, 'scale': 1.0, 'scheduler': 'dpm'},
+    'final': {'label': '精细', 'steps': 50, 'guidance_scale': 7.5, 'scale': 1.0, 'scheduler': 'euler_a'}
+}
+DEFAULT_QUALITY = os.getenv('DEFAULT_QUALITY', 'standard')  # 默认档位，auto 表示根据排队情况自动选择
+LATENCY_SLO_SECONDS = int(os.getenv('LATENCY_SLO_SECONDS', 300))  # 自动档位的目标完成时间（排队+生成）
+
+# 低分辨率扩散：先以较低分辨率扩散，再在独立的放大阶段放大到目标尺寸，用少量锐度换取更高的吞吐量
+LOW_RES_DIFFUSION = os.getenv('LOW_RES_DIFFUSION', 'False').lower() in ('true', '1', 't')
+LOW_RES_SCALE = float(os.getenv('LOW_RES_SCALE', 0.5))  # 扩散分辨率相对目标尺寸的比例
+UPSCALER = os.getenv('UPSCALER', 'lanczos')  # 放大方法：lanczos（Lanczos插值+边缘锐化）或 onnx（超分辨率模型）
+UPSCALE_ONNX_MODEL = os.getenv('UPSCALE_ONNX_MODEL', os.path.join(BASE_DIR, 'models', 'upscaler.onnx'))
+UPSCALE_SHARPEN_PERCENT = int(os.getenv('UPSCALE_SHARPEN_PERCENT', 80))  # Lanczos放大后的锐化强度，0表示不锐化
+
+# 模型管理：启动时预加载的模型，常驻模型按实测内存占用限制，超出后按LRU卸载
+PRELOAD_MODELS = [m.strip() for m in os.getenv('PRELOAD_MODELS', DEFAULT_MODEL).split(',') if m.strip()]
+MAX_LOADED_MODELS = int(os.getenv('MAX_LOADED_MODELS', 2))  # 同时常驻的模型数上限，0表示不限制
+MODEL_MEMORY_LIMIT_MB = int(os.getenv('MODEL_MEMORY_LIMIT_MB', 0))  # 常驻模型的总内存上限（MB），0表示不限制
+
+# CPU推理优化
+TORCH_NUM_THREADS = int(os.getenv('TORCH_NUM_THREADS', 0))  # 推理线程数，0表示按CPU核数除以图像阶段并发数自动设置
+CPU_CHANNELS_LAST = os.getenv('CPU_CHANNELS_LAST', 'True').lower() in ('true', '1', 't')  # UNet/VAE使用channels_last内存布局
+CPU_BFLOAT16 = os.getenv('CPU_BFLOAT16', 'False').lower() in ('true', '1', 't')  # CPU支持时以bfloat16推理
+TORCH_COMPILE = os.getenv('TORCH_COMPILE', 'False').lower() in ('true', '1', 't')  # 使用torch.compile编译UNet（首次推理较慢）
+
+# 图像生成后端：torch、onnx（ONNX Runtime）、openvino 或 auto（优先OpenVINO，其次ONNX Runtime）
+# 导出后端首次使用某个模型时导出计算图并缓存到磁盘，需要安装 optimum[onnxruntime] 或 optimum[openvino]
+IMAGE_BACKEND = os.getenv('IMAGE_BACKEND', 'torch')
+ONNX_EXPORT_FOLDER = os.getenv('ONNX_EXPORT_FOLDER', os.path.join(CACHE_FOLDER, 'exported'))
 
 # 视频生成参数
 FPS = int(os.getenv('FPS', 24))
 VIDEO_CODEC = os.getenv('VIDEO_CODEC', 'libx264')
 AUDIO_CODEC = os.getenv('AUDIO_CODEC', 'aac')
+VIDEO_ENCODER = os.getenv('VIDEO_ENCODER', 'ffmpeg')  # ffmpeg（静态图像直接编码，速度快）或 moviepy（逐帧合成）
+TRANSITION_DURATION = float(os.getenv('TRANSITION_DURATION', 0.5))  # 场景之间的过渡时长（秒）
+HLS_ENABLED = os.getenv('HLS_ENABLED', 'True').lower() in ('true', '1', 't')  # 流水线模式下边生成边输出HLS播放列表
+HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 6))  # HLS分片时长，也是片段编码的关键帧间隔
 
 # 默认语音
 DEFAULT_VOICE = os.getenv('DEFAULT_VOICE', 'zh-CN-XiaoxiaoNeural')
 
+# 语音合成
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'azure')  # azure、local（本地CPU合成）或 stub（写入静音音频，用于离线测试）
+TTS_FALLBACK_BACKEND = os.getenv('TTS_FALLBACK_BACKEND', 'local')  # 配置的后端不可用时使用的后端，留空表示不切换
+LOCAL_TTS_ENGINE = os.getenv('LOCAL_TTS_ENGINE', 'auto')  # 本地引擎：auto、espeak 或 pyttsx3
+TTS_MAX_CONCURRENCY = int(os.getenv('TTS_MAX_CONCURRENCY', 4))  # 并发合成的最大线程数
+TTS_RATE_LIMIT = float(os.getenv('TTS_RATE_LIMIT', 3))  # 每秒最多请求数，0表示不限流
+TTS_RATE_BURST = int(os.getenv('TTS_RATE_BURST', 5))  # 允许的突发请求数
+TTS_MAX_RETRIES = int(os.getenv('TTS_MAX_RETRIES', 3))  # 被限流时的最大重试次数
+TTS_BACKOFF_BASE = float(os.getenv('TTS_BACKOFF_BASE', 1.0))  # 退避基准时间（秒），按指数增长
+TTS_STUB_LATENCY = float(os.getenv('TTS_STUB_LATENCY', 0))  # 桩后端模拟的每次合成延迟（秒）
+
+# 语音缓存
+AUDIO_CACHE_ENABLED = os.getenv('AUDIO_CACHE_ENABLED', 'True').lower() in ('true', '1', 't')
+AUDIO_CACHE_FOLDER = os.path.join(CACHE_FOLDER, 'audio')
+AUDIO_CACHE_MAX_MB = int(os.getenv('AUDIO_CACHE_MAX_MB', 512))  # 语音缓存容量上限，超出后按LRU淘汰
+
 # 漫画风格
 COMIC_STYLES = {
     'default': '默认漫画风格',
@@ -69,6 +131,55 @@ STYLE_NEGATIVE_PROMPTS = {
 MAX_TEXT_LENGTH = int(os.getenv('MAX_TEXT_LENGTH', 5000))
 CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 3600))  # 1小时
 TASK_TIMEOUT = int(os.getenv('TASK_TIMEOUT', 600))  # 10分钟
+UPLOAD_MAX_MB = int(os.getenv('UPLOAD_MAX_MB', 10))  # 上传的小说文本文件大小上限
+SCENE_MAX_CHARS = int(os.getenv('SCENE_MAX_CHARS', 200))  # 流式分段时单个场景的最大字符数
+CHAPTER_MAX_CHARS = int(os.getenv('CHAPTER_MAX_CHARS', 20000))  # 没有章节标题或单章过长时按此长度切分
+
+# 输出目录回收：超过配额时先删除中间产物（场景图像、音频），再按最近访问时间删除整个任务目录
+OUTPUT_QUOTA_MB = int(os.getenv('OUTPUT_QUOTA_MB', 10240))  # 输出目录总占用上限，0表示不限制
+OUTPUT_TTL_HOURS = float(os.getenv('OUTPUT_TTL_HOURS', 24))  # 任务目录在最后一次访问后的保留时间，0表示不过期
+STORAGE_REAP_INTERVAL = int(os.getenv('STORAGE_REAP_INTERVAL', 300))  # 后台回收的间隔（秒）
+
+# 输出文件分发：默认由WSGI服务器的sendfile零拷贝发送；部署在反向代理后时可交给代理发送文件
+USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False').lower() in ('true', '1', 't')  # Apache/lighttpd 的 X-Sendfile
+X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX', '')  # nginx 的 internal location 前缀，如 /protected-outputs
+
+# 任务调度
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', 2))  # 流水线工作线程数
+TASK_QUEUE_SIZE = int(os.getenv('TASK_QUEUE_SIZE', 20))  # 等待队列最大长度，超出返回429
+IMAGE_STAGE_CONCURRENCY = int(os.getenv('IMAGE_STAGE_CONCURRENCY', 1))  # 同时进行图像生成的任务数
+TTS_STAGE_CONCURRENCY = int(os.getenv('TTS_STAGE_CONCURRENCY', 4))  # 同时进行语音合成的任务数
+ENCODE_STAGE_CONCURRENCY = int(os.getenv('ENCODE_STAGE_CONCURRENCY', 2))  # 同时进行视频编码的任务数
+ESTIMATED_TASK_SECONDS = int(os.getenv('ESTIMATED_TASK_SECONDS', 180))  # 无历史数据时的任务预估耗时
+REQUEST_DEDUP_ENABLED = os.getenv('REQUEST_DEDUP_ENABLED', 'True').lower() in ('true', '1', 't')  # 相同的生成请求复用进行中或已完成的任务
+
+# 任务状态存储：sqlite（本机多进程共享）或 redis（多台机器共享）
+TASK_STORE_BACKEND = os.getenv('TASK_STORE_BACKEND', 'sqlite')
+TASK_DB_PATH = os.getenv('TASK_DB_PATH', os.path.join(BASE_DIR, 'data', 'tasks.db'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# 任务事件推送：memory（进程内）或 redis（多进程/多机器之间转发），默认与任务存储一致
+EVENT_HUB_BACKEND = os.getenv('EVENT_HUB_BACKEND', 'redis' if TASK_STORE_BACKEND == 'redis' else 'memory')
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))  # 无事件时发送心跳的间隔
+LONG_POLL_TIMEOUT = int(os.getenv('LONG_POLL_TIMEOUT', 25))  # 长轮询请求的最长等待时间
+
+# 取消任务时，执行代码检查任务存储中取消标记的最小间隔（秒）
+CANCEL_CHECK_INTERVAL = float(os.getenv('CANCEL_CHECK_INTERVAL', 1.0))
+
+# 任务执行方式：thread（Web进程内的工作线程）或 celery（独立的Celery worker，可分布在多台机器上）
+TASK_EXECUTION_MODE = os.getenv('TASK_EXECUTION_MODE', 'thread')
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL)  # 测试时可使用 memory:// 或 filesystem://
+# 结果后端必须支持chord（各场景任务全部完成后触发编码任务）：redis 或 db+（SQLAlchemy数据库）；
+# 本机测试的 filesystem:// 和 memory:// 代理默认使用SQLite数据库，不需要Redis
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', (
+    'db+sqlite:///' + os.path.join(BASE_DIR, 'data', 'celery_results.db')
+    if CELERY_BROKER_URL.startswith(('filesystem://', 'memory://')) else REDIS_URL
+))
+CELERY_BROKER_FOLDER = os.getenv('CELERY_BROKER_FOLDER', os.path.join(BASE_DIR, 'data', 'celery'))  # filesystem:// 代理的消息目录
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() in ('true', '1', 't')  # 在当前进程中直接执行，用于测试
+
+# 流水线模式：streaming（按场景并行推进图像/音频/编码）或 staged（分阶段依次执行）
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'streaming')
 
 # 环境配置类
 class Config:
@@ -19,10 +19,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const submitBtn = document.getElementById('submit-btn');
     const voiceSelect = document.getElementById('voice-select');
     
-    // 任务ID和轮询间隔
+    // 任务ID和事件流
     let taskId = null;
-    let pollInterval = null;
-    const POLL_FREQUENCY = 3000; // 3秒
+    let eventSource = null;
     
     // 初始化字符计数器
     updateCharCounter();
@@ -97,9 +96,9 @@ document.addEventListener('DOMContentLoaded', function() {
             add_background_music: formData.get('add_background_music') === 'on'
         })
         .then(function(response) {
-            // 保存任务ID并开始轮询状态
+            // 保存任务ID并订阅任务事件
             taskId = response.data.task_id;
-            startPolling();
+            subscribeEvents();
         })
         .catch(function(error) {
             // 处理错误
@@ -114,66 +113,47 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     /**
-     * 开始轮询任务状态
+     * 订阅任务事件流，任务状态变化时由服务端推送
      */
-    function startPolling() {
-        // 清除可能存在的轮询
-        if (pollInterval) {
-            clearInterval(pollInterval);
-        }
-        
-        // 设置新的轮询
-        pollInterval = setInterval(function() {
-            checkTaskStatus();
-        }, POLL_FREQUENCY);
+    function subscribeEvents() {
+        stopEvents();
+        if (!taskId) return;
         
-        // 立即检查一次状态
-        checkTaskStatus();
+        eventSource = new EventSource(`/api/events/${taskId}`);
+        eventSource.addEventListener('status', function(e) {
+            handleStatus(JSON.parse(e.data));
+        });
+        // 连接断开时浏览器会自动重连，服务端重连后会先发送当前状态
     }
     
     /**
-     * 检查任务状态
+     * 处理任务状态事件
      */
-    function checkTaskStatus() {
-        if (!taskId) return;
+    function handleStatus(data) {
+        // 更新进度
+        updateProgress(data.progress, data.status);
         
-        axios.get(`/api/status/${taskId}`)
-            .then(function(response) {
-                const data = response.data;
-                
-                // 更新进度
-                updateProgress(data.progress, data.status);
-                
-                // 如果任务完成
-                if (data.state === 'completed') {
-                    stopPolling();
-                    showResult(data.result);
-                    resetSubmitButton();
-                }
-                // 如果任务失败
-                else if (data.state === 'failed') {
-                    stopPolling();
-                    showAlert(`生成失败: ${data.error || '未知错误'}`, 'danger');
-                    resetSubmitButton();
-                }
-            })
-            .catch(function(error) {
-                console.error('状态检查失败:', error);
-                // 如果连续几次检查失败，可以停止轮询
-                // 这里简化处理，直接停止
-                stopPolling();
-                showAlert('无法获取任务状态', 'warning');
-                resetSubmitButton();
-            });
+        // 如果任务完成
+        if (data.status === 'completed') {
+            stopEvents();
+            showResult(data);
+            resetSubmitButton();
+        }
+        // 如果任务失败或被取消
+        else if (data.status === 'failed' || data.status === 'cancelled') {
+            stopEvents();
+            showAlert(`生成失败: ${data.error || '任务已取消'}`, 'danger');
+            resetSubmitButton();
+        }
     }
     
     /**
-     * 停止轮询
+     * 关闭事件流
      */
-    function stopPolling() {
-        if (pollInterval) {
-            clearInterval(pollInterval);
-            pollInterval = null;
+    function stopEvents() {
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
         }
     }
     
@@ -228,8 +208,8 @@ document.addEventListener('DOMContentLoaded', function() {
      * 重置表单
      */
     function resetForm() {
-        // 停止任何正在进行的轮询
-        stopPolling();
+        // 关闭正在订阅的事件流
+        stopEvents();
         
         // 重置表单
         generateForm.reset();
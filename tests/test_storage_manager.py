@@ -0,0 +1,89 @@
+import os
+import time
+from utils.storage_manager import StorageManager
+
+def write_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+def make_pipeline_task(root, task_id):
+    # 流水线任务完成后的输出目录：场景产物、片段、HLS播放列表和分片、最终视频和清单
+    folder = os.path.join(root, task_id)
+    write_file(os.path.join(folder, 'scene_000.png'), 1000)
+    write_file(os.path.join(folder, 'segment_000.mp4'), 1000)
+    write_file(os.path.join(folder, 'hls', 'playlist.m3u8'), 100)
+    write_file(os.path.join(folder, 'hls', 'part_0000_000.ts'), 1000)
+    write_file(os.path.join(folder, 'output.mp4'), 500)
+    write_file(os.path.join(folder, 'manifest.json'), 100)
+    return folder
+
+def test_reap_intermediates_clears_playlist(tmp_path):
+    root = str(tmp_path)
+    folder = make_pipeline_task(root, 'task')
+    tasks = {'task': {'status': 'completed', 'playlist_url': '/outputs/task/hls/playlist.m3u8'}}
+
+    def clear_playlist_url(task_id):
+        tasks[task_id]['playlist_url'] = None
+
+    manager = StorageManager(root, quota_bytes=1000, is_active=lambda task_id: False, on_trim=clear_playlist_url)
+    manager.reap()
+
+    # 只删除中间产物，最终视频和清单保留，播放列表地址随HLS分片一起失效
+    assert os.path.exists(os.path.join(folder, 'output.mp4'))
+    assert os.path.exists(os.path.join(folder, 'manifest.json'))
+    assert not os.path.exists(os.path.join(folder, 'hls', 'playlist.m3u8'))
+    assert not os.path.exists(os.path.join(folder, 'hls', 'part_0000_000.ts'))
+    assert tasks['task']['playlist_url'] is None
+    assert manager.total_bytes() == 600
+
+def test_active_task_keeps_playlist(tmp_path):
+    root = str(tmp_path)
+    folder = make_pipeline_task(root, 'task')
+    trimmed = []
+
+    manager = StorageManager(root, quota_bytes=1000, is_active=lambda task_id: True, on_trim=trimmed.append)
+    manager.reap()
+
+    # 正在执行的任务：播放列表和分片保留
+    assert os.path.exists(os.path.join(folder, 'hls', 'playlist.m3u8'))
+    assert trimmed == []
+
+def test_expired_task_removed(tmp_path):
+    root = str(tmp_path)
+    make_pipeline_task(root, 'task')
+    removed = []
+
+    # 任务目录的修改时间即最近访问时间
+    old = time.time() - 120
+    os.utime(os.path.join(root, 'task'), (old, old))
+
+    manager = StorageManager(root, ttl_seconds=60, is_active=lambda task_id: False, on_remove=removed.append)
+    manager.reap()
+
+    assert removed == ['task']
+    assert not os.path.exists(os.path.join(root, 'task'))
+    assert manager.stats()['expirations'] == 1
+    assert manager.stats()['folders'] == 0
+
+def test_touch_keeps_task(tmp_path):
+    root = str(tmp_path)
+    make_pipeline_task(root, 'task')
+    old = time.time() - 120
+    os.utime(os.path.join(root, 'task'), (old, old))
+
+    # 其他进程的访问只体现在目录的修改时间上
+    StorageManager(root, ttl_seconds=60).touch('task')
+    manager = StorageManager(root, ttl_seconds=60, is_active=lambda task_id: False)
+    manager.reap()
+
+    assert os.path.exists(os.path.join(root, 'task'))
+    assert manager.stats()['expirations'] == 0
+
+def test_single_reaper(tmp_path):
+    root = str(tmp_path)
+    first = StorageManager(root, interval_seconds=3600)
+    second = StorageManager(root, interval_seconds=3600)
+
+    assert first.start() is True
+    assert second.start() is False
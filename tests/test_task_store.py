@@ -0,0 +1,22 @@
+import os
+from utils.task_store import SQLiteTaskStore
+
+def make_store(tmp_path):
+    store = SQLiteTaskStore(os.path.join(str(tmp_path), 'tasks.db'))
+    store.create('task', {'start_time': 1, 'status': 'processing', 'progress': 10})
+    return store
+
+def test_advance_only_moves_forward(tmp_path):
+    store = make_store(tmp_path)
+
+    assert store.advance('task', 'progress', 30) is True
+    assert store.advance('task', 'progress', 20) is False
+    assert store.advance('task', 'progress', 30) is False
+    assert store.get('task')['progress'] == 30
+    assert store.get('task')['status'] == 'processing'
+
+def test_advance_missing_task(tmp_path):
+    store = make_store(tmp_path)
+
+    assert store.advance('missing', 'progress', 50) is False
+    assert store.get('missing') is None
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip('jieba')
+pytest.importorskip('nltk')
+
+from utils.text_processing import CHAPTER_HEADING_PATTERN, iter_chapters
+
+@pytest.mark.parametrize('line', [
+    '第一章 初遇\n',
+    '第12回\n',
+    'Chapter 3\n',
+    'CHAPTER XIV\n',
+    'Chapter One\n',
+    'CHAPTER TWELVE\n',
+    'Chapter Twenty-One: The Return\n',
+    'Chapter One Hundred and Five\n'
+])
+def test_chapter_heading_matches(line):
+    assert CHAPTER_HEADING_PATTERN.match(line)
+
+@pytest.mark.parametrize('line', [
+    'Chapters are where the story begins.\n',
+    'Chapter oneness was never his goal.\n',
+    'She finished chapter one before dinner.\n'
+])
+def test_chapter_heading_ignores_prose(line):
+    assert not CHAPTER_HEADING_PATTERN.match(line)
+
+def test_iter_chapters_english_spelled_headings():
+    lines = [
+        'CHAPTER ONE\n', 'It was a cold night.\n',
+        'CHAPTER TWO\n', 'The sun rose.\n'
+    ]
+    chapters = list(iter_chapters(lines, max_chars=1000))
+    assert chapters == [('CHAPTER ONE', 'It was a cold night.\n'), ('CHAPTER TWO', 'The sun rose.\n')]
@@ -4,7 +4,8 @@
 from utils.text_processing import (
     split_text_into_scenes,
     generate_scene_descriptions,
-    generate_prompts_for_style
+    generate_prompts,
+    generate_negative_prompts
 )
 
 from utils.image_generation import (
@@ -14,9 +15,11 @@ from utils.image_generation import (
 )
 
 from utils.audio_generation import (
-    generate_audio_for_text,
+    generate_speech,
+    synthesize_speech,
     generate_audio_for_scenes,
     get_available_voices,
+    get_voice_duration,
     estimate_audio_duration
 )
 
@@ -29,13 +32,16 @@ from utils.video_creation import (
 __all__ = [
     'split_text_into_scenes',
     'generate_scene_descriptions',
-    'generate_prompts_for_style',
+    'generate_prompts',
+    'generate_negative_prompts',
     'generate_image',
     'generate_images_for_scenes',
     'cleanup_resources',
-    'generate_audio_for_text',
+    'generate_speech',
+    'synthesize_speech',
     'generate_audio_for_scenes',
     'get_available_voices',
+    'get_voice_duration',
     'estimate_audio_duration',
     'create_video',
     'create_video_with_transitions',
@@ -0,0 +1,276 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import DEFAULT_VOICE, TTS_BACKEND, TTS_FALLBACK_BACKEND, TTS_MAX_CONCURRENCY
+from config import AUDIO_CACHE_ENABLED, AUDIO_CACHE_FOLDER, AUDIO_CACHE_MAX_MB
+from utils.disk_cache import DiskCache, make_cache_key
+from utils.cancellation import check_cancelled
+from utils.single_flight import SingleFlight
+from utils.audio_generation.backends import (
+    TTSBackend,
+    AzureTTSBackend,
+    LocalTTSBackend,
+    StubTTSBackend,
+    TTS_BACKENDS,
+    estimate_audio_duration
+)
+from utils.audio_generation.probe import probe_audio_duration
+
+# 语音缓存：以（后端、文本、语音、语速、音调）为键，同时保存音频时长
+audio_cache = DiskCache(AUDIO_CACHE_FOLDER, AUDIO_CACHE_MAX_MB * 1024 * 1024)
+
+# 缓存未命中时的并发去重：不同任务同时合成相同的语音时只调用一次后端
+speech_flight = SingleFlight()
+
+# 后端实例（按名称复用，合成器池和限流器随实例保存）
+_backends = {}
+_backend_lock = threading.Lock()
+
+def get_backend(name=None):
+    """
+    获取语音合成后端
+    
+    配置的后端不可用（如未配置Azure密钥）时，自动切换到 TTS_FALLBACK_BACKEND
+    
+    Args:
+        name (str): 后端名称，默认使用配置中的TTS_BACKEND
+        
+    Returns:
+        TTSBackend: 语音合成后端
+    """
+    name = name or TTS_BACKEND
+    with _backend_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name not in TTS_BACKENDS:
+                raise ValueError(f"不支持的语音合成后端: {name}")
+            backend = TTS_BACKENDS[name]()
+            _backends[name] = backend
+    
+    if not backend.is_available() and TTS_FALLBACK_BACKEND and TTS_FALLBACK_BACKEND != name:
+        fallback = get_backend(TTS_FALLBACK_BACKEND)
+        if fallback.is_available():
+            return fallback
+    return backend
+
+def get_audio_extension():
+    """
+    获取当前语音后端输出的音频文件扩展名
+    """
+    return get_backend().extension
+
+def get_speech_cache_key(text, voice_name, rate=0, pitch=0, backend_name=None):
+    """
+    获取语音缓存键
+    """
+    return make_cache_key({
+        'backend': backend_name or get_backend().name,
+        'text': text,
+        'voice': voice_name,
+        'rate': rate,
+        'pitch': pitch
+    })
+
+def get_cached_speech(text, output_path, voice_name=None, rate=0, pitch=0):
+    """
+    从缓存中复制语音到输出路径
+    
+    Returns:
+        dict: 缓存的元数据（包含duration），未命中时返回None
+    """
+    if not AUDIO_CACHE_ENABLED:
+        return None
+    
+    key = get_speech_cache_key(text, voice_name or DEFAULT_VOICE, rate, pitch)
+    cached_path = audio_cache.get(key)
+    if cached_path is None:
+        return None
+    
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    try:
+        shutil.copyfile(cached_path, output_path)
+    except OSError:
+        # 缓存文件可能在查找之后被淘汰，按未命中处理
+        return None
+    return audio_cache.get_metadata(key) or {}
+
+def synthesize_speech(text, output_path, voice_name=None, rate=0, pitch=0):
+    """
+    使用配置的语音后端生成语音，相同的（后端、文本、语音、语速、音调）直接使用缓存
+    
+    Args:
+        text (str): 要转换为语音的文本
+        output_path (str): 输出音频文件路径
+        voice_name (str): 语音名称，默认使用配置中的DEFAULT_VOICE
+        rate (int): 语速调整，范围-100到100
+        pitch (int): 音调调整，范围-100到100
+        
+    Returns:
+        dict: 合成元数据，duration 为音频时长（秒），失败时返回None
+    """
+    # 使用默认语音
+    if voice_name is None:
+        voice_name = DEFAULT_VOICE
+    
+    backend = get_backend()
+    if not backend.cacheable:
+        return _synthesize(backend, text, output_path, voice_name, rate, pitch)
+    
+    # 相同语音的并发请求只合成一次，其余调用者复制第一个调用者的输出文件
+    key = get_speech_cache_key(text, voice_name, rate, pitch, backend.name)
+    metadata, source_path = speech_flight.do(key, _synthesize_cacheable, backend, text, output_path, voice_name, rate, pitch)
+    if metadata is None:
+        return None
+    if source_path != output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        try:
+            shutil.copyfile(source_path, output_path)
+        except OSError:
+            # 第一个调用者的输出文件可能已随其任务被清理，自行查缓存或合成
+            metadata, _ = _synthesize_cacheable(backend, text, output_path, voice_name, rate, pitch)
+            return metadata
+    return dict(metadata)
+
+def _synthesize_cacheable(backend, text, output_path, voice_name, rate, pitch):
+    # 命中缓存时不调用语音后端
+    metadata = get_cached_speech(text, output_path, voice_name, rate, pitch)
+    if metadata is not None:
+        print(f"语音命中缓存: {output_path}")
+        return _with_duration(metadata, output_path), output_path
+    return _synthesize(backend, text, output_path, voice_name, rate, pitch), output_path
+
+def _synthesize(backend, text, output_path, voice_name, rate, pitch):
+    try:
+        # 确保输出目录存在
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        metadata = backend.synthesize(text, output_path, voice_name, rate, pitch)
+        if metadata is None:
+            return None
+        metadata = _with_duration(metadata, output_path)
+        
+        # 写入缓存，同时记录音频时长
+        if AUDIO_CACHE_ENABLED and backend.cacheable:
+            audio_cache.put_file(get_speech_cache_key(text, voice_name, rate, pitch, backend.name), output_path, metadata)
+        
+        print(f"语音生成成功: {output_path}")
+        return metadata
+    except Exception as e:
+        print(f"语音生成失败: {e}")
+        return None
+
+def generate_speech(text, output_path, voice_name=None, rate=0, pitch=0):
+    """
+    生成语音（参数同 synthesize_speech）
+    
+    Returns:
+        bool: 是否成功生成语音
+    """
+    return synthesize_speech(text, output_path, voice_name, rate, pitch) is not None
+
+def _with_duration(metadata, audio_path):
+    """
+    确保元数据中包含时长：后端未提供时只读取文件头获取
+    """
+    metadata = dict(metadata)
+    if not metadata.get('duration'):
+        metadata['duration'] = probe_audio_duration(audio_path)
+    return metadata
+
+def generate_audio_for_scenes(scenes, output_dir, voice_name=None, manifest=None, on_progress=None, cancel_token=None):
+    """
+    为多个场景生成音频文件
+    
+    Args:
+        scenes (list): 场景文本列表
+        output_dir (str): 输出目录
+        voice_name (str): 语音名称
+        manifest (TaskManifest): 任务清单，提供时记录每个场景的音频路径和时长
+        on_progress (callable): 每个场景合成结束后调用 on_progress(scene_index)
+        cancel_token (CancellationToken): 取消令牌，每次合成前检查
+        
+    Returns:
+        list: 生成的音频文件路径列表
+    """
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+    
+    def synthesize(i, scene):
+        check_cancelled(cancel_token)
+        audio_path = synthesize_scene(i, scene)
+        if on_progress is not None:
+            on_progress(i)
+        return audio_path
+    
+    def synthesize_scene(i, scene):
+        # 构建输出路径
+        audio_path = os.path.join(output_dir, f"scene_{i:03d}{get_audio_extension()}")
+        
+        # 生成语音
+        metadata = synthesize_speech(
+            text=scene,
+            output_path=audio_path,
+            voice_name=voice_name
+        )
+        
+        if metadata is not None:
+            if manifest is not None:
+                manifest.update_scene(i, audio_path=audio_path, duration=metadata.get('duration'))
+            print(f"生成音频 {i+1}/{len(scenes)}: {audio_path}")
+            return audio_path
+        
+        if manifest is not None:
+            manifest.update_scene(i, audio_path=None, duration=None)
+        print(f"生成音频 {i+1}/{len(scenes)} 失败")
+        # 如果生成失败，返回空路径
+        return None
+    
+    # 并发合成，远程后端的请求速率由令牌桶统一控制
+    with ThreadPoolExecutor(max_workers=max(1, TTS_MAX_CONCURRENCY)) as executor:
+        futures = [executor.submit(synthesize, i, scene) for i, scene in enumerate(scenes)]
+        audio_paths = [future.result() for future in futures]
+    
+    return audio_paths
+
+def get_available_voices():
+    """
+    获取可用的语音列表
+    
+    Returns:
+        list: 语音信息列表
+    """
+    try:
+        return get_backend().list_voices()
+    except Exception as e:
+        print(f"获取语音列表失败: {e}")
+        return []
+
+def get_voice_duration(audio_path):
+    """
+    获取音频文件的持续时间（秒）
+    
+    优先只读取文件头；无法识别时才完整解码
+    
+    Args:
+        audio_path (str): 音频文件路径
+        
+    Returns:
+        float: 音频持续时间（秒）
+    """
+    duration = probe_audio_duration(audio_path)
+    if duration:
+        return duration
+    
+    try:
+        from pydub import AudioSegment
+        audio = AudioSegment.from_file(audio_path)
+        return len(audio) / 1000.0  # 毫秒转秒
+    except Exception as e:
+        print(f"获取音频持续时间失败: {e}")
+        # 如果无法获取，按文件大小粗略估计
+        try:
+            estimated_duration = os.path.getsize(audio_path) / 10000
+            return max(estimated_duration, 1.0)  # 至少1秒
+        except OSError:
+            return 3.0  # 默认3秒
@@ -0,0 +1,379 @@
+import os
+import re
+import time
+import wave
+import random
+import shutil
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from config import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, DEFAULT_VOICE
+from config import TTS_RATE_LIMIT, TTS_RATE_BURST, TTS_MAX_RETRIES, TTS_BACKOFF_BASE, TTS_STUB_LATENCY
+from config import LOCAL_TTS_ENGINE
+from utils.audio_generation.probe import read_wav_duration
+
+try:
+    import azure.cognitiveservices.speech as speechsdk
+except ImportError:
+    speechsdk = None
+
+class TokenBucket:
+    """
+    令牌桶限流器：平均每秒最多 rate 次请求，允许短时突发 capacity 次
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate (float): 每秒补充的令牌数，小于等于0表示不限流
+            capacity (int): 令牌桶容量（允许的突发请求数）
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个令牌，令牌不足时阻塞等待
+        """
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def estimate_audio_duration(text):
+    """
+    根据文本长度估算朗读时长
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        float: 估算时长（秒），中文约每字0.25秒，英文约每词0.4秒
+    """
+    chinese_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
+    english_words = len(re.findall(r'[A-Za-z]+', text))
+    return max(chinese_chars * 0.25 + english_words * 0.4, 1.0)
+
+class TTSBackend:
+    """
+    语音合成后端接口
+
+    子类实现 synthesize()，成功时把音频写入 output_path 并返回元数据字典
+    （至少包含 duration，单位秒，未知时为None），失败时返回None。
+    """
+
+    # 后端名称，同时作为语音缓存键的一部分
+    name = None
+    # 输出音频文件扩展名
+    extension = '.wav'
+    # 合成结果是否写入语音缓存
+    cacheable = True
+
+    def is_available(self):
+        """
+        后端当前是否可用（依赖已安装、密钥已配置等）
+        """
+        return True
+
+    def synthesize(self, text, output_path, voice_name, rate=0, pitch=0):
+        """
+        合成语音
+
+        Args:
+            text (str): 要转换为语音的文本
+            output_path (str): 输出音频文件路径
+            voice_name (str): 语音名称
+            rate (int): 语速调整，范围-100到100
+            pitch (int): 音调调整，范围-100到100
+
+        Returns:
+            dict: 合成元数据（包含duration），失败时返回None
+        """
+        raise NotImplementedError
+
+    def list_voices(self):
+        """
+        获取后端支持的语音列表
+
+        Returns:
+            list: 语音信息列表
+        """
+        return []
+
+class AzureTTSBackend(TTSBackend):
+    """
+    Azure语音服务后端
+
+    按语音复用语音配置和合成器，请求速率由令牌桶控制，只在被限流时指数退避重试
+    """
+
+    name = 'azure'
+    extension = '.mp3'
+
+    def __init__(self):
+        self.rate_limiter = TokenBucket(TTS_RATE_LIMIT, TTS_RATE_BURST)
+        self._speech_configs = {}
+        self._synthesizer_pools = {}
+        self._pool_lock = threading.Lock()
+
+    def is_available(self):
+        return speechsdk is not None and bool(AZURE_SPEECH_KEY) and bool(AZURE_SPEECH_REGION)
+
+    def _get_speech_config(self, voice_name=None):
+        """
+        获取（并缓存）语音配置，输出格式固定为MP3
+        """
+        with self._pool_lock:
+            speech_config = self._speech_configs.get(voice_name)
+            if speech_config is None:
+                speech_config = speechsdk.SpeechConfig(
+                    subscription=AZURE_SPEECH_KEY,
+                    region=AZURE_SPEECH_REGION
+                )
+                speech_config.set_speech_synthesis_output_format(
+                    speechsdk.SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3
+                )
+                if voice_name:
+                    speech_config.speech_synthesis_voice_name = voice_name
+                self._speech_configs[voice_name] = speech_config
+            return speech_config
+
+    @contextmanager
+    def _pooled_synthesizer(self, voice_name):
+        """
+        从对应语音的池中取出一个合成器，用完后归还；出错的合成器直接丢弃
+
+        合成器不绑定输出文件（audio_config=None），合成结果保存在内存中，
+        因此同一个合成器可以用于不同的输出路径
+        """
+        with self._pool_lock:
+            pool = self._synthesizer_pools.setdefault(voice_name, [])
+            synthesizer = pool.pop() if pool else None
+
+        if synthesizer is None:
+            synthesizer = speechsdk.SpeechSynthesizer(
+                speech_config=self._get_speech_config(voice_name),
+                audio_config=None
+            )
+
+        yield synthesizer
+
+        with self._pool_lock:
+            self._synthesizer_pools[voice_name].append(synthesizer)
+
+    @staticmethod
+    def _is_throttled(cancellation_details):
+        """
+        判断语音合成是否因请求过多被限流
+        """
+        error_code = getattr(cancellation_details, 'error_code', None)
+        too_many_requests = getattr(getattr(speechsdk, 'CancellationErrorCode', None), 'TooManyRequests', None)
+        if too_many_requests is not None and error_code == too_many_requests:
+            return True
+
+        details = (cancellation_details.error_details or '').lower()
+        return '429' in details or 'too many requests' in details or 'throttl' in details
+
+    def synthesize(self, text, output_path, voice_name, rate=0, pitch=0):
+        if not self.is_available():
+            print("错误: 未配置Azure语音服务API密钥或区域")
+            return None
+
+        # 构建SSML以控制语速和音调
+        ssml = f"""
+        <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="zh-CN">
+            <voice name="{voice_name}">
+                <prosody rate="{rate}%" pitch="{pitch}%">
+                    {text}
+                </prosody>
+            </voice>
+        </speak>
+        """
+
+        for attempt in range(TTS_MAX_RETRIES + 1):
+            # 按令牌桶限流后合成语音
+            self.rate_limiter.acquire()
+            with self._pooled_synthesizer(voice_name) as speech_synthesizer:
+                result = speech_synthesizer.speak_ssml_async(ssml).get()
+
+            # 检查结果
+            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+                with open(output_path, 'wb') as f:
+                    f.write(result.audio_data)
+                audio_duration = getattr(result, 'audio_duration', None)
+                return {'duration': audio_duration.total_seconds() if audio_duration else None}
+            elif result.reason == speechsdk.ResultReason.Canceled:
+                cancellation_details = result.cancellation_details
+
+                # 只有被限流时才指数退避后重试
+                if (cancellation_details.reason == speechsdk.CancellationReason.Error
+                        and self._is_throttled(cancellation_details) and attempt < TTS_MAX_RETRIES):
+                    delay = TTS_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, TTS_BACKOFF_BASE)
+                    print(f"语音服务限流，{delay:.1f}秒后重试: {output_path}")
+                    time.sleep(delay)
+                    continue
+
+                print(f"语音合成取消: {cancellation_details.reason}")
+                if cancellation_details.reason == speechsdk.CancellationReason.Error:
+                    print(f"错误详情: {cancellation_details.error_details}")
+                return None
+        return None
+
+    def list_voices(self):
+        if not self.is_available():
+            print("错误: 未配置Azure语音服务API密钥或区域")
+            return []
+
+        # 获取可用语音
+        with self._pooled_synthesizer(DEFAULT_VOICE) as speech_synthesizer:
+            result = speech_synthesizer.get_voices_async().get()
+
+        # 检查结果
+        if result.reason != speechsdk.ResultReason.VoicesListRetrieved:
+            print(f"获取语音列表失败: {result.reason}")
+            return []
+
+        voices = []
+        for voice in result.voices:
+            # 只保留中文和英文语音
+            if voice.locale.startswith('zh-') or voice.locale.startswith('en-'):
+                voices.append({
+                    'name': voice.name,
+                    'display_name': voice.short_name,
+                    'locale': voice.locale,
+                    'gender': voice.gender,
+                    'style': voice.style_list
+                })
+        return voices
+
+class LocalTTSBackend(TTSBackend):
+    """
+    本地CPU语音合成后端，直接写入WAV，无网络往返
+
+    优先使用 espeak-ng / espeak 命令行，其次使用 pyttsx3（由 LOCAL_TTS_ENGINE 控制）。
+    Azure语音名称（如 zh-CN-XiaoxiaoNeural）按语言前缀映射到本地语音。
+    """
+
+    name = 'local'
+    extension = '.wav'
+
+    # espeak 默认语速（词/分钟）和音调（0-99）
+    ESPEAK_DEFAULT_SPEED = 175
+    ESPEAK_DEFAULT_PITCH = 50
+
+    def __init__(self, engine=None):
+        self.engine = engine or LOCAL_TTS_ENGINE
+        self._espeak_binary = shutil.which('espeak-ng') or shutil.which('espeak')
+        self._pyttsx3 = None
+        # pyttsx3 引擎不是线程安全的，串行调用
+        self._pyttsx3_lock = threading.Lock()
+
+    def _use_espeak(self):
+        return self.engine in ('auto', 'espeak') and self._espeak_binary is not None
+
+    def _get_pyttsx3(self):
+        if self._pyttsx3 is None:
+            try:
+                import pyttsx3
+                self._pyttsx3 = pyttsx3.init()
+            except Exception as e:
+                print(f"初始化pyttsx3失败: {e}")
+                self._pyttsx3 = False
+        return self._pyttsx3 or None
+
+    def is_available(self):
+        if self._use_espeak():
+            return True
+        if self.engine in ('auto', 'pyttsx3'):
+            return self._get_pyttsx3() is not None
+        return False
+
+    @staticmethod
+    def _language_for_voice(voice_name):
+        # zh-CN-XiaoxiaoNeural -> zh，en-US-JennyNeural -> en
+        return (voice_name or DEFAULT_VOICE).split('-')[0].lower() or 'zh'
+
+    def synthesize(self, text, output_path, voice_name, rate=0, pitch=0):
+        try:
+            if self._use_espeak():
+                self._synthesize_espeak(text, output_path, voice_name, rate, pitch)
+            else:
+                engine = self._get_pyttsx3()
+                if engine is None:
+                    print("错误: 未找到可用的本地语音合成引擎（espeak-ng/espeak/pyttsx3）")
+                    return None
+                with self._pyttsx3_lock:
+                    engine.setProperty('rate', int(200 * (1 + rate / 100.0)))
+                    engine.save_to_file(text, output_path)
+                    engine.runAndWait()
+            return {'duration': read_wav_duration(output_path)}
+        except Exception as e:
+            print(f"本地语音合成失败: {e}")
+            return None
+
+    def _synthesize_espeak(self, text, output_path, voice_name, rate, pitch):
+        # 文本通过临时文件传入，避免命令行长度和转义问题
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as f:
+            f.write(text)
+            text_path = f.name
+        try:
+            subprocess.run([
+                self._espeak_binary,
+                '-v', self._language_for_voice(voice_name),
+                '-s', str(max(80, int(self.ESPEAK_DEFAULT_SPEED * (1 + rate / 100.0)))),
+                '-p', str(min(99, max(0, int(self.ESPEAK_DEFAULT_PITCH * (1 + pitch / 100.0))))),
+                '-f', text_path,
+                '-w', output_path
+            ], check=True, capture_output=True)
+        finally:
+            os.remove(text_path)
+
+    def list_voices(self):
+        if not self.is_available():
+            return []
+        return [
+            {'name': 'zh-CN-XiaoxiaoNeural', 'display_name': 'Local (zh)', 'locale': 'zh-CN', 'gender': '', 'style': []},
+            {'name': 'en-US-JennyNeural', 'display_name': 'Local (en)', 'locale': 'en-US', 'gender': '', 'style': []}
+        ]
+
+class StubTTSBackend(TTSBackend):
+    """
+    本地桩后端：不做真正的合成，写入与估算时长一致的静音WAV，用于离线测试和压测
+    """
+
+    name = 'stub'
+    extension = '.wav'
+    cacheable = False
+
+    def synthesize(self, text, output_path, voice_name, rate=0, pitch=0):
+        if TTS_STUB_LATENCY > 0:
+            time.sleep(TTS_STUB_LATENCY)
+
+        sample_rate = 16000
+        duration = estimate_audio_duration(text)
+        with wave.open(output_path, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(b'\x00\x00' * int(duration * sample_rate))
+        return {'duration': duration}
+
+# 已注册的后端
+TTS_BACKENDS = {
+    'azure': AzureTTSBackend,
+    'local': LocalTTSBackend,
+    'stub': StubTTSBackend
+}
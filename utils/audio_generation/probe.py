@@ -0,0 +1,97 @@
+import os
+import wave
+
+# MPEG Layer III 比特率表（kbps），索引为帧头中的比特率序号
+_MP3_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+
+# 采样率表，键为帧头中的版本位：3=MPEG-1，2=MPEG-2，0=MPEG-2.5
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000]
+}
+
+def read_wav_duration(audio_path):
+    """
+    从WAV文件头读取时长，不解码音频数据
+    """
+    with wave.open(audio_path, 'rb') as f:
+        return f.getnframes() / float(f.getframerate())
+
+def read_mp3_duration(audio_path):
+    """
+    只读取MP3文件开头的几KB计算时长
+
+    有 Xing/Info 头时使用其中记录的帧数（适用于VBR），否则按首帧比特率和文件大小计算（CBR）
+
+    Args:
+        audio_path (str): MP3文件路径
+
+    Returns:
+        float: 时长（秒），无法识别时返回None
+    """
+    file_size = os.path.getsize(audio_path)
+    with open(audio_path, 'rb') as f:
+        header = f.read(10)
+        offset = 0
+        # 跳过 ID3v2 标签
+        if header[:3] == b'ID3' and len(header) == 10:
+            tag_size = (header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 | (header[8] & 0x7f) << 7 | (header[9] & 0x7f)
+            offset = 10 + tag_size
+        f.seek(offset)
+        data = f.read(4096)
+
+    for i in range(len(data) - 4):
+        # 帧同步：11个连续的1
+        if data[i] != 0xFF or (data[i + 1] & 0xE0) != 0xE0:
+            continue
+
+        version_bits = (data[i + 1] >> 3) & 0x03
+        layer_bits = (data[i + 1] >> 1) & 0x03
+        bitrate_index = data[i + 2] >> 4
+        sample_rate_index = (data[i + 2] >> 2) & 0x03
+        # 只识别 Layer III，跳过保留值
+        if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            continue
+
+        is_mpeg1 = version_bits == 3
+        bitrate = _MP3_BITRATES['mpeg1' if is_mpeg1 else 'mpeg2'][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+        samples_per_frame = 1152 if is_mpeg1 else 576
+
+        # Xing/Info 头位于帧头和边信息之后
+        mono = (data[i + 3] >> 6) == 3
+        side_info_size = (17 if mono else 32) if is_mpeg1 else (9 if mono else 17)
+        xing_offset = i + 4 + side_info_size
+        if data[xing_offset:xing_offset + 4] in (b'Xing', b'Info'):
+            flags = int.from_bytes(data[xing_offset + 4:xing_offset + 8], 'big')
+            if flags & 0x01:
+                frames = int.from_bytes(data[xing_offset + 8:xing_offset + 12], 'big')
+                return frames * samples_per_frame / float(sample_rate)
+
+        return (file_size - offset - i) * 8 / float(bitrate)
+
+    return None
+
+def probe_audio_duration(audio_path):
+    """
+    只读取文件头获取音频时长，不解码音频数据
+
+    Args:
+        audio_path (str): 音频文件路径（WAV或MP3）
+
+    Returns:
+        float: 时长（秒），无法识别时返回None
+    """
+    try:
+        with open(audio_path, 'rb') as f:
+            magic = f.read(4)
+        if magic == b'RIFF':
+            return read_wav_duration(audio_path)
+        return read_mp3_duration(audio_path)
+    except (OSError, EOFError, wave.Error) as e:
+        print(f"读取音频文件头失败 {audio_path}: {e}")
+        return None
@@ -0,0 +1,65 @@
+import time
+import threading
+
+class TaskCancelled(Exception):
+    """
+    任务已被取消，在扩散步骤之间、语音合成调用之间或片段编码之间抛出
+    """
+
+class CancellationToken:
+    """
+    协作式取消令牌
+
+    由任务的执行代码在安全的位置（两个扩散步骤之间、两次语音合成之间、两个片段编码之间）
+    调用 raise_if_cancelled() 检查，被取消时抛出 TaskCancelled，
+    已占用的阶段并发名额随异常退出而立即释放
+    """
+
+    def __init__(self, is_cancelled=None, check_interval=1.0):
+        """
+        Args:
+            is_cancelled (callable): 额外的取消检查（如读取任务存储中的取消标记，用于跨进程取消）
+            check_interval (float): 额外检查的最小间隔（秒），避免每个扩散步骤都访问存储
+        """
+        self._event = threading.Event()
+        self._is_cancelled = is_cancelled
+        self._check_interval = check_interval
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """
+        请求取消任务
+        """
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self._is_cancelled is None:
+            return False
+
+        with self._lock:
+            now = time.time()
+            if now - self._last_check < self._check_interval:
+                return False
+            self._last_check = now
+        if self._is_cancelled():
+            self._event.set()
+            return True
+        return False
+
+    def raise_if_cancelled(self):
+        """
+        任务已被取消时抛出 TaskCancelled
+        """
+        if self.cancelled:
+            raise TaskCancelled("任务已取消")
+
+def check_cancelled(cancel_token):
+    """
+    检查可选的取消令牌，令牌为None时不做任何事
+    """
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
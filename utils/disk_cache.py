@@ -0,0 +1,219 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+def make_cache_key(data):
+    """
+    根据字典内容生成缓存键（内容寻址）
+
+    Args:
+        data (dict): 决定缓存内容的全部参数
+
+    Returns:
+        str: SHA-256 十六进制摘要
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class DiskCache:
+    """
+    基于磁盘的内容寻址缓存，超出容量上限时按最近最少使用（LRU）淘汰
+
+    文件按键的前两位分目录存放：<root>/<key[:2]>/<key><ext>，
+    可选的元数据保存在同名的 .json 文件中。
+    启动时扫描一次目录建立索引，之后只在内存中维护访问顺序。
+    """
+
+    def __init__(self, root, max_bytes):
+        """
+        Args:
+            root (str): 缓存根目录
+            max_bytes (int): 缓存容量上限（字节），0表示不限制
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        查找缓存文件
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            str: 缓存文件路径，未命中时返回None
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None or not os.path.exists(entry['path']):
+                if entry is not None:
+                    self._remove_locked(key)
+                self.misses += 1
+                return None
+
+            # 更新访问顺序和访问时间，重启后仍能恢复LRU顺序
+            index.move_to_end(key)
+            try:
+                os.utime(entry['path'])
+            except OSError:
+                pass
+            self.hits += 1
+            return entry['path']
+
+    def get_metadata(self, key):
+        """
+        读取缓存项的元数据
+
+        Returns:
+            dict: 元数据，不存在时返回None
+        """
+        with self._lock:
+            entry = self._load_index().get(key)
+        if entry is None:
+            return None
+
+        meta_path = self._meta_path(key)
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put_file(self, key, src_path, metadata=None):
+        """
+        将文件复制到缓存中
+
+        Args:
+            key (str): 缓存键
+            src_path (str): 源文件路径
+            metadata (dict): 可选的元数据
+
+        Returns:
+            str: 缓存文件路径
+        """
+        ext = os.path.splitext(src_path)[1]
+        return self._store(key, ext, lambda tmp_path: shutil.copyfile(src_path, tmp_path), metadata)
+
+    def put_bytes(self, key, data, ext, metadata=None):
+        """
+        将二进制内容写入缓存
+
+        Args:
+            key (str): 缓存键
+            data (bytes): 文件内容
+            ext (str): 文件扩展名，如 '.png'
+            metadata (dict): 可选的元数据
+
+        Returns:
+            str: 缓存文件路径
+        """
+        def write(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        return self._store(key, ext, write, metadata)
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 条目数、占用字节数、命中/未命中/淘汰次数
+        """
+        with self._lock:
+            index = self._load_index()
+            return {
+                'entries': len(index),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _store(self, key, ext, write, metadata):
+        dest_path = os.path.join(self.root, key[:2], key + ext)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+
+        # 先写临时文件再原子替换，避免并发读取到不完整的文件
+        tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, dest_path)
+
+        if metadata is not None:
+            meta_path = self._meta_path(key)
+            meta_tmp_path = f"{meta_path}.{threading.get_ident()}.tmp"
+            with open(meta_tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False)
+            os.replace(meta_tmp_path, meta_path)
+
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                self._total_bytes -= index[key]['size']
+            size = os.path.getsize(dest_path)
+            index[key] = {'path': dest_path, 'size': size}
+            index.move_to_end(key)
+            self._total_bytes += size
+            self._evict_locked()
+
+        return dest_path
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, key[:2], key + '.json')
+
+    def _load_index(self):
+        # 首次访问时扫描缓存目录，按修改时间从旧到新建立索引
+        if self._index is not None:
+            return self._index
+
+        entries = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith('.json') or filename.endswith('.tmp'):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    key = os.path.splitext(filename)[0]
+                    entries.append((stat.st_mtime, key, path, stat.st_size))
+
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        for _, key, path, size in sorted(entries):
+            self._index[key] = {'path': path, 'size': size}
+            self._total_bytes += size
+        return self._index
+
+    def _remove_locked(self, key):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        self._total_bytes -= entry['size']
+        for path in (entry['path'], self._meta_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict_locked(self):
+        if not self.max_bytes:
+            return
+        while self._total_bytes > self.max_bytes and len(self._index) > 1:
+            oldest_key = next(iter(self._index))
+            self._remove_locked(oldest_key)
+            self.evictions += 1
@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+class EmbeddingCache:
+    """
+    文本编码器输出的内存缓存，超出条目上限时按最近最少使用（LRU）淘汰
+
+    键为 (文本编码器标识, 文本)，值为编码后的张量。
+    同一风格的负面提示词和重复出现的提示词只需编码一次
+    """
+
+    def __init__(self, max_entries=256):
+        """
+        Args:
+            max_entries (int): 最多缓存的条目数，0表示不缓存
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        读取缓存的编码结果
+
+        Returns:
+            object: 编码结果，未命中时返回None
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        写入编码结果
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 条目数、命中/未命中次数和命中率
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None
+            }
@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class _Channel:
+    """
+    单个任务的事件通道：保存最近的事件，等待者通过条件变量阻塞等待新事件
+    """
+
+    def __init__(self, history_size):
+        self.events = deque(maxlen=history_size)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+class EventHub:
+    """
+    进程内的任务事件发布/订阅中心
+
+    每个事件带有按任务递增的序号，订阅者只需记住最后收到的序号，
+    在条件变量上阻塞等待新事件，不需要轮询任务状态。
+    一次发布会唤醒该任务的所有订阅者（SSE连接和长轮询请求）
+    """
+
+    def __init__(self, history_size=100, max_channels=1000):
+        """
+        Args:
+            history_size (int): 每个任务保留的最近事件数
+            max_channels (int): 最多保留的任务通道数，超出后移除最久未使用的通道
+        """
+        self._history_size = history_size
+        self._max_channels = max_channels
+        self._channels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _channel(self, task_id):
+        with self._lock:
+            channel = self._channels.get(task_id)
+            if channel is None:
+                channel = _Channel(self._history_size)
+                self._channels[task_id] = channel
+                while len(self._channels) > self._max_channels:
+                    self._channels.popitem(last=False)
+            else:
+                self._channels.move_to_end(task_id)
+            return channel
+
+    def publish(self, task_id, event_type, **data):
+        """
+        发布任务事件
+
+        Args:
+            task_id (str): 任务ID
+            event_type (str): 事件类型，如 status（任务状态/进度）、scene（单个场景的阶段完成）
+            **data: 事件内容
+        """
+        self._append(task_id, dict(data, type=event_type, time=time.time()))
+
+    def _append(self, task_id, event):
+        channel = self._channel(task_id)
+        with channel.condition:
+            channel.seq += 1
+            channel.events.append(dict(event, seq=channel.seq))
+            channel.condition.notify_all()
+
+    def wait(self, task_id, since=0, timeout=15):
+        """
+        等待序号大于since的事件
+
+        Args:
+            task_id (str): 任务ID
+            since (int): 已收到的最后一个事件序号
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            list: 新事件列表，超时时返回空列表
+        """
+        channel = self._channel(task_id)
+        deadline = time.time() + timeout
+        with channel.condition:
+            while True:
+                # 序号小于since说明通道被重建过（如进程重启），从头开始发送
+                if channel.seq < since:
+                    since = 0
+                events = [event for event in channel.events if event['seq'] > since]
+                remaining = deadline - time.time()
+                if events or remaining <= 0:
+                    return events
+                channel.condition.wait(remaining)
+
+    def last_seq(self, task_id):
+        """
+        获取任务最新事件的序号，新订阅者从这里开始等待，不重放历史事件
+        """
+        channel = self._channel(task_id)
+        with channel.condition:
+            return channel.seq
+
+    def discard(self, task_id):
+        """
+        移除任务的事件通道（任务被清理时调用）
+        """
+        with self._lock:
+            self._channels.pop(task_id, None)
+
+class RedisEventHub(EventHub):
+    """
+    基于Redis发布/订阅的事件中心，用于多个Web进程和Celery worker之间转发事件
+
+    发布时只写入Redis频道；每个进程用一个后台线程订阅所有任务频道，
+    收到的事件再分发给本进程内的订阅者，浏览器连接数不影响Redis连接数
+    """
+
+    def __init__(self, url, prefix='comic_video', history_size=100, max_channels=1000):
+        """
+        Args:
+            url (str): Redis连接地址
+            prefix (str): 频道名前缀
+        """
+        if redis is None:
+            raise RuntimeError("未安装redis，无法使用Redis事件中心")
+        super().__init__(history_size, max_channels)
+        self._client = redis.Redis.from_url(url)
+        self._prefix = f"{prefix}:events:"
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, task_id, event_type, **data):
+        event = dict(data, type=event_type, time=time.time())
+        self._client.publish(self._prefix + task_id, json.dumps(event, ensure_ascii=False))
+
+    def wait(self, task_id, since=0, timeout=15):
+        self._ensure_listener()
+        return super().wait(task_id, since, timeout)
+
+    def last_seq(self, task_id):
+        self._ensure_listener()
+        return super().last_seq(task_id)
+
+    def _ensure_listener(self):
+        # 只在需要接收事件的进程（Web进程）中启动订阅线程，只发布事件的worker不需要
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self._prefix + '*')
+                for message in pubsub.listen():
+                    task_id = message['channel'].decode('utf-8')[len(self._prefix):]
+                    self._append(task_id, json.loads(message['data']))
+            except Exception as e:
+                print(f"Redis事件订阅中断，稍后重连: {e}")
+                time.sleep(1)
+
+def create_event_hub(backend, redis_url=None):
+    """
+    根据配置创建事件中心
+
+    Args:
+        backend (str): memory（进程内）或 redis
+        redis_url (str): Redis连接地址
+
+    Returns:
+        EventHub: 事件中心
+    """
+    if backend == 'redis':
+        return RedisEventHub(redis_url)
+    if backend == 'memory':
+        return EventHub()
+    raise ValueError(f"不支持的事件中心后端: {backend}")
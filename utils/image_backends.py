@@ -0,0 +1,115 @@
+import os
+import re
+import copy
+import numpy as np
+from config import IMAGE_BACKEND, ONNX_EXPORT_FOLDER
+
+try:
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+except ImportError:
+    ORTStableDiffusionPipeline = None
+
+try:
+    from optimum.intel import OVStableDiffusionPipeline
+except ImportError:
+    OVStableDiffusionPipeline = None
+
+# 图像生成后端：torch（PyTorch即时执行）、onnx（ONNX Runtime）、openvino（OpenVINO）
+IMAGE_BACKENDS = ('torch', 'onnx', 'openvino')
+
+def get_backend_pipeline_class(backend):
+    """
+    获取导出后端对应的管道类，未安装时返回None
+    """
+    if backend == 'onnx':
+        return ORTStableDiffusionPipeline
+    if backend == 'openvino':
+        return OVStableDiffusionPipeline
+    return None
+
+def resolve_image_backend(backend=None):
+    """
+    确定实际使用的图像生成后端
+
+    auto 优先使用OpenVINO，其次ONNX Runtime，都未安装时使用torch；
+    指定的导出后端未安装时退回torch
+
+    Args:
+        backend (str): 后端名称，默认使用配置中的IMAGE_BACKEND
+
+    Returns:
+        str: torch、onnx 或 openvino
+    """
+    backend = backend or IMAGE_BACKEND
+    if backend == 'auto':
+        for name in ('openvino', 'onnx'):
+            if get_backend_pipeline_class(name) is not None:
+                return name
+        return 'torch'
+    if backend not in IMAGE_BACKENDS:
+        raise ValueError(f"不支持的图像生成后端: {backend}")
+    if backend != 'torch' and get_backend_pipeline_class(backend) is None:
+        print(f"未安装 optimum 的 {backend} 支持，使用torch后端")
+        return 'torch'
+    return backend
+
+def get_export_dir(model_id, backend):
+    """
+    获取模型导出结果的缓存目录：<ONNX_EXPORT_FOLDER>/<后端>/<模型ID>
+    """
+    safe_name = re.sub(r'[^A-Za-z0-9._-]+', '--', model_id)
+    return os.path.join(ONNX_EXPORT_FOLDER, backend, safe_name)
+
+def load_exported_pipeline(model_id, backend, auth_token=None):
+    """
+    加载导出后端的管道
+
+    第一次使用某个模型时把文本编码器、UNet和VAE导出为ONNX（OpenVINO为IR）并保存到缓存目录，
+    之后直接从缓存目录加载，不再重复导出
+
+    Args:
+        model_id (str): 模型ID
+        backend (str): onnx 或 openvino
+        auth_token (str): Hugging Face访问令牌
+
+    Returns:
+        object: 与StableDiffusionPipeline调用方式相同的管道
+    """
+    pipeline_class = get_backend_pipeline_class(backend)
+    export_dir = get_export_dir(model_id, backend)
+
+    if os.path.exists(os.path.join(export_dir, 'model_index.json')):
+        return pipeline_class.from_pretrained(export_dir)
+
+    print(f"导出模型到 {backend}: {model_id}（首次使用，耗时较长）")
+    pipeline = pipeline_class.from_pretrained(model_id, export=True, use_auth_token=auth_token)
+    os.makedirs(export_dir, exist_ok=True)
+    pipeline.save_pretrained(export_dir)
+    return pipeline
+
+def with_scheduler(pipeline, scheduler):
+    """
+    创建替换了采样器的管道副本，模型会话与原管道共享
+    """
+    variant = copy.copy(pipeline)
+    variant.scheduler = scheduler
+    return variant
+
+def make_numpy_generator(seed):
+    """
+    导出后端的管道使用NumPy随机数生成器
+    """
+    return np.random.RandomState(seed)
+
+def get_directory_bytes(path):
+    """
+    统计目录下所有文件的字节数，用于估算导出模型的内存占用
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
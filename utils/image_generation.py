@@ -1,22 +1,265 @@
+import io
 import os
+import time
+import hashlib
+import threading
 import torch
 import numpy as np
 from PIL import Image
-from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler
+from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler, EulerAncestralDiscreteScheduler, DDIMScheduler
 from config import IMAGE_WIDTH, IMAGE_HEIGHT, DEFAULT_MODEL, HF_API_KEY
+from config import IMAGE_BATCH_SIZE, IMAGE_MAX_BATCH_SIZE, IMAGE_BATCH_MB_PER_MEGAPIXEL
+from config import IMAGE_CACHE_ENABLED, IMAGE_CACHE_FOLDER, IMAGE_CACHE_MAX_MB, EMBEDDING_CACHE_SIZE, COMIC_STYLES
+from config import LOW_RES_DIFFUSION, LOW_RES_SCALE
+from config import PRELOAD_MODELS, MAX_LOADED_MODELS, MODEL_MEMORY_LIMIT_MB, IMAGE_STAGE_CONCURRENCY
+from config import TORCH_NUM_THREADS, CPU_CHANNELS_LAST, CPU_BFLOAT16, TORCH_COMPILE
+from utils.disk_cache import DiskCache, make_cache_key
+from utils.cancellation import TaskCancelled, check_cancelled
+from utils.quality_tiers import get_quality_tier
+from utils.upscaling import upscale_image_file
+from utils.model_manager import ModelManager
+from utils.embedding_cache import EmbeddingCache
+from utils.single_flight import SingleFlight
+from utils.text_processing import generate_negative_prompts
+from utils.image_backends import resolve_image_backend, load_exported_pipeline, with_scheduler
+from utils.image_backends import make_numpy_generator, get_directory_bytes
 
 # 检查是否有可用的GPU
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-# 模型缓存
-pipeline_cache = {}
+# 图像生成后端，导出后端（onnx/openvino）只在CPU上运行
+image_backend = resolve_image_backend() if device == "cpu" else "torch"
 
-def get_pipeline(model_id=None):
+# 图像缓存：以生成参数为键的内容寻址缓存
+image_cache = DiskCache(IMAGE_CACHE_FOLDER, IMAGE_CACHE_MAX_MB * 1024 * 1024)
+
+# 文本编码缓存：同一风格的负面提示词和重复的提示词不再经过文本编码器
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_SIZE)
+
+# 缓存未命中时的并发去重：不同任务同时生成相同参数的图像时只推理一次
+image_flight = SingleFlight()
+
+# 可选的采样器，质量档位通过名称选择；模型加载时默认使用 dpm
+SCHEDULERS = {
+    'dpm': DPMSolverMultistepScheduler,
+    'euler_a': EulerAncestralDiscreteScheduler,
+    'ddim': DDIMScheduler
+}
+DEFAULT_SCHEDULER = 'dpm'
+
+# 其他采样器的管道，键为 (模型ID, 采样器名称)，与基础管道共享模型组件
+scheduler_variants = {}
+_variants_lock = threading.Lock()
+
+def seed_from_text(text):
+    """
+    根据场景文本计算确定性的随机种子，相同文本总是得到相同的种子
+    
+    Args:
+        text (str): 场景文本
+        
+    Returns:
+        int: 随机种子
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) & 0x7fffffff
+
+def build_generation_info(prompt, negative_prompt, width, height, model_id, seed, tier):
+    """
+    构建生成信息，同时作为图像缓存的键
+    
+    导出后端与torch后端相同种子的结果并不完全一致，使用导出后端时键中包含后端名称
+    """
+    info = {
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "width": width,
+        "height": height,
+        "model_id": model_id or DEFAULT_MODEL,
+        "seed": seed,
+        "num_inference_steps": tier['steps'],
+        "guidance_scale": tier['guidance_scale'],
+        "scheduler": tier['scheduler']
+    }
+    if image_backend != "torch":
+        info["backend"] = image_backend
+    return info
+
+def get_cached_image(generation_info):
+    """
+    从缓存中读取图像
+    
+    Args:
+        generation_info (dict): 生成信息
+        
+    Returns:
+        PIL.Image: 缓存的图像，未命中时返回None
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    
+    cached_path = image_cache.get(make_cache_key(generation_info))
+    if cached_path is None:
+        return None
+    try:
+        image = Image.open(cached_path)
+        image.load()
+        return image
+    except Exception as e:
+        print(f"读取缓存图像失败: {e}")
+        return None
+
+def cache_image(generation_info, image):
+    """
+    将生成的图像写入缓存
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return
+    try:
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        image_cache.put_bytes(make_cache_key(generation_info), buffer.getvalue(), '.png')
+    except Exception as e:
+        print(f"写入图像缓存失败: {e}")
+
+def configure_torch_threads():
+    """
+    设置CPU推理线程数
+
+    多个任务同时生成图像时，每个任务分到 CPU核数 / 图像阶段并发数 个线程，避免线程过多互相争抢
+    """
+    num_threads = TORCH_NUM_THREADS or max(1, (os.cpu_count() or 1) // max(1, IMAGE_STAGE_CONCURRENCY))
+    torch.set_num_threads(num_threads)
+    return num_threads
+
+def cpu_supports_bfloat16():
+    """
+    CPU是否支持bfloat16推理（需要AVX512-BF16或AMX指令集）
+    """
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+def optimize_pipeline_for_cpu(pipeline):
+    """
+    对CPU上的管道应用推理优化：channels_last内存布局、bfloat16、torch.compile
+
+    每项优化失败时只打印提示，不影响模型使用
+
+    Returns:
+        StableDiffusionPipeline: 优化后的管道
+    """
+    if CPU_BFLOAT16:
+        if cpu_supports_bfloat16():
+            for component in pipeline.components.values():
+                if isinstance(component, torch.nn.Module):
+                    component.to(torch.bfloat16)
+        else:
+            print("当前CPU不支持bfloat16，使用float32推理")
+
+    if CPU_CHANNELS_LAST:
+        try:
+            pipeline.unet.to(memory_format=torch.channels_last)
+            pipeline.vae.to(memory_format=torch.channels_last)
+        except Exception as e:
+            print(f"无法启用channels_last: {e}")
+
+    if TORCH_COMPILE and hasattr(torch, "compile"):
+        try:
+            pipeline.unet = torch.compile(pipeline.unet)
+        except Exception as e:
+            print(f"无法编译UNet: {e}")
+
+    return pipeline
+
+def load_pipeline(model_id):
+    """
+    从磁盘或Hugging Face加载Stable Diffusion模型管道，并按设备应用优化
+    
+    Args:
+        model_id (str): 模型ID
+        
+    Returns:
+        StableDiffusionPipeline: 加载好的模型管道
+    """
+    if image_backend != "torch":
+        return load_exported_pipeline(model_id, image_backend, HF_API_KEY if HF_API_KEY else None)
+    
+    # 使用DPMSolverMultistepScheduler以获得更好的质量和速度平衡
+    scheduler = DPMSolverMultistepScheduler.from_pretrained(
+        model_id, 
+        subfolder="scheduler",
+        use_auth_token=HF_API_KEY if HF_API_KEY else None
+    )
+    
+    pipeline = StableDiffusionPipeline.from_pretrained(
+        model_id,
+        scheduler=scheduler,
+        use_auth_token=HF_API_KEY if HF_API_KEY else None
+    )
+    
+    # 移动到设备
+    pipeline = pipeline.to(device)
+    
+    # 启用注意力切片以减少内存使用
+    if hasattr(pipeline, "enable_attention_slicing"):
+        pipeline.enable_attention_slicing()
+    
+    # 如果是CUDA设备，启用内存高效的注意力
+    if device == "cuda" and hasattr(pipeline, "enable_xformers_memory_efficient_attention"):
+        try:
+            pipeline.enable_xformers_memory_efficient_attention()
+        except Exception as e:
+            print(f"无法启用xformers优化: {e}")
+    elif device == "cpu":
+        pipeline = optimize_pipeline_for_cpu(pipeline)
+    
+    return pipeline
+
+def measure_pipeline_bytes(pipeline):
+    """
+    测量管道中所有模型组件的参数和缓冲区占用的字节数，导出后端按模型文件大小估算
+    """
+    if image_backend != "torch":
+        return get_directory_bytes(str(getattr(pipeline, "model_save_dir", "")))
+    
+    total = 0
+    for component in pipeline.components.values():
+        if isinstance(component, torch.nn.Module):
+            for tensor in list(component.parameters()) + list(component.buffers()):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+def release_pipeline(model_id):
+    """
+    模型被卸载后清理其采样器变体并释放显存
+    """
+    with _variants_lock:
+        for key in [key for key in scheduler_variants if key[0] == model_id]:
+            del scheduler_variants[key]
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+# 常驻模型管理器
+model_manager = ModelManager(
+    load_pipeline,
+    measure=measure_pipeline_bytes,
+    max_memory_mb=MODEL_MEMORY_LIMIT_MB,
+    max_models=MAX_LOADED_MODELS,
+    on_evict=release_pipeline
+)
+
+if device == "cpu":
+    configure_torch_threads()
+
+def get_pipeline(model_id=None, scheduler_name=None):
     """
     获取或加载Stable Diffusion模型管道
     
     Args:
         model_id (str): 模型ID，默认使用配置中的DEFAULT_MODEL
+        scheduler_name (str): 采样器名称（见SCHEDULERS），默认使用 dpm
         
     Returns:
         StableDiffusionPipeline: 加载好的模型管道
@@ -24,52 +267,141 @@ def get_pipeline(model_id=None):
     if model_id is None:
         model_id = DEFAULT_MODEL
     
-    # 如果模型已经加载，直接返回缓存的管道
-    if model_id in pipeline_cache:
-        return pipeline_cache[model_id]
-    
-    # 加载模型
     try:
-        # 使用DPMSolverMultistepScheduler以获得更好的质量和速度平衡
-        scheduler = DPMSolverMultistepScheduler.from_pretrained(
-            model_id, 
-            subfolder="scheduler",
-            use_auth_token=HF_API_KEY if HF_API_KEY else None
-        )
-        
-        pipeline = StableDiffusionPipeline.from_pretrained(
-            model_id,
-            scheduler=scheduler,
-            use_auth_token=HF_API_KEY if HF_API_KEY else None
-        )
-        
-        # 移动到设备
-        pipeline = pipeline.to(device)
-        
-        # 启用注意力切片以减少内存使用
-        if hasattr(pipeline, "enable_attention_slicing"):
-            pipeline.enable_attention_slicing()
-        
-        # 如果是CUDA设备，启用内存高效的注意力
-        if device == "cuda" and hasattr(pipeline, "enable_xformers_memory_efficient_attention"):
-            try:
-                pipeline.enable_xformers_memory_efficient_attention()
-            except Exception as e:
-                print(f"无法启用xformers优化: {e}")
-        
-        # 缓存管道
-        pipeline_cache[model_id] = pipeline
-        
-        return pipeline
+        pipeline = model_manager.get(model_id)
     except Exception as e:
         print(f"加载模型失败: {e}")
         # 如果加载失败，尝试使用默认模型
         if model_id != DEFAULT_MODEL:
             print(f"尝试加载默认模型: {DEFAULT_MODEL}")
-            return get_pipeline(DEFAULT_MODEL)
+            return get_pipeline(DEFAULT_MODEL, scheduler_name)
         raise
+    
+    # 其他采样器的管道与默认管道共享同一份模型组件，只替换采样器，不重复占用内存
+    if scheduler_name and scheduler_name != DEFAULT_SCHEDULER:
+        variant_key = (model_id, scheduler_name)
+        with _variants_lock:
+            if variant_key not in scheduler_variants:
+                scheduler = SCHEDULERS[scheduler_name].from_config(pipeline.scheduler.config)
+                if image_backend == "torch":
+                    variant = StableDiffusionPipeline(**dict(pipeline.components, scheduler=scheduler))
+                else:
+                    variant = with_scheduler(pipeline, scheduler)
+                scheduler_variants[variant_key] = variant
+            return scheduler_variants[variant_key]
+    
+    return pipeline
+
+def preload_model(model_ids=None):
+    """
+    预加载模型并编码各风格的负面提示词，在应用启动时于后台线程调用，避免第一个任务等待模型加载
+    
+    Args:
+        model_ids (list): 模型ID列表，默认使用配置中的PRELOAD_MODELS
+    """
+    for model_id in model_ids if model_ids is not None else PRELOAD_MODELS:
+        try:
+            model_manager.get(model_id)
+            warm_embedding_cache(model_id)
+        except Exception as e:
+            print(f"预加载模型失败 {model_id}: {e}")
 
-def generate_image(prompt, negative_prompt=None, width=None, height=None, model_id=None, seed=None):
+def encode_text(pipeline, text):
+    """
+    使用管道的文本编码器编码文本，结果按 (文本编码器, 文本) 缓存
+    
+    Args:
+        pipeline (StableDiffusionPipeline): 模型管道
+        text (str): 提示词，负面提示词为空时编码空字符串（与管道的默认行为一致）
+        
+    Returns:
+        torch.Tensor: 形状为 (1, 序列长度, 隐藏维度) 的编码结果
+    """
+    # 同一模型的各采样器变体共享文本编码器，用模型路径区分不同模型
+    key = (getattr(pipeline.text_encoder, "name_or_path", None) or id(pipeline.text_encoder), text or "")
+    embeds = embedding_cache.get(key)
+    if embeds is not None:
+        return embeds
+    
+    tokenizer = pipeline.tokenizer
+    text_inputs = tokenizer(
+        text or "",
+        padding="max_length",
+        max_length=tokenizer.model_max_length,
+        truncation=True,
+        return_tensors="pt"
+    )
+    with torch.no_grad():
+        embeds = pipeline.text_encoder(text_inputs.input_ids.to(pipeline.text_encoder.device))[0]
+    embedding_cache.put(key, embeds)
+    return embeds
+
+def build_prompt_inputs(pipeline, prompts, negative_prompt):
+    """
+    构建管道的提示词参数
+    
+    torch后端传入缓存的 prompt_embeds 和 negative_prompt_embeds，跳过管道内的文本编码；
+    导出后端的文本编码器是独立的推理会话，直接传入文本
+    
+    Args:
+        pipeline (StableDiffusionPipeline): 模型管道
+        prompts (list): 提示词列表
+        negative_prompt (str): 负面提示词（所有提示词共用）
+        
+    Returns:
+        dict: 管道调用的提示词参数
+    """
+    if image_backend != "torch":
+        return {
+            "prompt": prompts if len(prompts) > 1 else prompts[0],
+            "negative_prompt": ([negative_prompt] * len(prompts) if len(prompts) > 1 else negative_prompt) if negative_prompt else None
+        }
+    
+    prompt_embeds = torch.cat([encode_text(pipeline, prompt) for prompt in prompts])
+    negative_embeds = encode_text(pipeline, negative_prompt).expand(len(prompts), -1, -1)
+    return {"prompt_embeds": prompt_embeds, "negative_prompt_embeds": negative_embeds}
+
+def warm_embedding_cache(model_id=None):
+    """
+    预先编码所有风格的负面提示词
+    """
+    pipeline = get_pipeline(model_id)
+    if image_backend != "torch":
+        return
+    for style in COMIC_STYLES:
+        encode_text(pipeline, generate_negative_prompts(style))
+
+def make_generator(seed):
+    """
+    创建指定种子的随机数生成器，导出后端使用NumPy生成器
+    """
+    if image_backend != "torch":
+        return make_numpy_generator(seed)
+    return torch.Generator(device=device).manual_seed(seed)
+
+def make_step_callback(on_step=None, cancel_token=None, total_steps=None):
+    """
+    构建扩散管道的步骤回调：每个推理步骤结束后检查是否已取消，并汇报步骤进度
+    
+    Args:
+        on_step (callable): 进度回调 on_step(step, total_steps)，step从1开始
+        cancel_token (CancellationToken): 取消令牌，被取消时在两个步骤之间抛出TaskCancelled
+        total_steps (int): 总推理步数
+        
+    Returns:
+        callable: 管道回调 callback(step, timestep, latents)，两个参数都为None时返回None
+    """
+    if on_step is None and cancel_token is None:
+        return None
+    
+    def callback(step, timestep, latents):
+        check_cancelled(cancel_token)
+        if on_step is not None:
+            on_step(step + 1, total_steps)
+    return callback
+
+def generate_image(prompt, negative_prompt=None, width=None, height=None, model_id=None, seed=None,
+                   on_step=None, cancel_token=None, quality=None):
     """
     根据提示词生成图像
     
@@ -80,6 +412,9 @@ def generate_image(prompt, negative_prompt=None, width=None, height=None, model_
         height (int): 图像高度
         model_id (str): 模型ID
         seed (int): 随机种子
+        on_step (callable): 推理步骤进度回调 on_step(step, total_steps)
+        cancel_token (CancellationToken): 取消令牌
+        quality (str): 质量档位，决定推理步数、引导强度和采样器
         
     Returns:
         PIL.Image: 生成的图像
@@ -90,112 +425,472 @@ def generate_image(prompt, negative_prompt=None, width=None, height=None, model_
     if height is None:
         height = IMAGE_HEIGHT
     
-    # 获取模型管道
-    pipeline = get_pipeline(model_id)
-    
-    # 设置随机种子
+    # 设置随机种子，只有调用方指定种子时结果才可复现，才需要查询和写入缓存
+    cacheable = seed is not None
     if seed is None:
-        seed = np.random.randint(0, 2147483647)
-    generator = torch.Generator(device=device).manual_seed(seed)
+        seed = int(np.random.randint(0, 2147483647))
     
-    # 生成图像
-    with torch.no_grad():
-        result = pipeline(
+    # 记录生成信息
+    tier = get_quality_tier(quality)
+    generation_info = build_generation_info(prompt, negative_prompt, width, height, model_id, seed, tier)
+    
+    def run():
+        # 命中缓存时直接返回，无需加载模型
+        if cacheable:
+            image = get_cached_image(generation_info)
+            if image is not None:
+                return image
+        
+        # 获取模型管道
+        check_cancelled(cancel_token)
+        pipeline = get_pipeline(model_id, tier['scheduler'])
+        generator = make_generator(seed)
+        
+        # 生成图像
+        with torch.no_grad():
+            result = pipeline(
+                **build_prompt_inputs(pipeline, [prompt], negative_prompt),
+                width=width,
+                height=height,
+                num_inference_steps=tier['steps'],
+                guidance_scale=tier['guidance_scale'],
+                generator=generator,
+                callback=make_step_callback(on_step, cancel_token, tier['steps']),
+                callback_steps=1
+            )
+        
+        image = result.images[0]
+        if cacheable:
+            cache_image(generation_info, image)
+        return image
+    
+    if not cacheable:
+        return run(), generation_info
+    
+    # 可复现的生成：多个任务同时需要同一张图像时只推理一次，其余调用者等待并共享结果（等待者没有推理步骤进度）
+    image = image_flight.do(make_cache_key(generation_info), run, cancel_token=cancel_token)
+    return image.copy(), generation_info
+
+def generate_images_batch(prompts, negative_prompt=None, width=None, height=None, model_id=None, seeds=None,
+                          on_step=None, cancel_token=None, quality=None):
+    """
+    一次推理生成多张相同尺寸的图像
+    
+    每个提示词使用独立的随机数生成器，相同种子的结果与逐张生成一致
+    
+    Args:
+        prompts (list): 提示词列表
+        negative_prompt (str): 负面提示词（所有提示词共用）
+        width (int): 图像宽度
+        height (int): 图像高度
+        model_id (str): 模型ID
+        seeds (list): 每个提示词的随机种子，为None时随机生成
+        on_step (callable): 推理步骤进度回调 on_step(step, total_steps)
+        cancel_token (CancellationToken): 取消令牌
+        quality (str): 质量档位
+        
+    Returns:
+        list: (PIL.Image, generation_info) 元组列表，与提示词顺序一致
+    """
+    if width is None:
+        width = IMAGE_WIDTH
+    if height is None:
+        height = IMAGE_HEIGHT
+    if seeds is None:
+        seeds = [None] * len(prompts)
+    
+    # 导出后端的管道只接受一个随机数生成器，逐张生成以保证每张图像的种子独立
+    if image_backend != "torch":
+        return [
+            generate_image(prompt, negative_prompt, width, height, model_id, seed,
+                           on_step=on_step, cancel_token=cancel_token, quality=quality)
+            for prompt, seed in zip(prompts, seeds)
+        ]
+    
+    # 为每个提示词设置独立的随机种子，调用方指定种子的提示词先查询缓存
+    outputs = [None] * len(prompts)
+    cacheable = [seed is not None for seed in seeds]
+    seeds = [seed if seed is not None else int(np.random.randint(0, 2147483647)) for seed in seeds]
+    tier = get_quality_tier(quality)
+    infos = [
+        build_generation_info(prompt, negative_prompt, width, height, model_id, seed, tier)
+        for prompt, seed in zip(prompts, seeds)
+    ]
+    
+    # 可复现的图像与 generate_image 共用 image_flight：本批次成为 leader 的图像由本批次生成，
+    # 其他任务正在生成的图像等本批次完成后再等待其结果，本批次内重复的图像只生成一次
+    leaders = {}
+    waiting = []
+    duplicates = []
+    batch_keys = {}
+    for i, info in enumerate(infos):
+        if not cacheable[i]:
+            continue
+        key = make_cache_key(info)
+        if key in batch_keys:
+            duplicates.append((i, batch_keys[key]))
+            continue
+        batch_keys[key] = i
+        call = image_flight.try_lead(key)
+        if call is None:
+            waiting.append(i)
+            continue
+        image = get_cached_image(info)
+        if image is not None:
+            image_flight.finish(key, call, image)
+            outputs[i] = (image, info)
+        else:
+            leaders[i] = (key, call)
+    
+    skipped = set(waiting) | {i for i, _ in duplicates}
+    pending = [i for i in range(len(prompts)) if outputs[i] is None and i not in skipped]
+    if pending:
+        try:
+            # 获取模型管道
+            check_cancelled(cancel_token)
+            pipeline = get_pipeline(model_id, tier['scheduler'])
+            generators = [torch.Generator(device=device).manual_seed(seeds[i]) for i in pending]
+            
+            # 批量生成未命中缓存的图像
+            with torch.no_grad():
+                result = pipeline(
+                    **build_prompt_inputs(pipeline, [prompts[i] for i in pending], negative_prompt),
+                    width=width,
+                    height=height,
+                    num_inference_steps=tier['steps'],
+                    guidance_scale=tier['guidance_scale'],
+                    generator=generators,
+                    callback=make_step_callback(on_step, cancel_token, tier['steps']),
+                    callback_steps=1
+                )
+        except BaseException:
+            # 等待本批次的调用者重新竞争执行
+            for key, call in leaders.values():
+                image_flight.finish(key, call, failed=True)
+            raise
+        
+        for i, image in zip(pending, result.images):
+            outputs[i] = (image, infos[i])
+            if cacheable[i]:
+                cache_image(infos[i], image)
+                key, call = leaders[i]
+                image_flight.finish(key, call, image)
+    
+    # 其他任务正在生成的图像：等待其结果，对方失败时由 generate_image 自行生成
+    for i in waiting:
+        outputs[i] = generate_image(prompts[i], negative_prompt, width, height, model_id, seeds[i],
+                                    cancel_token=cancel_token, quality=quality)
+    for i, source in duplicates:
+        outputs[i] = (outputs[source][0].copy(), infos[i])
+    
+    return outputs
+
+def get_available_memory_mb():
+    """
+    获取当前推理设备的可用内存（MB）
+    
+    Returns:
+        float: 可用内存，无法获取时返回None
+    """
+    try:
+        if device == "cuda":
+            free_bytes, _ = torch.cuda.mem_get_info()
+            return free_bytes / (1024 * 1024)
+        
+        # CPU：优先读取 /proc/meminfo 中的 MemAvailable
+        if os.path.exists('/proc/meminfo'):
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) / 1024
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (ValueError, OSError, AttributeError, RuntimeError):
+        return None
+
+def get_auto_batch_size(width, height):
+    """
+    根据可用内存和图像尺寸自动选择批量大小
+    
+    Args:
+        width (int): 图像宽度
+        height (int): 图像高度
+        
+    Returns:
+        int: 批量大小（1 到 IMAGE_MAX_BATCH_SIZE 之间）
+    """
+    # 导出后端不支持每张图像独立的随机数生成器，不做批量推理
+    if image_backend != "torch":
+        return 1
+    
+    if IMAGE_BATCH_SIZE > 0:
+        return min(IMAGE_BATCH_SIZE, IMAGE_MAX_BATCH_SIZE)
+    
+    available_mb = get_available_memory_mb()
+    if available_mb is None:
+        return 1
+    
+    # 预留20%的余量，按每百万像素的激活内存估算每张图像的占用
+    per_image_mb = IMAGE_BATCH_MB_PER_MEGAPIXEL * (width * height) / 1e6
+    batch_size = int(available_mb * 0.8 / per_image_mb)
+    return max(1, min(batch_size, IMAGE_MAX_BATCH_SIZE))
+
+def get_image_size_for_style(style="default", quality=None):
+    """
+    根据漫画风格和质量档位获取图像尺寸
+    
+    Args:
+        style (str): 漫画风格
+        quality (str): 质量档位，按档位的分辨率缩放比例调整尺寸
+        
+    Returns:
+        tuple: (宽度, 高度)，均为8的倍数
+    """
+    if style == "anime":
+        # 动漫风格通常使用16:9比例
+        width, height = 768, 432
+    elif style == "sketch":
+        # 素描风格使用正方形
+        width, height = 512, 512
+    else:
+        width, height = IMAGE_WIDTH, IMAGE_HEIGHT
+    
+    # Stable Diffusion 要求宽高为8的倍数
+    scale = get_quality_tier(quality)['scale']
+    return int(width * scale) // 8 * 8, int(height * scale) // 8 * 8
+
+def get_diffusion_size(width, height, low_res=None):
+    """
+    获取实际扩散推理的图像尺寸
+    
+    启用低分辨率扩散时按 LOW_RES_SCALE 缩小，UNet的计算量与像素数成正比，
+    0.5的比例约可将推理耗时降至四分之一，生成后再由放大阶段恢复到目标尺寸
+    
+    Args:
+        width (int): 目标宽度
+        height (int): 目标高度
+        low_res (bool): 是否低分辨率扩散，为None时使用配置中的LOW_RES_DIFFUSION
+        
+    Returns:
+        tuple: (宽度, 高度)，均为8的倍数
+    """
+    if low_res is None:
+        low_res = LOW_RES_DIFFUSION
+    if not low_res or LOW_RES_SCALE >= 1:
+        return width, height
+    return max(int(width * LOW_RES_SCALE) // 8 * 8, 64), max(int(height * LOW_RES_SCALE) // 8 * 8, 64)
+
+def add_timing(timings, name, seconds):
+    """
+    累加阶段耗时，timings为None时不记录
+    """
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0) + seconds, 3)
+
+def upscale_scene_image(image_path, width, height, timings=None):
+    """
+    放大阶段：将低分辨率扩散得到的图像文件原地放大到目标尺寸
+    
+    Args:
+        image_path (str): 图像文件路径
+        width (int): 目标宽度
+        height (int): 目标高度
+        timings (dict): 阶段耗时记录，累加 upscale_seconds
+        
+    Returns:
+        str: 图像文件路径
+    """
+    start = time.time()
+    try:
+        upscale_image_file(image_path, width, height)
+    except Exception as e:
+        # 片段按图像尺寸编码、拼接时直接复制流，所有场景必须是同一尺寸：放大失败时退回不锐化的Lanczos缩放
+        print(f"放大图像失败，改为直接缩放 {image_path}: {e}")
+        try:
+            with Image.open(image_path) as image:
+                resized = image.convert('RGB').resize((width, height), Image.LANCZOS)
+        except Exception as e:
+            # 图像无法读取时与生成失败一样使用空白图像
+            print(f"缩放图像失败 {image_path}: {e}")
+            resized = Image.new('RGB', (width, height), color='white')
+        resized.save(image_path)
+    add_timing(timings, 'upscale_seconds', time.time() - start)
+    return image_path
+
+def generate_scene_image(prompt, negative_prompt, image_path, width=None, height=None, model_id=None, seed=None,
+                         on_step=None, cancel_token=None, quality=None, low_res=None, upscale=True, timings=None,
+                         info=None):
+    """
+    为单个场景生成图像并保存，生成失败时保存空白图像
+    
+    Args:
+        prompt (str): 提示词
+        negative_prompt (str): 负面提示词
+        image_path (str): 图像保存路径
+        width (int): 图像宽度
+        height (int): 图像高度
+        model_id (str): 模型ID
+        seed (int): 随机种子，为None时使用随机种子
+        on_step (callable): 推理步骤进度回调 on_step(step, total_steps)
+        cancel_token (CancellationToken): 取消令牌，取消时不保存空白图像而是抛出TaskCancelled
+        quality (str): 质量档位
+        low_res (bool): 是否低分辨率扩散，为None时使用配置中的LOW_RES_DIFFUSION
+        upscale (bool): 是否立即放大到目标尺寸；为False时保存扩散结果，由调用方在独立阶段调用upscale_scene_image
+        timings (dict): 阶段耗时记录，累加 diffusion_seconds 和 upscale_seconds
+        info (dict): 生成成功时写入生成信息（含实际使用的随机种子），用于记录到任务清单
+        
+    Returns:
+        str: 图像文件路径
+    """
+    if width is None:
+        width = IMAGE_WIDTH
+    if height is None:
+        height = IMAGE_HEIGHT
+    diffusion_width, diffusion_height = get_diffusion_size(width, height, low_res)
+    
+    start = time.time()
+    try:
+        # 生成图像
+        image, generation_info = generate_image(
             prompt=prompt,
             negative_prompt=negative_prompt,
-            width=width,
-            height=height,
-            num_inference_steps=30,  # 推理步数，影响质量和速度
-            guidance_scale=7.5,      # 提示词引导强度
-            generator=generator
+            width=diffusion_width,
+            height=diffusion_height,
+            model_id=model_id,
+            seed=seed,
+            on_step=on_step,
+            cancel_token=cancel_token,
+            quality=quality
         )
+        
+        # 保存图像
+        image.save(image_path)
+        if info is not None:
+            info.update(generation_info)
+    except TaskCancelled:
+        raise
+    except Exception as e:
+        print(f"生成图像失败 {image_path}: {e}")
+        # 如果生成失败，创建一个空白图像
+        blank_image = Image.new('RGB', (width, height), color='white')
+        blank_image.save(image_path)
+        return image_path
+    add_timing(timings, 'diffusion_seconds', time.time() - start)
     
-    # 返回生成的图像
-    image = result.images[0]
-    
-    # 记录生成信息
-    generation_info = {
-        "prompt": prompt,
-        "negative_prompt": negative_prompt,
-        "width": width,
-        "height": height,
-        "model_id": model_id or DEFAULT_MODEL,
-        "seed": seed
-    }
-    
-    return image, generation_info
+    if upscale and (diffusion_width, diffusion_height) != (width, height):
+        upscale_scene_image(image_path, width, height, timings)
+    return image_path
 
-def generate_images_for_scenes(prompts, negative_prompt, output_dir, style="default", model_id=None):
+def generate_images_for_scenes(prompts, negative_prompt, output_dir, style="default", model_id=None, sizes=None, batch_size=None, seeds=None,
+                               on_progress=None, on_step=None, cancel_token=None, quality=None, low_res=None, timings=None,
+                               infos=None):
     """
     为多个场景生成图像
     
+    相同尺寸的提示词会合并为一批推理，批量大小默认根据可用内存自动选择。
+    启用低分辨率扩散时，每批图像先以缩小的尺寸扩散，再经放大阶段恢复到目标尺寸
+    
     Args:
         prompts (list): 提示词列表
         negative_prompt (str): 负面提示词
         output_dir (str): 输出目录
         style (str): 漫画风格
         model_id (str): 模型ID
+        sizes (list): 每个提示词的 (宽度, 高度)，为None时使用风格对应的尺寸
+        batch_size (int): 批量大小，为None时自动选择，为1时逐张生成
+        seeds (list): 每个提示词的随机种子，为None时使用随机种子
+        on_progress (callable): 每张图像完成后调用 on_progress(scene_index)
+        on_step (callable): 推理步骤进度回调 on_step(scene_indices, step, total_steps)，批量推理时包含整批场景
+        cancel_token (CancellationToken): 取消令牌
+        quality (str): 质量档位，决定推理步数、采样器和默认分辨率
+        low_res (bool): 是否低分辨率扩散，为None时使用配置中的LOW_RES_DIFFUSION
+        timings (dict): 阶段耗时记录，写入 diffusion_seconds、upscale_seconds 和 diffusion_size
+        infos (dict): 写入每个生成成功的场景的生成信息，键为场景序号
         
     Returns:
         list: 生成的图像文件路径列表
     """
+    if timings is None:
+        timings = {}
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
     
     # 根据风格调整图像尺寸
-    width, height = IMAGE_WIDTH, IMAGE_HEIGHT
-    if style == "anime":
-        # 动漫风格通常使用16:9比例
-        width, height = 768, 432
-    elif style == "sketch":
-        # 素描风格使用正方形
-        width, height = 512, 512
+    if sizes is None:
+        sizes = [get_image_size_for_style(style, quality)] * len(prompts)
+    if seeds is None:
+        seeds = [None] * len(prompts)
     
-    # 生成图像
-    image_paths = []
-    for i, prompt in enumerate(prompts):
-        try:
-            # 生成图像
-            image, info = generate_image(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                width=width,
-                height=height,
-                model_id=model_id,
-                seed=None  # 使用随机种子
-            )
-            
-            # 保存图像
-            image_path = os.path.join(output_dir, f"scene_{i:03d}.png")
-            image.save(image_path)
+    # 按尺寸分组，同一批次内的图像尺寸必须相同
+    groups = {}
+    for i, size in enumerate(sizes):
+        groups.setdefault(size, []).append(i)
+    
+    image_paths = [os.path.join(output_dir, f"scene_{i:03d}.png") for i in range(len(prompts))]
+    for (width, height), indices in groups.items():
+        diffusion_width, diffusion_height = get_diffusion_size(width, height, low_res)
+        timings['diffusion_size'] = f"{diffusion_width}x{diffusion_height}"
+        group_batch_size = batch_size or get_auto_batch_size(diffusion_width, diffusion_height)
+        
+        for start in range(0, len(indices), group_batch_size):
+            batch = indices[start:start + group_batch_size]
+            check_cancelled(cancel_token)
             
-            # 添加到路径列表
-            image_paths.append(image_path)
+            if len(batch) > 1:
+                try:
+                    batch_start = time.time()
+                    outputs = generate_images_batch(
+                        [prompts[i] for i in batch],
+                        negative_prompt=negative_prompt,
+                        width=diffusion_width,
+                        height=diffusion_height,
+                        model_id=model_id,
+                        seeds=[seeds[i] for i in batch],
+                        on_step=scene_step_callback(on_step, batch),
+                        cancel_token=cancel_token,
+                        quality=quality
+                    )
+                    add_timing(timings, 'diffusion_seconds', time.time() - batch_start)
+                    for i, (image, info) in zip(batch, outputs):
+                        image.save(image_paths[i])
+                        if infos is not None:
+                            infos[i] = info
+                        if (diffusion_width, diffusion_height) != (width, height):
+                            upscale_scene_image(image_paths[i], width, height, timings)
+                        print(f"生成图像 {i+1}/{len(prompts)}: {image_paths[i]}")
+                        if on_progress is not None:
+                            on_progress(i)
+                    continue
+                except TaskCancelled:
+                    raise
+                except Exception as e:
+                    # 批量生成失败（如内存不足）时退回逐张生成
+                    print(f"批量生成图像失败，改为逐张生成: {e}")
             
-            print(f"生成图像 {i+1}/{len(prompts)}: {image_path}")
-        except Exception as e:
-            print(f"生成图像 {i+1}/{len(prompts)} 失败: {e}")
-            # 如果生成失败，创建一个空白图像
-            blank_image = Image.new('RGB', (width, height), color='white')
-            image_path = os.path.join(output_dir, f"scene_{i:03d}.png")
-            blank_image.save(image_path)
-            image_paths.append(image_path)
+            for i in batch:
+                info = {}
+                generate_scene_image(prompts[i], negative_prompt, image_paths[i], width, height, model_id, seeds[i],
+                                     on_step=scene_step_callback(on_step, [i]), cancel_token=cancel_token,
+                                     quality=quality, low_res=low_res, timings=timings, info=info)
+                if infos is not None and info:
+                    infos[i] = info
+                print(f"生成图像 {i+1}/{len(prompts)}: {image_paths[i]}")
+                if on_progress is not None:
+                    on_progress(i)
     
+    print(f"图像生成耗时: 扩散 {timings.get('diffusion_seconds', 0):.1f}s, "
+          f"放大 {timings.get('upscale_seconds', 0):.1f}s, 扩散分辨率 {timings.get('diffusion_size', '-')}")
     return image_paths
 
+def scene_step_callback(on_step, scene_indices):
+    """
+    把场景序号绑定到步骤回调上，on_step为None时返回None
+    """
+    if on_step is None:
+        return None
+    return lambda step, total_steps: on_step(scene_indices, step, total_steps)
+
 def cleanup_resources():
     """
-    清理资源，释放GPU内存
+    清理资源，卸载所有模型并释放GPU内存
     """
-    global pipeline_cache
-    
-    # 清空模型缓存
-    for model_id, pipeline in pipeline_cache.items():
-        del pipeline
-    
-    # 清空缓存字典
-    pipeline_cache = {}
-    
-    # 清理CUDA缓存
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    model_manager.clear()
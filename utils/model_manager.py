@@ -0,0 +1,173 @@
+import gc
+import time
+import threading
+from collections import OrderedDict
+
+class ModelManager:
+    """
+    常驻模型管理器，按实测内存占用限制同时加载的模型，超出上限时按最近最少使用（LRU）淘汰
+
+    - 同一个模型只加载一次，多个线程同时请求时后来者等待加载完成
+    - 加载完成后测量模型占用的内存，总占用超过上限时淘汰最久未使用的模型（至少保留一个）
+    - 记录每个模型的加载耗时和命中次数
+    """
+
+    def __init__(self, loader, measure=None, max_memory_mb=0, max_models=0, on_evict=None):
+        """
+        Args:
+            loader (callable): 加载函数 loader(key)，返回加载好的模型
+            measure (callable): 测量函数 measure(model)，返回模型占用的字节数
+            max_memory_mb (float): 常驻模型的总内存上限（MB），0表示不限制
+            max_models (int): 常驻模型数上限，0表示不限制
+            on_evict (callable): 模型被淘汰后调用 on_evict(key)，用于清理引用该模型的其他缓存并释放显存
+        """
+        self._loader = loader
+        self._measure = measure
+        self.max_memory_mb = max_memory_mb
+        self.max_models = max_models
+        self._on_evict = on_evict
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        获取模型，未加载时加载
+
+        Args:
+            key (str): 模型标识
+
+        Returns:
+            object: 加载好的模型
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry['hits'] += 1
+                    entry['last_used'] = time.time()
+                    self.hits += 1
+                    return entry['model']
+
+                # 其他线程正在加载同一个模型时等待其完成，不重复加载
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = threading.Event()
+                    self._loading[key] = loading
+                    self.misses += 1
+                    break
+            loading.wait()
+
+        try:
+            start = time.time()
+            model = self._loader(key)
+            load_seconds = time.time() - start
+            size = self._measure(model) if self._measure is not None else 0
+            print(f"加载模型 {key}: {load_seconds:.1f}s, {size / (1024 * 1024):.0f}MB")
+
+            with self._lock:
+                self._entries[key] = {
+                    'model': model,
+                    'bytes': size,
+                    'load_seconds': load_seconds,
+                    'hits': 0,
+                    'last_used': time.time()
+                }
+                evicted = self._evict_locked()
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            loading.set()
+
+        self._release(evicted)
+        return model
+
+    def contains(self, key):
+        """
+        模型是否已加载
+        """
+        with self._lock:
+            return key in self._entries
+
+    def evict(self, key):
+        """
+        卸载指定模型
+
+        Returns:
+            bool: 模型已加载并被卸载时返回True
+        """
+        with self._lock:
+            if self._entries.pop(key, None) is None:
+                return False
+            self.evictions += 1
+        self._release([key])
+        return True
+
+    def clear(self):
+        """
+        卸载所有模型
+        """
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self.evictions += len(keys)
+        self._release(keys)
+
+    def stats(self):
+        """
+        获取模型统计信息
+
+        Returns:
+            dict: 已加载模型（内存占用、加载耗时、命中次数）、总内存、命中率和淘汰次数
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'models': [
+                    {
+                        'key': key,
+                        'memory_mb': round(entry['bytes'] / (1024 * 1024), 1),
+                        'load_seconds': round(entry['load_seconds'], 2),
+                        'hits': entry['hits']
+                    }
+                    for key, entry in self._entries.items()
+                ],
+                'memory_mb': round(self._total_bytes_locked() / (1024 * 1024), 1),
+                'max_memory_mb': self.max_memory_mb,
+                'max_models': self.max_models,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+                'evictions': self.evictions
+            }
+
+    def _total_bytes_locked(self):
+        return sum(entry['bytes'] for entry in self._entries.values())
+
+    def _evict_locked(self):
+        # 淘汰最久未使用的模型，直到满足数量和内存上限；刚加载的模型位于末尾，总会保留
+        evicted = []
+        max_bytes = self.max_memory_mb * 1024 * 1024
+        while len(self._entries) > 1:
+            over_count = self.max_models > 0 and len(self._entries) > self.max_models
+            over_memory = max_bytes > 0 and self._total_bytes_locked() > max_bytes
+            if not (over_count or over_memory):
+                break
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            evicted.append(key)
+        return evicted
+
+    def _release(self, keys):
+        if not keys:
+            return
+        for key in keys:
+            print(f"卸载模型 {key}")
+            if self._on_evict is not None:
+                self._on_evict(key)
+        # 管理器不再持有模型的引用后回收，正在使用该模型的推理结束后内存即被释放
+        gc.collect()
@@ -0,0 +1,52 @@
+from config import QUALITY_TIERS, DEFAULT_QUALITY
+
+# 自动档位的基准：任务历史平均耗时按该档位的开销计算
+REFERENCE_TIER = 'standard'
+
+def get_quality_tier(name=None):
+    """
+    获取质量档位的参数
+
+    Args:
+        name (str): 档位名称（draft/standard/final），为None或无效时使用默认档位
+
+    Returns:
+        dict: 档位参数，包含 name、steps、guidance_scale、scale、scheduler
+    """
+    if name not in QUALITY_TIERS:
+        name = DEFAULT_QUALITY if DEFAULT_QUALITY in QUALITY_TIERS else REFERENCE_TIER
+    return dict(QUALITY_TIERS[name], name=name)
+
+def get_tier_cost(name):
+    """
+    估算档位相对于基准档位的生成开销
+
+    扩散推理的耗时大致与步数和像素数成正比
+
+    Returns:
+        float: 相对开销，基准档位为1.0
+    """
+    tier = get_quality_tier(name)
+    reference = get_quality_tier(REFERENCE_TIER)
+    return (tier['steps'] * tier['scale'] ** 2) / (reference['steps'] * reference['scale'] ** 2)
+
+def select_quality_tier(wait_seconds, task_seconds, slo_seconds):
+    """
+    根据排队等待时间和目标完成时间自动选择档位
+
+    从开销最高的档位开始，选择预计完成时间（等待时间 + 按档位开销折算的生成时间）不超过目标的档位；
+    都超过时使用开销最低的档位，高负载时降低画质而不是让队列无限增长
+
+    Args:
+        wait_seconds (float): 预计排队等待时间（秒）
+        task_seconds (float): 基准档位的单个任务耗时（秒）
+        slo_seconds (float): 目标完成时间（秒）
+
+    Returns:
+        str: 档位名称
+    """
+    names = sorted(QUALITY_TIERS, key=get_tier_cost, reverse=True)
+    for name in names:
+        if wait_seconds + task_seconds * get_tier_cost(name) <= slo_seconds:
+            return name
+    return names[-1]
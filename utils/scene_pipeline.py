@@ -0,0 +1,313 @@
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from config import TTS_MAX_CONCURRENCY, HLS_ENABLED
+from utils.text_processing import generate_scene_descriptions, generate_prompts, generate_negative_prompts
+from utils.image_generation import get_image_size_for_style, get_diffusion_size, generate_scene_image, upscale_scene_image, seed_from_text
+from utils.audio_generation import synthesize_speech, get_audio_extension
+from utils.video_creation import (create_scene_clip, create_transition_clip, concatenate_segments, get_scene_duration,
+                                  get_transition_duration, HLSPlaylist)
+from utils.task_manifest import TaskManifest, text_hash
+from utils.cancellation import check_cancelled
+
+class _SceneBoard:
+    """
+    记录每个场景各阶段的产出，编码阶段按顺序等待场景的图像和音频就绪
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._total = None
+        self._error = None
+        self._condition = threading.Condition()
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def failed(self):
+        return self._error is not None
+
+    def put(self, index, key, value):
+        with self._condition:
+            self._entries.setdefault(index, {})[key] = value
+            self._condition.notify_all()
+
+    def set_total(self, total):
+        with self._condition:
+            self._total = total
+            self._condition.notify_all()
+
+    def fail(self, error):
+        with self._condition:
+            if self._error is None:
+                self._error = error
+            self._condition.notify_all()
+
+    def wait(self, index):
+        """
+        等待指定场景的图像和音频都已生成
+
+        Returns:
+            dict: 包含 'image' 和 'audio' 的场景产出；场景不存在（已超出总数）时返回None
+        """
+        with self._condition:
+            while True:
+                if self._error is not None:
+                    raise self._error
+                entry = self._entries.get(index, {})
+                if 'image' in entry and 'audio' in entry:
+                    return entry
+                if self._total is not None and index >= self._total:
+                    return None
+                self._condition.wait()
+
+def _reuse_file(source_path, output_path):
+    """
+    把其他任务的产出放到当前任务目录：优先创建硬链接，不支持时复制
+
+    Returns:
+        str: output_path
+    """
+    if os.path.abspath(source_path) == os.path.abspath(output_path):
+        return output_path
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(source_path, output_path)
+    except OSError:
+        shutil.copy2(source_path, output_path)
+    return output_path
+
+def run_scene_pipeline(scenes, output_dir, style="default", voice_name=None, model_id=None,
+                       add_background_music=False, use_transitions=False, deterministic=False, manifest=None, stage=None,
+                       on_progress=None, on_step=None, cancel_token=None, quality=None, playlist=None,
+                       reuse=None):
+    """
+    以流式方式按场景执行 图像 → 音频 → 片段编码，最后只拼接预先编码好的片段
+
+    图像生成（计算密集）和语音合成（网络IO密集）在独立线程中同时进行，
+    某个场景的图像和音频都就绪后立即编码该场景的片段，
+    因此总耗时接近最慢阶段的耗时，而不是各阶段耗时之和
+
+    Args:
+        scenes (iterable): 场景文本，可以是列表或生成器
+        output_dir (str): 输出目录
+        style (str): 漫画风格
+        voice_name (str): 语音名称
+        model_id (str): 模型ID
+        add_background_music (bool): 是否添加背景音乐
+        use_transitions (bool): 是否在相邻场景之间插入过渡片段
+        deterministic (bool): 是否根据场景文本计算随机种子（可复现并命中图像缓存）
+        manifest (TaskManifest): 任务清单，为None时在输出目录中新建
+        stage (callable): 阶段并发限制，接收阶段名称返回上下文管理器（如TaskScheduler.stage）
+        on_progress (callable): 进度回调 on_progress(stage_name, scene_index, total)，总数未知时total为None
+        on_step (callable): 扩散推理步骤回调 on_step(scene_index, step, total_steps)
+        cancel_token (CancellationToken): 取消令牌，在扩散步骤、语音合成和片段编码之间检查
+        quality (str): 图像质量档位
+        playlist (HLSPlaylist): 渐进式HLS播放列表，每个片段编码完成后追加；
+                                为None且启用HLS时在输出目录的 hls 子目录中新建，并在结束时关闭
+        reuse (list): 每个场景可复用的产出（TaskManifest.plan_reuse 的返回值），复用的阶段不再重新生成
+
+    Returns:
+        dict: 包含 video_path（失败时为None）、image_paths、audio_paths、segment_paths（含过渡片段，按播放顺序）、
+              image_timings（扩散和放大阶段的累计耗时）、playlist_path（未启用HLS时为None）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 调用方传入的播放列表可能跨多次调用共享（如按章节生成），由调用方负责关闭
+    owns_playlist = playlist is None and HLS_ENABLED
+    if owns_playlist:
+        playlist = HLSPlaylist(os.path.join(output_dir, 'hls'))
+
+    if manifest is None:
+        manifest = TaskManifest(output_dir)
+    if stage is None:
+        stage = lambda name: nullcontext()
+
+    width, height = get_image_size_for_style(style, quality)
+    low_res = get_diffusion_size(width, height) != (width, height)
+    image_timings = {'diffusion_size': '%dx%d' % get_diffusion_size(width, height)}
+    negative_prompt = generate_negative_prompts(style)
+
+    board = _SceneBoard()
+    image_queue = queue.Queue()
+    audio_queue = queue.Queue()
+
+    def notify(stage_name, index):
+        if on_progress is not None:
+            on_progress(stage_name, index, board.total)
+
+    def reusable(index):
+        return reuse[index] if reuse is not None and index < len(reuse) else {}
+
+    def feed():
+        # 逐个读取场景并分发到图像和音频队列，支持惰性生成的场景
+        count = 0
+        try:
+            for i, scene in enumerate(scenes):
+                if board.failed:
+                    break
+                image_queue.put((i, scene))
+                audio_queue.put((i, scene))
+                count = i + 1
+        except Exception as e:
+            board.fail(e)
+        finally:
+            image_queue.put(None)
+            audio_queue.put(None)
+            board.set_total(count)
+
+    def image_worker():
+        while True:
+            item = image_queue.get()
+            if item is None or board.failed:
+                return
+            i, scene = item
+            try:
+                image_path = os.path.join(output_dir, f"scene_{i:03d}.png")
+                plan = reusable(i)
+                if 'image_path' in plan:
+                    _reuse_file(plan['image_path'], image_path)
+                    prompt, seed = plan.get('prompt'), plan.get('seed')
+                    print(f"复用图像 {i+1}: {plan['image_path']}")
+                else:
+                    description = generate_scene_descriptions([scene])[0]
+                    prompt = generate_prompts([description], style)[0]
+                    seed = seed_from_text(scene) if deterministic else None
+                    step_callback = (lambda step, total_steps: on_step(i, step, total_steps)) if on_step else None
+                    info = {}
+                    with stage('image'):
+                        check_cancelled(cancel_token)
+                        generate_scene_image(prompt, negative_prompt, image_path, width, height, model_id, seed,
+                                             on_step=step_callback, cancel_token=cancel_token, quality=quality,
+                                             upscale=False, timings=image_timings, info=info)
+                    # 放大阶段不占用图像阶段的并发名额，下一个场景的扩散可以立即开始
+                    if low_res:
+                        upscale_scene_image(image_path, width, height, image_timings)
+                    seed = info.get('seed')
+                    print(f"生成图像 {i+1}: {image_path}")
+                manifest.update_scene(i, text=scene, text_hash=text_hash(scene), prompt=prompt, seed=seed,
+                                      image_path=image_path)
+                board.put(i, 'image', image_path)
+                notify('image', i)
+            except Exception as e:
+                board.fail(e)
+                return
+
+    def synthesize(i, scene):
+        try:
+            plan = reusable(i)
+            if 'audio_path' in plan:
+                # 沿用原音频的扩展名，语音合成后端可能已经更换
+                extension = os.path.splitext(plan['audio_path'])[1]
+                audio_path = _reuse_file(plan['audio_path'], os.path.join(output_dir, f"scene_{i:03d}{extension}"))
+                metadata = {'duration': plan.get('duration')}
+            else:
+                audio_path = os.path.join(output_dir, f"scene_{i:03d}{get_audio_extension()}")
+                with stage('tts'):
+                    check_cancelled(cancel_token)
+                    metadata = synthesize_speech(text=scene, output_path=audio_path, voice_name=voice_name)
+            success = metadata is not None
+            duration = metadata.get('duration') if success else None
+            manifest.update_scene(i, audio_path=audio_path if success else None, duration=duration)
+            board.put(i, 'duration', duration)
+            board.put(i, 'audio', audio_path if success else None)
+            print(f"生成音频 {i+1}{'' if success else ' 失败'}: {audio_path}")
+            notify('audio', i)
+        except Exception as e:
+            board.fail(e)
+
+    def audio_worker():
+        # 语音合成是网络IO密集型，多个场景并发合成，请求速率由令牌桶统一控制
+        with ThreadPoolExecutor(max_workers=max(1, TTS_MAX_CONCURRENCY)) as executor:
+            while True:
+                item = audio_queue.get()
+                if item is None or board.failed:
+                    return
+                executor.submit(synthesize, *item)
+
+    threads = [
+        threading.Thread(target=feed, daemon=True),
+        threading.Thread(target=image_worker, daemon=True),
+        threading.Thread(target=audio_worker, daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # 在当前线程中按顺序编码各场景片段
+    image_paths = []
+    audio_paths = []
+    segment_paths = []
+    try:
+        index = 0
+        while True:
+            entry = board.wait(index)
+            if entry is None:
+                break
+            check_cancelled(cancel_token)
+
+            # 前一场景的图像已就绪，先编码两者之间的过渡片段；过渡占用本场景开头的时间并播放其旁白开头
+            plan = reusable(index)
+            lead_in = 0.0
+            if use_transitions and index > 0:
+                lead_in = get_transition_duration(get_scene_duration(entry['audio'], entry.get('duration')))
+                transition_path = os.path.join(output_dir, f"transition_{index:03d}.mp4")
+                if 'transition_path' in plan:
+                    _reuse_file(plan['transition_path'], transition_path)
+                else:
+                    with stage('encode'):
+                        create_transition_clip(image_paths[-1], entry['image'], transition_path, duration=lead_in,
+                                               audio_path=entry['audio'])
+                manifest.update_scene(index, transition_path=transition_path)
+                segment_paths.append(transition_path)
+                if playlist is not None:
+                    playlist.append(transition_path)
+            
+            segment_path = os.path.join(output_dir, f"segment_{index:03d}.mp4")
+            if 'segment_path' in plan:
+                _reuse_file(plan['segment_path'], segment_path)
+            else:
+                with stage('encode'):
+                    create_scene_clip(entry['image'], entry['audio'], segment_path, audio_duration=entry.get('duration'),
+                                      lead_in=lead_in)
+            manifest.update_scene(index, segment_path=segment_path, lead_in=lead_in)
+            if playlist is not None:
+                playlist.append(segment_path)
+
+            image_paths.append(entry['image'])
+            audio_paths.append(entry['audio'])
+            segment_paths.append(segment_path)
+            notify('segment', index)
+            index += 1
+    except Exception:
+        board.fail(RuntimeError("场景片段编码失败"))
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        if owns_playlist:
+            playlist.finish()
+
+    # 拼接所有片段
+    video_path = None
+    if segment_paths:
+        with stage('encode'):
+            video_path = concatenate_segments(
+                segment_paths,
+                os.path.join(output_dir, 'output.mp4'),
+                add_background_music=add_background_music
+            )
+
+    return {
+        'video_path': video_path,
+        'image_paths': image_paths,
+        'audio_paths': audio_paths,
+        'segment_paths': segment_paths,
+        'image_timings': image_timings,
+        'playlist_path': playlist.playlist_path if playlist is not None else None
+    }
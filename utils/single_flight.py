@@ -0,0 +1,184 @@
+import threading
+from utils.disk_cache import make_cache_key
+from utils.cancellation import check_cancelled
+
+def request_fingerprint(**fields):
+    """
+    根据决定生成结果的全部参数计算请求指纹，参数相同的请求指纹相同
+
+    Returns:
+        str: SHA-256 十六进制摘要
+    """
+    return make_cache_key(fields)
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.failed = False
+
+class SingleFlight:
+    """
+    同一个键的并发调用只执行一次，其他调用者等待并共享结果
+
+    用于图像生成、语音合成等缓存未命中时的昂贵调用：多个任务同时需要同一张图像或同一段语音时，
+    只有第一个调用者（leader）真正执行，其余调用者等待其完成后直接使用结果。
+    leader 失败（包括被取消）时不共享异常，等待者重新竞争执行，不会因为其他任务被取消而失败
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, func, *args, cancel_token=None, **kwargs):
+        """
+        执行 func(*args, **kwargs)，同一个键正在执行时等待其结果
+
+        Args:
+            key (str): 调用的键，相同键的调用结果必须可以互相替代
+            func (callable): 要执行的函数
+            cancel_token (CancellationToken): 等待期间检查的取消令牌
+
+        Returns:
+            object: func 的返回值
+        """
+        while True:
+            leader = self.try_lead(key)
+            if leader is not None:
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException:
+                    self.finish(key, leader, failed=True)
+                    raise
+                self.finish(key, leader, result)
+                return result
+
+            with self._lock:
+                call = self._calls.get(key)
+            if call is None:
+                # leader 刚好完成，重新竞争（结果通常已在缓存中）
+                continue
+
+            # 等待期间定期检查取消，已取消的任务不必等到其他任务生成完成
+            while not call.event.wait(timeout=1.0):
+                check_cancelled(cancel_token)
+            if not call.failed:
+                with self._lock:
+                    self.shared += 1
+                return call.result
+
+    def try_lead(self, key):
+        """
+        不等待地尝试成为键的 leader，用于批量执行：调用方自行执行后必须调用 finish()
+
+        Args:
+            key (str): 调用的键
+
+        Returns:
+            object: 成为 leader 时返回调用句柄；该键正在由其他调用者执行时返回None
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = self._calls[key] = _Call()
+            self.executions += 1
+            return call
+
+    def finish(self, key, call, result=None, failed=False):
+        """
+        结束 try_lead() 开始的调用，唤醒等待者
+
+        Args:
+            key (str): 调用的键
+            call (object): try_lead() 返回的调用句柄
+            result (object): 执行结果，等待者共享
+            failed (bool): 执行是否失败，失败时等待者重新竞争执行
+        """
+        call.result = result
+        call.failed = failed
+        with self._lock:
+            self._calls.pop(key, None)
+        call.event.set()
+
+    def stats(self):
+        """
+        获取统计信息
+
+        Returns:
+            dict: 正在执行的键数、实际执行次数和共享结果的次数
+        """
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'executions': self.executions,
+                'shared': self.shared
+            }
+
+class RequestRegistry:
+    """
+    请求指纹到任务ID的登记表，相同的生成请求复用已有的任务
+
+    正在排队或执行的任务：重复提交直接关联到该任务；已完成的任务：直接返回其视频。
+    登记的任务失败、被取消或已被回收时（由调用方的 is_reusable 判断）重新登记为新任务。
+    登记保存在任务存储中（SQLite表或Redis键），多个Web进程共享，超过保留时间后过期
+    """
+
+    def __init__(self, task_store, ttl_seconds=86400):
+        """
+        Args:
+            task_store (TaskStore): 保存登记的任务存储
+            ttl_seconds (float): 登记的保留时间（秒）
+        """
+        self.task_store = task_store
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.attached = 0
+
+    def claim(self, fingerprint, task_id, is_reusable):
+        """
+        查找指纹对应的可复用任务，没有时把 task_id 登记为该指纹的任务
+
+        登记和替换都是任务存储中的原子操作，同时到达的相同请求（包括其他进程中的）只会创建一个任务
+
+        Args:
+            fingerprint (str): 请求指纹
+            task_id (str): 新任务的ID
+            is_reusable (callable): is_reusable(task_id)，已登记的任务仍可复用时返回True
+
+        Returns:
+            str: 可复用的已有任务ID；新登记时返回 task_id
+        """
+        while True:
+            if self.task_store.claim_request(fingerprint, task_id, self.ttl_seconds):
+                return task_id
+            existing = self.task_store.request_owner(fingerprint)
+            if existing is None:
+                # 登记刚好过期或被释放，重新登记
+                continue
+            if existing != task_id and is_reusable(existing):
+                with self._lock:
+                    self.attached += 1
+                return existing
+            # 已登记的任务不可复用：只在登记仍指向它时替换，被其他请求抢先替换时重新查找
+            if self.task_store.replace_request(fingerprint, existing, task_id, self.ttl_seconds):
+                return task_id
+
+    def release(self, fingerprint, task_id):
+        """
+        撤销 task_id 的登记（任务未能提交时调用），相同的请求之后重新创建任务
+        """
+        self.task_store.release_request(fingerprint, task_id)
+
+    def stats(self):
+        """
+        获取统计信息
+
+        Returns:
+            dict: 本进程中复用已有任务的次数
+        """
+        with self._lock:
+            return {
+                'attached': self.attached
+            }
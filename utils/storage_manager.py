@@ -0,0 +1,315 @@
+import os
+import time
+import shutil
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 输出根目录下的回收锁文件：多个Web进程共享输出目录时只有持有锁的进程运行回收线程
+LOCK_FILENAME = '.reaper.lock'
+
+# 最终产物：视频和任务清单，磁盘空间不足时最后才删除
+FINAL_FILENAMES = ('output.mp4', 'manifest.json')
+
+def is_final_file(filename):
+    """
+    是否为最终产物（其余的场景图像、音频和视频片段为中间产物）
+    """
+    return os.path.basename(filename) in FINAL_FILENAMES
+
+def measure_folder(path):
+    """
+    统计任务目录中中间产物和最终产物的字节数
+
+    Returns:
+        tuple: (中间产物字节数, 最终产物字节数)
+    """
+    intermediate, final = 0, 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size = os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+            if is_final_file(name):
+                final += size
+            else:
+                intermediate += size
+    return intermediate, final
+
+class StorageManager:
+    """
+    任务输出目录的后台回收器
+
+    - 启动时扫描一次输出目录建立索引，之后按任务的最近访问时间维护LRU顺序，不再反复遍历文件
+    - 超过保留时间（TTL）未访问的任务目录整体删除
+    - 总占用超过配额时，先按LRU顺序删除中间产物（场景图像、音频、视频片段），仍超出时再删除整个任务目录
+    - 正在排队或执行的任务不会被回收
+    - 多个进程共享输出目录时，通过文件锁只在一个进程中运行回收线程；
+      各进程的访问记录写入任务目录的修改时间，回收前合并进索引
+    """
+
+    def __init__(self, root, quota_bytes=0, ttl_seconds=0, interval_seconds=300, is_active=None, on_remove=None,
+                 on_trim=None):
+        """
+        Args:
+            root (str): 输出根目录，每个子目录是一个任务
+            quota_bytes (int): 总占用上限（字节），0表示不限制
+            ttl_seconds (float): 任务目录的保留时间（秒），从最近一次访问开始计算，0表示不过期
+            interval_seconds (float): 后台回收的间隔（秒）
+            is_active (callable): is_active(task_id)，任务仍在排队或执行时返回True
+            on_remove (callable): 任务目录被整体删除后调用 on_remove(task_id)，用于清理任务记录
+            on_trim (callable): 任务的中间产物（含HLS播放列表和分片）被删除后调用 on_trim(task_id)，
+                                用于清除任务记录中指向这些文件的地址
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.interval_seconds = interval_seconds
+        self._is_active = is_active
+        self._on_remove = on_remove
+        self._on_trim = on_trim
+        self._index = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._lock_file = None
+        self.reclaimed_bytes = 0
+        self.evictions = 0
+        self.intermediate_evictions = 0
+        self.expirations = 0
+
+    def start(self):
+        """
+        启动后台回收线程（重复调用无副作用），其他进程已在回收同一输出目录时不启动
+
+        Returns:
+            bool: 本进程负责回收时返回True
+        """
+        with self._lock:
+            if self._thread is not None:
+                return True
+            if not self._acquire_reaper_lock():
+                print("其他进程正在回收输出目录，本进程不启动回收线程")
+                return False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            return True
+
+    def touch(self, task_id):
+        """
+        记录任务目录被访问（查询状态、下载视频），刷新其LRU位置和过期时间
+        """
+        # 访问时间同时写到目录的修改时间上，运行回收线程的进程据此得知其他进程的访问
+        try:
+            os.utime(os.path.join(self.root, task_id))
+        except OSError:
+            pass
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(task_id)
+            if entry is not None:
+                entry['last_access'] = time.time()
+                index.move_to_end(task_id)
+
+    def refresh(self, task_id):
+        """
+        重新统计任务目录的占用（任务完成时调用）
+        """
+        path = os.path.join(self.root, task_id)
+        if not os.path.isdir(path):
+            return
+        intermediate, final = measure_folder(path)
+        # 任务仍在执行时统计的占用还会增长，任务结束后的下一次回收时重新统计
+        pending = self._active(task_id)
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(task_id)
+            if entry is None:
+                entry = index[task_id] = {'last_access': time.time()}
+            entry['intermediate_bytes'] = intermediate
+            entry['final_bytes'] = final
+            entry['pending'] = pending
+            index.move_to_end(task_id)
+
+    def reap(self):
+        """
+        执行一次回收：先删除过期的任务目录，再按配额淘汰
+
+        Returns:
+            int: 本次回收的字节数
+        """
+        self._discover()
+        self._sync_access_times()
+        for task_id, entry in self._entries():
+            if entry.get('pending') and not self._active(task_id):
+                self.refresh(task_id)
+        reclaimed = 0
+        now = time.time()
+
+        # 过期的任务目录整体删除
+        if self.ttl_seconds > 0:
+            for task_id, entry in self._entries():
+                if now - entry['last_access'] > self.ttl_seconds and not self._active(task_id):
+                    reclaimed += self._remove_task(task_id)
+                    self.expirations += 1
+
+        if self.quota_bytes > 0:
+            # 先删除中间产物：视频已生成，中间产物只在重新生成时才用到
+            for task_id, entry in self._entries():
+                if self.total_bytes() <= self.quota_bytes:
+                    break
+                if entry['intermediate_bytes'] > 0 and not self._active(task_id):
+                    reclaimed += self._remove_intermediates(task_id)
+
+            # 仍超出配额时删除最久未访问的整个任务目录
+            for task_id, entry in self._entries():
+                if self.total_bytes() <= self.quota_bytes:
+                    break
+                if not self._active(task_id):
+                    reclaimed += self._remove_task(task_id)
+                    self.evictions += 1
+
+        if reclaimed:
+            print(f"回收输出目录空间 {reclaimed / (1024 * 1024):.1f}MB")
+        return reclaimed
+
+    def total_bytes(self):
+        """
+        当前索引中所有任务目录的总占用（字节）
+        """
+        with self._lock:
+            return sum(e['intermediate_bytes'] + e['final_bytes'] for e in self._load_index().values())
+
+    def stats(self):
+        """
+        获取回收统计信息
+
+        Returns:
+            dict: 任务目录数、总占用、配额、累计回收字节数和各类淘汰次数
+        """
+        total = self.total_bytes()
+        with self._lock:
+            return {
+                'folders': len(self._load_index()),
+                'bytes': total,
+                'quota_bytes': self.quota_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'reclaimed_bytes': self.reclaimed_bytes,
+                'evictions': self.evictions,
+                'intermediate_evictions': self.intermediate_evictions,
+                'expirations': self.expirations
+            }
+
+    def _run(self):
+        while True:
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"回收输出目录失败: {e}")
+            time.sleep(self.interval_seconds)
+
+    def _active(self, task_id):
+        return self._is_active is not None and self._is_active(task_id)
+
+    def _entries(self):
+        # 按LRU顺序（最久未访问在前）返回快照，遍历时可以修改索引
+        with self._lock:
+            return list(self._load_index().items())
+
+    def _load_index(self):
+        # 首次使用时扫描输出目录，以目录的修改时间作为初始访问时间
+        if self._index is None:
+            self._index = OrderedDict()
+            entries = []
+            if os.path.isdir(self.root):
+                for item in os.scandir(self.root):
+                    if item.is_dir():
+                        intermediate, final = measure_folder(item.path)
+                        entries.append((item.stat().st_mtime, item.name, intermediate, final))
+            for mtime, task_id, intermediate, final in sorted(entries):
+                self._index[task_id] = {
+                    'last_access': mtime,
+                    'intermediate_bytes': intermediate,
+                    'final_bytes': final,
+                    'pending': self._active(task_id)
+                }
+        return self._index
+
+    def _acquire_reaper_lock(self):
+        # 非阻塞地获取输出目录的文件锁，进程退出时锁自动释放；不支持fcntl的平台上总是回收
+        if fcntl is None:
+            return True
+        os.makedirs(self.root, exist_ok=True)
+        lock_file = open(os.path.join(self.root, LOCK_FILENAME), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _sync_access_times(self):
+        # 其他进程的访问记录在任务目录的修改时间上，合并进索引并按访问时间重新排列LRU顺序
+        mtimes = {}
+        for task_id, _ in self._entries():
+            try:
+                mtimes[task_id] = os.stat(os.path.join(self.root, task_id)).st_mtime
+            except OSError:
+                continue
+        with self._lock:
+            index = self._load_index()
+            for task_id, mtime in mtimes.items():
+                entry = index.get(task_id)
+                if entry is not None and mtime > entry['last_access']:
+                    entry['last_access'] = mtime
+            self._index = OrderedDict(sorted(index.items(), key=lambda item: item[1]['last_access']))
+
+    def _discover(self):
+        # 只列出顶层目录名，发现未登记的新任务目录（如其他进程创建的）时才统计其占用
+        if not os.path.isdir(self.root):
+            return
+        with self._lock:
+            known = set(self._load_index())
+        for item in os.scandir(self.root):
+            if item.is_dir() and item.name not in known:
+                self.refresh(item.name)
+
+    def _remove_task(self, task_id):
+        path = os.path.join(self.root, task_id)
+        with self._lock:
+            entry = self._load_index().pop(task_id, None)
+        size = entry['intermediate_bytes'] + entry['final_bytes'] if entry else 0
+        shutil.rmtree(path, ignore_errors=True)
+        self.reclaimed_bytes += size
+        if self._on_remove is not None:
+            self._on_remove(task_id)
+        return size
+
+    def _remove_intermediates(self, task_id):
+        path = os.path.join(self.root, task_id)
+        removed = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                if is_final_file(name):
+                    continue
+                file_path = os.path.join(root, name)
+                try:
+                    size = os.path.getsize(file_path)
+                    os.remove(file_path)
+                    removed += size
+                except OSError:
+                    pass
+        with self._lock:
+            entry = self._load_index().get(task_id)
+            if entry is not None:
+                entry['intermediate_bytes'] = 0
+        self.reclaimed_bytes += removed
+        self.intermediate_evictions += 1
+        if self._on_trim is not None:
+            self._on_trim(task_id)
+        return removed
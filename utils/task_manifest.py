@@ -0,0 +1,176 @@
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# 影响图像内容的任务参数：这些参数不变且场景文本不变时图像可以复用
+# （包括推理后端、低分辨率扩散和放大方法，它们改变输出像素）
+IMAGE_OPTIONS = ('style', 'quality', 'model_id', 'image_backend', 'low_res_diffusion', 'low_res_scale', 'upscaler')
+# 影响语音的任务参数
+AUDIO_OPTIONS = ('voice',)
+
+def text_hash(text):
+    """
+    计算场景文本的哈希，用于比较修改前后的场景
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def _exists(path):
+    return bool(path) and os.path.exists(path)
+
+class TaskManifest:
+    """
+    任务清单：记录每个场景在各阶段的产出（图像、音频、时长等），保存在任务输出目录的 manifest.json 中
+
+    各阶段只写入自己产出的字段，后续阶段直接读取，不再重复探测或解码文件
+    """
+
+    def __init__(self, output_dir):
+        """
+        Args:
+            output_dir (str): 任务输出目录
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self._data = {'options': {}, 'scenes': []}
+
+    @classmethod
+    def load(cls, output_dir):
+        """
+        从任务输出目录加载清单，文件不存在时返回空清单
+
+        Args:
+            output_dir (str): 任务输出目录
+
+        Returns:
+            TaskManifest: 任务清单
+        """
+        manifest = cls(output_dir)
+        if os.path.exists(manifest.path):
+            try:
+                with open(manifest.path, 'r', encoding='utf-8') as f:
+                    manifest._data = json.load(f)
+                manifest._data.setdefault('options', {})
+                manifest._data.setdefault('scenes', [])
+            except (OSError, ValueError) as e:
+                print(f"读取任务清单失败 {manifest.path}: {e}")
+        return manifest
+
+    def update_options(self, **fields):
+        """
+        更新任务级别的参数并保存（原文、风格、语音、质量档位等），修改任务时作为比较基准和默认值
+        """
+        with self._lock:
+            self._data['options'].update(fields)
+            self._save_locked()
+
+    def options(self):
+        """
+        获取任务级别参数的副本
+        """
+        with self._lock:
+            return dict(self._data['options'])
+
+    def update_scene(self, index, **fields):
+        """
+        更新指定场景的字段并保存
+
+        Args:
+            index (int): 场景序号
+            **fields: 要更新的字段，如 audio_path、duration
+        """
+        with self._lock:
+            scenes = self._data['scenes']
+            while len(scenes) <= index:
+                scenes.append({})
+            scenes[index].update(fields)
+            self._save_locked()
+
+    def get_scene(self, index):
+        """
+        获取指定场景的记录
+
+        Returns:
+            dict: 场景记录，不存在时返回空字典
+        """
+        with self._lock:
+            scenes = self._data['scenes']
+            return dict(scenes[index]) if index < len(scenes) else {}
+
+    def scenes(self):
+        """
+        获取所有场景记录的副本
+        """
+        with self._lock:
+            return [dict(scene) for scene in self._data['scenes']]
+
+    def durations(self):
+        """
+        获取各场景记录的音频时长列表，未记录的为None
+        """
+        return [scene.get('duration') for scene in self.scenes()]
+
+    def plan_reuse(self, scenes, options):
+        """
+        比较修改后的场景和参数与本清单的记录，确定每个场景哪些阶段的产出可以复用
+
+        场景按文本哈希匹配（插入或删除句子后其余场景仍可复用）：
+        - 图像：文本相同且风格、质量档位、模型不变，且不是生成失败时的空白图像
+        - 音频：文本相同且语音不变
+        - 场景片段：图像和音频都复用自同一个旧场景，且开头是否被过渡片段占用（lead_in）不变
+        - 过渡片段：相邻两个场景的图像和后一场景的音频都复用，且在旧任务中也相邻
+
+        Args:
+            scenes (list): 修改后的场景文本
+            options (dict): 修改后的任务参数
+
+        Returns:
+            list: 每个场景的可复用产出，键为 image_path、prompt、seed、audio_path、duration、segment_path、transition_path，
+                  不可复用的阶段没有对应的键
+        """
+        old_options = self.options()
+        image_same = all(old_options.get(key) == options.get(key) for key in IMAGE_OPTIONS)
+        audio_same = all(old_options.get(key) == options.get(key) for key in AUDIO_OPTIONS)
+        transitions_same = bool(old_options.get('use_transitions')) and bool(options.get('use_transitions'))
+
+        # 文本哈希 → (旧场景序号, 记录)，重复的文本使用第一次出现的场景
+        old_scenes = {}
+        for index, record in enumerate(self.scenes()):
+            key = record.get('text_hash') or (text_hash(record['text']) if record.get('text') else None)
+            if key is not None:
+                old_scenes.setdefault(key, (index, record))
+
+        plans = []
+        sources = []
+        for new_index, scene in enumerate(scenes):
+            plan = {}
+            old_index, record = old_scenes.get(text_hash(scene), (None, {}))
+            # 生成失败时保存的空白图像没有记录种子，不复用
+            if image_same and record.get('seed') is not None and _exists(record.get('image_path')):
+                plan.update(image_path=record['image_path'], prompt=record.get('prompt'), seed=record.get('seed'))
+            if audio_same and _exists(record.get('audio_path')):
+                plan.update(audio_path=record['audio_path'], duration=record.get('duration'))
+            # 有过渡片段时场景片段从旁白的 lead_in 处开始编码，开头是否被占用必须一致
+            lead_in_same = bool(record.get('lead_in')) == (bool(options.get('use_transitions')) and new_index > 0)
+            if ('image_path' in plan and 'audio_path' in plan and lead_in_same
+                    and _exists(record.get('segment_path'))):
+                plan['segment_path'] = record['segment_path']
+
+            # 过渡片段由前后两个场景的图像和后一场景旁白的开头决定
+            if (transitions_same and sources and old_index is not None and sources[-1] == old_index - 1
+                    and 'image_path' in plan and 'audio_path' in plan and _exists(record.get('transition_path'))):
+                plan['transition_path'] = record['transition_path']
+
+            plans.append(plan)
+            sources.append(old_index if 'image_path' in plan else None)
+        return plans
+
+    def _save_locked(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
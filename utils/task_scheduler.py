@@ -0,0 +1,236 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+class QueueFullError(Exception):
+    """
+    任务队列已满时抛出的异常
+    """
+    def __init__(self, queue_size, retry_after):
+        super().__init__(f"任务队列已满（{queue_size}）")
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+
+class TaskScheduler:
+    """
+    固定工作线程数的任务调度器
+
+    - 固定数量的流水线工作线程，避免每个请求一个线程
+    - 有界等待队列，队列满时拒绝新任务（准入控制）
+    - 按阶段（图像/语音/编码）限制并发数
+    - 根据历史任务耗时估算排队位置和预计等待时间
+    """
+
+    def __init__(self, num_workers=2, max_queue_size=20, stage_limits=None, estimated_task_seconds=180,
+                 on_queue_change=None):
+        """
+        Args:
+            num_workers (int): 工作线程数
+            max_queue_size (int): 等待队列最大长度
+            stage_limits (dict): 各阶段的最大并发数，如 {'image': 1, 'tts': 4, 'encode': 2}
+            estimated_task_seconds (float): 没有历史数据时单个任务的预估耗时（秒）
+            on_queue_change (callable): on_queue_change(task_ids)，任务出队或被取消后以仍在排队的任务ID调用，
+                                        用于向排队中的任务推送新的排队位置
+        """
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self.estimated_task_seconds = estimated_task_seconds
+        self.on_queue_change = on_queue_change
+
+        # 等待队列：保存任务ID，任务内容单独存放，便于计算排队位置
+        self._pending = deque()
+        self._jobs = {}
+        self._running = {}
+        self._condition = threading.Condition()
+
+        # 各阶段的并发限制
+        self._stage_semaphores = {}
+        for stage, limit in (stage_limits or {}).items():
+            self._stage_semaphores[stage] = threading.BoundedSemaphore(max(1, limit))
+
+        # 最近完成任务的耗时，用于估算等待时间
+        self._durations = deque(maxlen=20)
+        self._workers = []
+        self._started = False
+
+    def start(self):
+        """
+        启动工作线程（重复调用无副作用）
+        """
+        with self._condition:
+            if self._started:
+                return
+            self._started = True
+
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"pipeline-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, task_id, func, *args, **kwargs):
+        """
+        提交任务到等待队列
+
+        Args:
+            task_id (str): 任务ID
+            func (callable): 任务函数
+            *args, **kwargs: 传递给任务函数的参数
+
+        Returns:
+            int: 任务在队列中的位置（从1开始）
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        with self._condition:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(self.max_queue_size, self._estimate_wait_locked(len(self._pending) + 1))
+
+            self._jobs[task_id] = (func, args, kwargs)
+            self._pending.append(task_id)
+            self._condition.notify()
+            return len(self._pending)
+
+    def queue_position(self, task_id):
+        """
+        获取任务的排队位置
+
+        Returns:
+            int: 排队位置（从1开始），任务不在队列中时返回None
+        """
+        with self._condition:
+            try:
+                return self._pending.index(task_id) + 1
+            except ValueError:
+                return None
+
+    def cancel(self, task_id):
+        """
+        从等待队列中移除尚未开始执行的任务
+
+        Returns:
+            bool: 任务在队列中并已移除时返回True；已开始执行或不存在时返回False
+        """
+        with self._condition:
+            if task_id not in self._jobs:
+                return False
+            self._pending.remove(task_id)
+            self._jobs.pop(task_id)
+            waiting = list(self._pending)
+        self._notify_queue_change(waiting)
+        return True
+
+    def estimate_wait(self, position):
+        """
+        估算排在指定位置的任务开始执行前需要等待的时间
+
+        Args:
+            position (int): 排队位置（从1开始）
+
+        Returns:
+            float: 预计等待时间（秒）
+        """
+        with self._condition:
+            return self._estimate_wait_locked(position)
+
+    def estimate_completion(self, position):
+        """
+        估算排在指定位置的任务完成前需要的时间（等待时间加一个任务的平均耗时）
+
+        Args:
+            position (int): 排队位置（从1开始）
+
+        Returns:
+            float: 预计完成时间（秒）
+        """
+        with self._condition:
+            return self._estimate_wait_locked(position) + self._average_task_seconds_locked()
+
+    def average_task_seconds(self):
+        """
+        获取最近任务的平均耗时（秒）
+        """
+        with self._condition:
+            return self._average_task_seconds_locked()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        在指定阶段的并发限制内执行代码块
+
+        Args:
+            name (str): 阶段名称，如 'image'、'tts'、'encode'
+        """
+        semaphore = self._stage_semaphores.get(name)
+        if semaphore is None:
+            yield
+            return
+
+        semaphore.acquire()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def stats(self):
+        """
+        获取调度器状态
+
+        Returns:
+            dict: 队列长度、运行中任务数等信息
+        """
+        with self._condition:
+            return {
+                'workers': self.num_workers,
+                'queued': len(self._pending),
+                'running': len(self._running),
+                'max_queue_size': self.max_queue_size,
+                'average_task_seconds': round(self._average_task_seconds_locked(), 2)
+            }
+
+    def _average_task_seconds_locked(self):
+        if not self._durations:
+            return self.estimated_task_seconds
+        return sum(self._durations) / len(self._durations)
+
+    def _estimate_wait_locked(self, position):
+        average = self._average_task_seconds_locked()
+        now = time.time()
+
+        # 正在运行任务的剩余时间
+        remaining = [max(average - (now - started), 0) for started in self._running.values()]
+        remaining = sorted(remaining + [0.0] * (self.num_workers - len(remaining)))
+
+        # 排在前面的任务按轮次分配到各工作线程
+        rounds, slot = divmod(position - 1, self.num_workers)
+        return remaining[slot] + rounds * average
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                task_id = self._pending.popleft()
+                func, args, kwargs = self._jobs.pop(task_id)
+                started = time.time()
+                self._running[task_id] = started
+                waiting = list(self._pending)
+
+            self._notify_queue_change(waiting)
+            try:
+                func(task_id, *args, **kwargs)
+            except Exception as e:
+                print(f"任务执行异常 {task_id}: {e}")
+            finally:
+                with self._condition:
+                    self._running.pop(task_id, None)
+                    self._durations.append(time.time() - started)
+
+    def _notify_queue_change(self, task_ids):
+        if self.on_queue_change is None or not task_ids:
+            return
+        try:
+            self.on_queue_change(task_ids)
+        except Exception as e:
+            print(f"推送排队位置失败: {e}")
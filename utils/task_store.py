@@ -0,0 +1,470 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class TaskStore:
+    """
+    任务状态存储接口
+
+    任务状态保存在进程外部（SQLite文件或Redis），服务重启后状态不丢失，
+    多个Web进程共享同一份任务状态
+    """
+
+    def create(self, task_id, data):
+        """
+        创建任务记录
+
+        Args:
+            task_id (str): 任务ID
+            data (dict): 任务状态，需包含 start_time
+        """
+        raise NotImplementedError
+
+    def get(self, task_id):
+        """
+        获取任务状态
+
+        Returns:
+            dict: 任务状态，不存在时返回None
+        """
+        raise NotImplementedError
+
+    def update(self, task_id, **fields):
+        """
+        原子地更新任务的部分字段，其他字段保持不变
+
+        Returns:
+            bool: 任务存在并已更新时返回True
+        """
+        raise NotImplementedError
+
+    def increment(self, task_id, field, amount=1):
+        """
+        原子地增加任务的计数字段，适用于多个进程同时汇报完成数量
+
+        Returns:
+            int: 增加后的值，任务不存在时返回None
+        """
+        raise NotImplementedError
+
+    def advance(self, task_id, field, value):
+        """
+        原子地把数值字段更新为更大的值，当前值不小于 value 时不写入，并发的更新不会让字段回退
+
+        Returns:
+            bool: 字段确实被更新时返回True（任务不存在或值未增大时返回False）
+        """
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        """
+        删除任务记录
+        """
+        raise NotImplementedError
+
+    def recent(self, limit=10):
+        """
+        按开始时间从新到旧获取最近的任务
+
+        Returns:
+            list: (task_id, 任务状态) 列表
+        """
+        raise NotImplementedError
+
+    def started_before(self, timestamp):
+        """
+        获取开始时间早于指定时间的任务
+
+        Returns:
+            list: (task_id, 任务状态) 列表
+        """
+        raise NotImplementedError
+
+    def claim_request(self, fingerprint, task_id, ttl_seconds):
+        """
+        原子地把请求指纹登记到任务，指纹已登记（且未过期）时不覆盖
+
+        Returns:
+            bool: 登记成功时返回True
+        """
+        raise NotImplementedError
+
+    def request_owner(self, fingerprint):
+        """
+        获取请求指纹登记的任务ID
+
+        Returns:
+            str: 任务ID，未登记或已过期时返回None
+        """
+        raise NotImplementedError
+
+    def replace_request(self, fingerprint, old_task_id, task_id, ttl_seconds):
+        """
+        指纹仍登记在 old_task_id 时原子地改为登记到 task_id（比较并交换）
+
+        Returns:
+            bool: 替换成功时返回True
+        """
+        raise NotImplementedError
+
+    def release_request(self, fingerprint, task_id):
+        """
+        指纹登记在 task_id 时删除该登记
+        """
+        raise NotImplementedError
+
+    def __contains__(self, task_id):
+        return self.get(task_id) is not None
+
+class SQLiteTaskStore(TaskStore):
+    """
+    基于SQLite的任务存储，使用WAL模式，读写互不阻塞，可在同一台机器的多个进程间共享
+
+    任务状态以JSON保存，id 为主键，start_time 单独建立索引用于历史记录查询
+    """
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path (str): 数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'id TEXT PRIMARY KEY, start_time REAL NOT NULL, status TEXT, data TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_start_time ON tasks (start_time)')
+        # 请求指纹 → 任务ID，多个Web进程共享同一份登记
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS requests ('
+            'fingerprint TEXT PRIMARY KEY, task_id TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # sqlite3连接不能跨线程共享，每个线程使用自己的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, task_id, data):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO tasks (id, start_time, status, data) VALUES (?, ?, ?, ?)',
+            (task_id, data.get('start_time', 0), data.get('status'), json.dumps(data, ensure_ascii=False))
+        )
+
+    def get(self, task_id):
+        row = self._connect().execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id, **fields):
+        conn = self._connect()
+        # BEGIN IMMEDIATE 立即获取写锁，读取-合并-写回之间不会被其他进程插入写操作
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return False
+            data = json.loads(row[0])
+            data.update(fields)
+            conn.execute(
+                'UPDATE tasks SET status = ?, data = ? WHERE id = ?',
+                (data.get('status'), json.dumps(data, ensure_ascii=False), task_id)
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def increment(self, task_id, field, amount=1):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+            data = json.loads(row[0])
+            data[field] = data.get(field, 0) + amount
+            conn.execute('UPDATE tasks SET data = ? WHERE id = ?', (json.dumps(data, ensure_ascii=False), task_id))
+            conn.execute('COMMIT')
+            return data[field]
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def advance(self, task_id, field, value):
+        # 比较和写入在同一条UPDATE语句中完成，不需要先读后写
+        path = f'$.{field}'
+        cursor = self._connect().execute(
+            'UPDATE tasks SET data = json_set(data, ?, ?) WHERE id = ? AND COALESCE(json_extract(data, ?), 0) < ?',
+            (path, value, task_id, path, value)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, task_id):
+        self._connect().execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def recent(self, limit=10):
+        rows = self._connect().execute(
+            'SELECT id, data FROM tasks ORDER BY start_time DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def started_before(self, timestamp):
+        rows = self._connect().execute(
+            'SELECT id, data FROM tasks WHERE start_time < ?', (timestamp,)
+        ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def claim_request(self, fingerprint, task_id, ttl_seconds):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM requests WHERE fingerprint = ? AND expires_at < ?', (fingerprint, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO requests (fingerprint, task_id, expires_at) VALUES (?, ?, ?)',
+                (fingerprint, task_id, now + ttl_seconds)
+            )
+            conn.execute('COMMIT')
+            return cursor.rowcount > 0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def request_owner(self, fingerprint):
+        row = self._connect().execute(
+            'SELECT task_id FROM requests WHERE fingerprint = ? AND expires_at >= ?', (fingerprint, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def replace_request(self, fingerprint, old_task_id, task_id, ttl_seconds):
+        cursor = self._connect().execute(
+            'UPDATE requests SET task_id = ?, expires_at = ? WHERE fingerprint = ? AND task_id = ?',
+            (task_id, time.time() + ttl_seconds, fingerprint, old_task_id)
+        )
+        return cursor.rowcount > 0
+
+    def release_request(self, fingerprint, task_id):
+        self._connect().execute('DELETE FROM requests WHERE fingerprint = ? AND task_id = ?', (fingerprint, task_id))
+
+# 字段值小于 ARGV[2] 时才写入；任务不存在时不创建只有部分字段的记录
+_ADVANCE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if current ~= nil and current >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# 指纹仍登记在 ARGV[1] 时改为 ARGV[2] 并重置过期时间
+_REPLACE_REQUEST_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# 指纹登记在 ARGV[1] 时删除
+_RELEASE_REQUEST_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class RedisTaskStore(TaskStore):
+    """
+    基于Redis的任务存储，适合多台机器上的Web进程共享任务状态
+
+    每个任务保存为一个哈希（字段值为JSON），另用有序集合按开始时间建立索引
+    """
+
+    def __init__(self, url, prefix='comic_video'):
+        """
+        Args:
+            url (str): Redis连接地址，如 redis://localhost:6379/0
+            prefix (str): 键名前缀
+        """
+        if redis is None:
+            raise RuntimeError("未安装redis，无法使用Redis任务存储")
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._index_key = f"{prefix}:tasks:by_start_time"
+        self._advance_script = self._client.register_script(_ADVANCE_SCRIPT)
+        self._replace_request_script = self._client.register_script(_REPLACE_REQUEST_SCRIPT)
+        self._release_request_script = self._client.register_script(_RELEASE_REQUEST_SCRIPT)
+
+    def _key(self, task_id):
+        return f"{self._prefix}:task:{task_id}"
+
+    def create(self, task_id, data):
+        pipe = self._client.pipeline()
+        pipe.delete(self._key(task_id))
+        pipe.hset(self._key(task_id), mapping={k: json.dumps(v, ensure_ascii=False) for k, v in data.items()})
+        pipe.zadd(self._index_key, {task_id: data.get('start_time', 0)})
+        pipe.execute()
+
+    def get(self, task_id):
+        return self._decode(self._client.hgetall(self._key(task_id)))
+
+    def update(self, task_id, **fields):
+        if not fields:
+            return task_id in self
+        # 只写入变化的字段，HSET 本身是原子操作，无需先读后写
+        key = self._key(task_id)
+        pipe = self._client.pipeline()
+        pipe.exists(key)
+        pipe.hset(key, mapping={k: json.dumps(v, ensure_ascii=False) for k, v in fields.items()})
+        existed = pipe.execute()[0]
+        if not existed:
+            # 任务已被删除，不留下只有部分字段的记录
+            self._client.delete(key)
+            return False
+        return True
+
+    def increment(self, task_id, field, amount=1):
+        key = self._key(task_id)
+        if not self._client.exists(key):
+            return None
+        # 整数的JSON编码与Redis的整数字符串一致，可以直接使用HINCRBY
+        return self._client.hincrby(key, field, amount)
+
+    def advance(self, task_id, field, value):
+        # Lua脚本在Redis中原子执行，比较和写入之间不会插入其他进程的更新
+        return bool(self._advance_script(keys=[self._key(task_id)], args=[field, json.dumps(value)]))
+
+    def delete(self, task_id):
+        pipe = self._client.pipeline()
+        pipe.delete(self._key(task_id))
+        pipe.zrem(self._index_key, task_id)
+        pipe.execute()
+
+    def recent(self, limit=10):
+        task_ids = [t.decode('utf-8') for t in self._client.zrevrange(self._index_key, 0, limit - 1)]
+        return self._load_many(task_ids)
+
+    def started_before(self, timestamp):
+        task_ids = [t.decode('utf-8') for t in self._client.zrangebyscore(self._index_key, '-inf', f'({timestamp}')]
+        return self._load_many(task_ids)
+
+    def _request_key(self, fingerprint):
+        return f"{self._prefix}:request:{fingerprint}"
+
+    def claim_request(self, fingerprint, task_id, ttl_seconds):
+        # SET NX EX：未登记时登记并设置过期时间，过期的登记由Redis自动删除
+        return bool(self._client.set(self._request_key(fingerprint), task_id, nx=True, ex=max(1, int(ttl_seconds))))
+
+    def request_owner(self, fingerprint):
+        task_id = self._client.get(self._request_key(fingerprint))
+        return task_id.decode('utf-8') if task_id is not None else None
+
+    def replace_request(self, fingerprint, old_task_id, task_id, ttl_seconds):
+        return bool(self._replace_request_script(keys=[self._request_key(fingerprint)],
+                                                 args=[old_task_id, task_id, max(1, int(ttl_seconds))]))
+
+    def release_request(self, fingerprint, task_id):
+        self._release_request_script(keys=[self._request_key(fingerprint)], args=[task_id])
+
+    def _load_many(self, task_ids):
+        pipe = self._client.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(self._key(task_id))
+        results = []
+        for task_id, raw in zip(task_ids, pipe.execute()):
+            data = self._decode(raw)
+            if data is not None:
+                results.append((task_id, data))
+        return results
+
+    @staticmethod
+    def _decode(raw):
+        if not raw:
+            return None
+        return {k.decode('utf-8'): json.loads(v) for k, v in raw.items()}
+
+def create_task_store(backend, db_path=None, redis_url=None):
+    """
+    根据配置创建任务存储
+
+    Args:
+        backend (str): sqlite 或 redis
+        db_path (str): SQLite数据库文件路径
+        redis_url (str): Redis连接地址
+
+    Returns:
+        TaskStore: 任务存储
+    """
+    if backend == 'redis':
+        return RedisTaskStore(redis_url)
+    if backend == 'sqlite':
+        return SQLiteTaskStore(db_path)
+    raise ValueError(f"不支持的任务存储后端: {backend}")
+
+def task_status(task, average_task_seconds=0):
+    """
+    根据任务记录构建对外的任务状态（状态接口和状态事件共用，不含排队信息）
+
+    Args:
+        task (dict): 任务存储中的任务记录
+        average_task_seconds (float): 平均任务耗时，进度为0时用于估算剩余时间
+
+    Returns:
+        dict: 任务状态
+    """
+    response = {
+        'status': task['status'],
+        'progress': task['progress']
+    }
+    
+    if task['status'] == 'processing':
+        # 处理中：根据已用时间和进度估算剩余时间
+        elapsed = time.time() - task.get('run_start_time', time.time())
+        if task['progress'] > 0:
+            response['eta'] = int(elapsed * (100 - task['progress']) / task['progress'])
+        else:
+            response['eta'] = int(max(average_task_seconds - elapsed, 0))
+    elif task['status'] == 'completed':
+        response['video_url'] = task['video_url']
+        if 'image_timings' in task:
+            response['image_timings'] = task['image_timings']
+    elif task['status'] == 'failed':
+        response['error'] = task.get('error', '未知错误')
+    
+    # 修改任务：原任务ID和各阶段复用的场景数
+    if task.get('revised_from'):
+        response['revised_from'] = task['revised_from']
+        if 'reused' in task:
+            response['reused'] = task['reused']
+    
+    # 流水线模式：渐进式HLS播放列表，第一个场景编码完成后即可开始播放
+    if task.get('playlist_url'):
+        response['playlist_url'] = task['playlist_url']
+    
+    # 上传文件的任务：已完成的章节可以先播放
+    if 'chapters' in task:
+        response['chapters'] = task['chapters']
+    
+    return response
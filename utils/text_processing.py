@@ -2,6 +2,7 @@ import re
 import jieba
 import nltk
 from nltk.tokenize import sent_tokenize
+from config import SCENE_MAX_CHARS, CHAPTER_MAX_CHARS
 
 # 尝试下载nltk数据，如果已存在则跳过
 try:
@@ -9,6 +10,19 @@ try:
 except LookupError:
     nltk.download('punkt')
 
+# 英文章节序号的单词写法，如 One、Twelve、Twenty-One、One Hundred
+ENGLISH_NUMBER_WORDS = (
+    r'(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|fourteen|fifteen|sixteen|'
+    r'seventeen|eighteen|nineteen|twenty|thirty|forty|fifty|sixty|seventy|eighty|ninety|hundred|thousand)'
+)
+
+# 章节标题：中文的“第X章/回/节/卷”或英文的“Chapter X”（序号为数字、罗马数字或英文单词）
+CHAPTER_HEADING_PATTERN = re.compile(
+    r'^\s*(第[零一二两三四五六七八九十百千万\d]+[章回节卷]'
+    r'|chapter\s+(?:[\divxlc]+|' + ENGLISH_NUMBER_WORDS + r'(?:(?:\s+and)?[\s-]+' + ENGLISH_NUMBER_WORDS + r')*)\b)',
+    re.IGNORECASE
+)
+
 def split_text_into_scenes(text, max_scenes=10):
     """
     将输入文本分割成场景列表
@@ -20,21 +34,7 @@ def split_text_into_scenes(text, max_scenes=10):
     Returns:
         list: 场景文本列表
     """
-    # 移除多余空白字符
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # 检测语言（简单判断是否为中文）
-    is_chinese = bool(re.search(r'[\u4e00-\u9fff]', text))
-    
-    if is_chinese:
-        # 中文文本处理
-        # 按句号、问号、感叹号分割，保留标点
-        sentences = re.findall(r'[^。！？]+[。！？]', text)
-        if not sentences and text:
-            sentences = [text]  # 如果没有分割成功，则将整个文本作为一个句子
-    else:
-        # 英文文本处理
-        sentences = sent_tokenize(text)
+    sentences = list(iter_sentences([text]))
     
     # 如果句子数量少于max_scenes，直接返回每个句子作为一个场景
     if len(sentences) <= max_scenes:
@@ -55,6 +55,146 @@ def split_text_into_scenes(text, max_scenes=10):
     
     return scenes
 
+def open_text_file(path):
+    """
+    打开上传的文本文件，自动识别UTF-8和GB18030编码
+    
+    Args:
+        path (str): 文件路径
+        
+    Returns:
+        file: 文本模式的文件对象
+    """
+    with open(path, 'rb') as f:
+        head = f.read(65536)
+    encoding = 'utf-8-sig'
+    try:
+        head.decode(encoding)
+    except UnicodeDecodeError as e:
+        # 读取的开头可能截断了一个多字节字符，只有在末尾之前出错才说明不是UTF-8
+        if e.start < len(head) - 3:
+            encoding = 'gb18030'
+    return open(path, 'r', encoding=encoding, errors='replace')
+
+def read_lines(stream, chunk_size=65536):
+    """
+    逐行读取文本流，单行超过chunk_size时分段返回，没有换行的超长文本也不会一次读入内存
+    
+    Args:
+        stream (file): 文本模式的文件对象
+        chunk_size (int): 每次最多读取的字符数
+        
+    Yields:
+        str: 文本行（或超长行的一段）
+    """
+    while True:
+        line = stream.readline(chunk_size)
+        if not line:
+            return
+        yield line
+
+def iter_chapters(lines, max_chars=None):
+    """
+    按章节标题切分逐行读取的文本，每读完一章就返回，不需要读完整个文件
+    
+    没有章节标题或单章过长时，按 max_chars 在行尾处切分
+    
+    Args:
+        lines (iterable): 文本行
+        max_chars (int): 单个章节的最大字符数，默认使用配置中的CHAPTER_MAX_CHARS
+        
+    Yields:
+        tuple: (章节标题, 章节文本)，第一个标题之前的内容标题为空字符串
+    """
+    max_chars = max_chars or CHAPTER_MAX_CHARS
+    title, buffer, size = '', [], 0
+    for line in lines:
+        if CHAPTER_HEADING_PATTERN.match(line):
+            text = ''.join(buffer)
+            if text.strip():
+                yield title, text
+            title, buffer, size = line.strip(), [], 0
+            continue
+        
+        buffer.append(line)
+        size += len(line)
+        if size >= max_chars:
+            text = ''.join(buffer)
+            if text.strip():
+                yield title, text
+            buffer, size = [], 0
+    
+    text = ''.join(buffer)
+    if text.strip():
+        yield title, text
+
+def iter_sentences(pieces, max_chars=None):
+    """
+    从文本片段流中逐句切分，只在内存中保留尚未结束的句子
+    
+    Args:
+        pieces (iterable): 文本片段（如文件的各行）
+        max_chars (int): 句子的最大字符数，没有句末标点的超长文本按此长度强制断开
+        
+    Yields:
+        str: 句子
+    """
+    max_chars = max_chars or SCENE_MAX_CHARS * 4
+    buffer = ''
+    for piece in pieces:
+        # 移除多余空白字符
+        buffer = re.sub(r'\s+', ' ', buffer + piece)
+        
+        if re.search(r'[\u4e00-\u9fff]', buffer):
+            # 中文文本处理：按句号、问号、感叹号分割，保留标点
+            end = 0
+            for match in re.finditer(r'[^。！？]+[。！？]', buffer):
+                sentence = match.group().strip()
+                if sentence:
+                    yield sentence
+                end = match.end()
+            buffer = buffer[end:]
+        else:
+            # 英文文本处理：最后一句可能还没有结束，留到下一个片段
+            sentences = sent_tokenize(buffer)
+            if len(sentences) > 1:
+                for sentence in sentences[:-1]:
+                    yield sentence
+                buffer = sentences[-1]
+        
+        while len(buffer) > max_chars:
+            yield buffer[:max_chars].strip()
+            buffer = buffer[max_chars:]
+    
+    # 文本末尾没有句末标点的部分作为最后一句
+    buffer = buffer.strip()
+    if buffer:
+        yield from (sent_tokenize(buffer) if not re.search(r'[\u4e00-\u9fff]', buffer) else [buffer])
+
+def iter_scenes(pieces, max_chars=None):
+    """
+    从文本片段流中逐个生成场景，相邻句子合并为不超过 max_chars 的场景
+    
+    场景在句子读到时立即产生，下游的图像生成和语音合成可以在文本解析完成之前开始
+    
+    Args:
+        pieces (iterable): 文本片段
+        max_chars (int): 单个场景的最大字符数，默认使用配置中的SCENE_MAX_CHARS
+        
+    Yields:
+        str: 场景文本
+    """
+    max_chars = max_chars or SCENE_MAX_CHARS
+    scene, size = [], 0
+    for sentence in iter_sentences(pieces):
+        if scene and size + len(sentence) > max_chars:
+            yield ' '.join(scene)
+            scene, size = [], 0
+        scene.append(sentence)
+        size += len(sentence)
+    if scene:
+        yield ' '.join(scene)
+
 def generate_scene_descriptions(scenes):
     """
     为每个场景生成描述，用于图像生成
@@ -0,0 +1,67 @@
+import random
+import numpy as np
+from PIL import Image
+
+# 可用的过渡效果：交叉淡化，以及先淡出到纯色再从纯色淡入
+TRANSITION_TYPES = ('crossfade', 'color')
+
+def choose_transition(rng=None):
+    """
+    随机选择一种过渡效果
+
+    Args:
+        rng (random.Random): 随机数生成器，默认使用全局random
+
+    Returns:
+        dict: 过渡效果，包含 type，纯色过渡还包含 color
+    """
+    rng = rng or random
+    kind = rng.choice(TRANSITION_TYPES)
+    if kind == 'color':
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        return {'type': kind, 'color': color}
+    return {'type': kind}
+
+def match_size(image, width, height):
+    """
+    将图像数组缩放到指定尺寸，尺寸相同时直接返回
+    """
+    if image.shape[1] == width and image.shape[0] == height:
+        return image
+    return np.array(Image.fromarray(image).resize((width, height), Image.LANCZOS))
+
+def render_transition_frames(image_a, image_b, num_frames, transition=None):
+    """
+    一次性计算两张场景图像之间的全部过渡帧
+
+    过渡窗口内的所有帧通过NumPy广播一次完成alpha混合，不在Python中逐帧循环
+
+    Args:
+        image_a (numpy.ndarray): 前一场景图像（H×W×3，uint8）
+        image_b (numpy.ndarray): 后一场景图像，尺寸不同时缩放到与前一场景一致
+        num_frames (int): 过渡帧数
+        transition (dict): 过渡效果（见choose_transition），默认交叉淡化
+
+    Returns:
+        numpy.ndarray: 过渡帧数组（N×H×W×3，uint8）
+    """
+    transition = transition or {'type': 'crossfade'}
+    height, width = image_a.shape[:2]
+    a = image_a.astype(np.float32)
+    b = match_size(image_b, width, height).astype(np.float32)
+
+    # 混合系数不含两端，首尾帧与前后场景的静态画面衔接
+    alpha = (np.arange(1, num_frames + 1, dtype=np.float32) / (num_frames + 1)).reshape(-1, 1, 1, 1)
+
+    if transition['type'] == 'color':
+        # 前半段从前一场景淡出到纯色，后半段从纯色淡入后一场景
+        color = np.array(transition.get('color', (0, 0, 0)), dtype=np.float32).reshape(1, 1, 1, 3)
+        fade_out = np.clip(alpha * 2, 0, 1)
+        fade_in = np.clip(alpha * 2 - 1, 0, 1)
+        first_half = a * (1 - fade_out) + color * fade_out
+        second_half = color * (1 - fade_in) + b * fade_in
+        frames = np.where(alpha < 0.5, first_half, second_half)
+    else:
+        frames = a * (1 - alpha) + b * alpha
+
+    return np.clip(frames + 0.5, 0, 255).astype(np.uint8)
@@ -1,13 +1,85 @@
 import os
+import csv
+import math
 import random
+import threading
+import subprocess
 import numpy as np
 from PIL import Image
-from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips, CompositeVideoClip, VideoFileClip
-from moviepy.editor import vfx, transfx
-from config import FPS, VIDEO_CODEC, AUDIO_CODEC
+from moviepy.editor import ImageClip, AudioFileClip, AudioClip, concatenate_videoclips, concatenate_audioclips
+from moviepy.editor import transfx
+from moviepy.config import get_setting
+from config import FPS, VIDEO_CODEC, AUDIO_CODEC, VIDEO_ENCODER, TRANSITION_DURATION, HLS_SEGMENT_SECONDS
 from utils.audio_generation import get_voice_duration
+from utils.transitions import choose_transition, render_transition_frames
+from utils.cancellation import check_cancelled
 
-def create_video(image_paths, audio_paths, output_path, fps=None, use_transitions=False, add_background_music=False):
+# 背景音乐文件路径
+BACKGROUND_MUSIC_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'audio', 'background.mp3')
+
+# 场景片段的音频采样率，所有片段保持一致才能直接拼接
+SEGMENT_AUDIO_FPS = 44100
+
+# 最终视频把moov索引移到文件开头，浏览器下载前几KB后即可开始播放，并支持按Range跳转
+FASTSTART_ARGS = ['-movflags', '+faststart']
+
+# HLS播放列表文件名，位于任务输出目录的 hls 子目录中
+HLS_PLAYLIST_NAME = 'playlist.m3u8'
+
+def get_scene_duration(audio_path, audio_duration=None):
+    """
+    获取场景持续时间
+    
+    Args:
+        audio_path (str): 场景音频文件路径，可以为None
+        audio_duration (float): 已知的音频时长（如任务清单中记录的值），提供时不再读取音频文件
+        
+    Returns:
+        float: 场景持续时间（秒），有音频时使用音频时长（至少2秒），否则默认3秒
+    """
+    if not audio_path:
+        return 3.0
+    if not audio_duration:
+        audio_duration = get_voice_duration(audio_path)
+    return max(audio_duration, 2.0)
+
+def get_transition_duration(scene_duration):
+    """
+    获取进入某个场景的过渡时长：过渡占用该场景开头的时间，最多占场景时长的一半
+
+    Args:
+        scene_duration (float): 后一场景的持续时间（秒）
+
+    Returns:
+        float: 过渡时长（秒）
+    """
+    return min(TRANSITION_DURATION, scene_duration / 2)
+
+def load_image_array(image_path):
+    """
+    加载图像为RGB数组，加载失败时返回白色空白图像
+    
+    Args:
+        image_path (str): 图像文件路径
+        
+    Returns:
+        numpy.ndarray: 图像数组
+    """
+    try:
+        img = Image.open(image_path)
+        # 确保图像是RGB模式
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.array(img)
+    except Exception as e:
+        print(f"加载图像失败 {image_path}: {e}")
+        # 创建空白图像
+        img_array = np.zeros((512, 768, 3), dtype=np.uint8)
+        img_array.fill(255)  # 白色背景
+        return img_array
+
+def create_video(image_paths, audio_paths, output_path, fps=None, use_transitions=False, add_background_music=False,
+                 durations=None, cancel_token=None):
     """
     创建视频，将图像和音频合成为视频
     
@@ -18,6 +90,8 @@ def create_video(image_paths, audio_paths, output_path, fps=None, use_transition
         fps (int): 帧率，默认使用配置中的FPS
         use_transitions (bool): 是否使用过渡效果
         add_background_music (bool): 是否添加背景音乐
+        durations (list): 各场景音频时长（来自任务清单），提供时不再读取音频文件获取时长
+        cancel_token (CancellationToken): 取消令牌，快速编码模式下每个片段编码前检查
         
     Returns:
         str: 输出视频文件路径
@@ -29,42 +103,34 @@ def create_video(image_paths, audio_paths, output_path, fps=None, use_transition
     # 确保输出目录存在
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
+    # 每个场景都是一张静态图像，直接用ffmpeg编码后拼接，不经过moviepy逐帧合成
+    if VIDEO_ENCODER == 'ffmpeg':
+        return create_video_fast(image_paths, audio_paths, output_path, fps, add_background_music, durations,
+                                 use_transitions, cancel_token)
+    
     # 创建视频片段列表
     video_clips = []
     
     # 处理每个场景
     for i, image_path in enumerate(image_paths):
         # 加载图像
-        try:
-            img = Image.open(image_path)
-            # 确保图像是RGB模式
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img_array = np.array(img)
-        except Exception as e:
-            print(f"加载图像失败 {image_path}: {e}")
-            # 创建空白图像
-            img_array = np.zeros((512, 768, 3), dtype=np.uint8)
-            img_array.fill(255)  # 白色背景
+        img_array = load_image_array(image_path)
         
         # 确定片段持续时间
-        duration = 3.0  # 默认3秒
-        if audio_paths and i < len(audio_paths) and audio_paths[i]:
-            # 如果有对应的音频，使用音频持续时间
-            duration = get_voice_duration(audio_paths[i])
-            # 确保最短持续时间
-            duration = max(duration, 2.0)
+        audio_path = audio_paths[i] if audio_paths and i < len(audio_paths) else None
+        audio_duration = durations[i] if durations and i < len(durations) else None
+        duration = get_scene_duration(audio_path, audio_duration)
         
         # 创建图像片段
         image_clip = ImageClip(img_array).set_duration(duration)
         
         # 添加音频（如果有）
-        if audio_paths and i < len(audio_paths) and audio_paths[i]:
+        if audio_path:
             try:
-                audio_clip = AudioFileClip(audio_paths[i])
+                audio_clip = AudioFileClip(audio_path)
                 image_clip = image_clip.set_audio(audio_clip)
             except Exception as e:
-                print(f"加载音频失败 {audio_paths[i]}: {e}")
+                print(f"加载音频失败 {audio_path}: {e}")
         
         # 添加到视频片段列表
         video_clips.append(image_clip)
@@ -74,16 +140,16 @@ def create_video(image_paths, audio_paths, output_path, fps=None, use_transition
         video_clips = create_video_with_transitions(video_clips)
     
     # 合并所有片段
+    check_cancelled(cancel_token)
     final_clip = concatenate_videoclips(video_clips, method="compose")
     
     # 添加背景音乐（如果启用）
     if add_background_music:
         try:
             # 检查背景音乐文件是否存在
-            bg_music_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'audio', 'background.mp3')
-            if os.path.exists(bg_music_path):
+            if os.path.exists(BACKGROUND_MUSIC_PATH):
                 # 加载背景音乐
-                bg_music = AudioFileClip(bg_music_path)
+                bg_music = AudioFileClip(BACKGROUND_MUSIC_PATH)
                 
                 # 循环背景音乐以匹配视频长度
                 if bg_music.duration < final_clip.duration:
@@ -111,7 +177,8 @@ def create_video(image_paths, audio_paths, output_path, fps=None, use_transition
         codec=VIDEO_CODEC,
         audio_codec=AUDIO_CODEC,
         threads=4,
-        preset='medium'
+        preset='medium',
+        ffmpeg_params=FASTSTART_ARGS
     )
     
     # 清理资源
@@ -176,6 +243,261 @@ def create_video_with_transitions(video_clips):
     
     return result_clips
 
+def create_video_fast(image_paths, audio_paths, output_path, fps=None, add_background_music=False, durations=None,
+                      use_transitions=False, cancel_token=None):
+    """
+    快速编码模式：逐个场景用ffmpeg把静态图像编码为片段，再用concat分离器直接拼接
+    
+    Python不参与逐帧处理，编码时间和内存占用都远低于moviepy合成。
+    启用过渡效果时，只额外编码相邻场景之间的短过渡片段，静态部分仍然直接拼接；
+    过渡片段占用后一场景开头的时间并播放其旁白开头，视频总时长不变，旁白不中断
+    
+    Args:
+        image_paths (list): 图像文件路径列表
+        audio_paths (list): 音频文件路径列表，可以为None
+        output_path (str): 输出视频文件路径
+        fps (int): 帧率，默认使用配置中的FPS
+        add_background_music (bool): 是否添加背景音乐
+        durations (list): 各场景音频时长（来自任务清单）
+        use_transitions (bool): 是否在相邻场景之间插入过渡片段
+        cancel_token (CancellationToken): 取消令牌，每个片段编码前检查
+        
+    Returns:
+        str: 输出视频文件路径，失败时返回None
+    """
+    output_dir = os.path.dirname(output_path)
+    segment_paths = []
+    for i, image_path in enumerate(image_paths):
+        check_cancelled(cancel_token)
+        audio_path = audio_paths[i] if audio_paths and i < len(audio_paths) else None
+        audio_duration = durations[i] if durations and i < len(durations) else None
+        
+        lead_in = 0.0
+        if use_transitions and i > 0:
+            lead_in = get_transition_duration(get_scene_duration(audio_path, audio_duration))
+            transition_path = os.path.join(output_dir, f"transition_{i:03d}.mp4")
+            create_transition_clip(image_paths[i - 1], image_path, transition_path, fps, duration=lead_in,
+                                   audio_path=audio_path)
+            segment_paths.append(transition_path)
+        
+        segment_path = os.path.join(output_dir, f"segment_{i:03d}.mp4")
+        create_scene_clip(image_path, audio_path, segment_path, fps, audio_duration, lead_in=lead_in)
+        segment_paths.append(segment_path)
+    
+    return concatenate_segments(segment_paths, output_path, add_background_music)
+
+def create_scene_clip(image_path, audio_path, output_path, fps=None, audio_duration=None, lead_in=0.0):
+    """
+    将单个场景编码为独立的视频片段，供最后直接拼接
+    
+    所有片段使用相同的编码参数和音频格式（双声道、固定采样率），
+    没有音频的场景写入静音轨道，保证片段之间可以无损拼接。
+    VIDEO_ENCODER 为 ffmpeg 时直接调用ffmpeg循环单张图像编码，否则使用moviepy
+    
+    Args:
+        image_path (str): 场景图像路径
+        audio_path (str): 场景音频路径，可以为None
+        output_path (str): 输出片段路径
+        fps (int): 帧率，默认使用配置中的FPS
+        audio_duration (float): 已知的音频时长，提供时不再读取音频文件获取时长
+        lead_in (float): 场景开头已由过渡片段播放的时长（秒），片段从音频的该位置开始并相应缩短
+        
+    Returns:
+        str: 输出片段路径
+    """
+    if fps is None:
+        fps = FPS
+    
+    duration = get_scene_duration(audio_path, audio_duration) - lead_in
+    if VIDEO_ENCODER == 'ffmpeg':
+        _encode_still_segment(image_path, audio_path, output_path, duration, fps, audio_offset=lead_in)
+        return output_path
+    
+    clip = ImageClip(load_image_array(image_path)).set_duration(duration)
+    
+    # 加载音频，不足片段时长的部分用静音补齐
+    audio_clip = None
+    if audio_path:
+        try:
+            audio_clip = AudioFileClip(audio_path)
+            if lead_in > 0:
+                audio_clip = audio_clip.subclip(min(lead_in, audio_clip.duration))
+            if audio_clip.duration < duration:
+                audio_clip = concatenate_audioclips([audio_clip, _make_silence(duration - audio_clip.duration)])
+        except Exception as e:
+            print(f"加载音频失败 {audio_path}: {e}")
+            audio_clip = None
+    if audio_clip is None:
+        audio_clip = _make_silence(duration)
+    clip = clip.set_audio(audio_clip)
+    
+    clip.write_videofile(
+        output_path,
+        fps=fps,
+        codec=VIDEO_CODEC,
+        audio_codec=AUDIO_CODEC,
+        audio_fps=SEGMENT_AUDIO_FPS,
+        threads=2,
+        preset='medium',
+        ffmpeg_params=['-g', str(_keyframe_interval(fps))],
+        logger=None
+    )
+    clip.close()
+    
+    return output_path
+
+def create_transition_clip(image_path_a, image_path_b, output_path, fps=None, transition=None, duration=None,
+                           audio_path=None):
+    """
+    编码相邻两个场景之间的过渡片段，插入到两个场景片段之间拼接
+
+    过渡占用后一场景开头的时间：片段中播放后一场景旁白的开头部分，
+    后一场景的片段以相同的时长作为 lead_in 编码，视频总时长不变，旁白不中断
+    
+    过渡帧由NumPy一次性计算后通过管道直接交给ffmpeg编码，
+    编码参数与场景片段一致，保证可以直接拼接
+    
+    Args:
+        image_path_a (str): 前一场景图像路径
+        image_path_b (str): 后一场景图像路径
+        output_path (str): 输出片段路径
+        fps (int): 帧率，默认使用配置中的FPS
+        transition (dict): 过渡效果，默认随机选择
+        duration (float): 过渡时长（秒），默认使用配置中的TRANSITION_DURATION
+        audio_path (str): 后一场景的音频路径，为None时过渡片段为静音
+        
+    Returns:
+        str: 输出片段路径
+    """
+    if fps is None:
+        fps = FPS
+    if duration is None:
+        duration = TRANSITION_DURATION
+    if transition is None:
+        transition = choose_transition()
+    
+    num_frames = max(1, int(round(duration * fps)))
+    frames = render_transition_frames(load_image_array(image_path_a), load_image_array(image_path_b),
+                                      num_frames, transition)
+    height, width = frames.shape[1:3]
+    
+    args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-framerate', str(fps), '-i', '-']
+    if audio_path and os.path.exists(audio_path):
+        args += ['-i', audio_path, '-af', 'apad']
+    else:
+        args += ['-f', 'lavfi', '-i', f'anullsrc=r={SEGMENT_AUDIO_FPS}:cl=stereo']
+    args += [
+        '-map', '0:v', '-map', '1:a',
+        '-frames:v', str(num_frames), '-t', f'{num_frames / fps:.3f}'
+    ] + _segment_codec_args(fps) + [output_path]
+    _run_ffmpeg(args, input_data=frames.tobytes())
+    
+    return output_path
+
+def concatenate_segments(segment_paths, output_path, add_background_music=False):
+    """
+    使用ffmpeg concat分离器拼接预先编码好的场景片段，视频流直接复制不重新编码
+    
+    Args:
+        segment_paths (list): 场景片段路径列表（按播放顺序）
+        output_path (str): 输出视频文件路径
+        add_background_music (bool): 是否混入背景音乐（只重新编码音频）
+        
+    Returns:
+        str: 输出视频文件路径，失败时返回None
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    
+    # 写入concat列表文件
+    list_path = os.path.splitext(output_path)[0] + '_segments.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for segment_path in segment_paths:
+            escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    
+    args = ['-f', 'concat', '-safe', '0', '-i', list_path]
+    if add_background_music and os.path.exists(BACKGROUND_MUSIC_PATH):
+        # 循环背景音乐，降低音量后与旁白混合
+        args += [
+            '-stream_loop', '-1', '-i', BACKGROUND_MUSIC_PATH,
+            '-filter_complex', '[1:a]volume=0.3[bg];[0:a][bg]amix=inputs=2:duration=first:dropout_transition=0[a]',
+            '-map', '0:v', '-map', '[a]',
+            '-c:v', 'copy', '-c:a', AUDIO_CODEC
+        ]
+    else:
+        args += ['-c', 'copy']
+    args += FASTSTART_ARGS
+    args.append(output_path)
+    
+    try:
+        _run_ffmpeg(args)
+    except RuntimeError as e:
+        print(f"拼接视频片段失败: {e}")
+        return None
+    finally:
+        if os.path.exists(list_path):
+            os.remove(list_path)
+    
+    return output_path
+
+def _run_ffmpeg(args, input_data=None):
+    """
+    运行ffmpeg命令，失败时抛出RuntimeError
+    
+    Args:
+        args (list): ffmpeg参数（不含程序名和通用选项）
+        input_data (bytes): 写入ffmpeg标准输入的数据，如原始视频帧
+    """
+    command = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error'] + args
+    try:
+        subprocess.run(command, input=input_data, check=True, capture_output=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg执行失败: {e.stderr.decode('utf-8', errors='ignore')}")
+
+def _encode_still_segment(image_path, audio_path, output_path, duration, fps, audio_offset=0.0):
+    """
+    用ffmpeg把单张图像循环编码为指定时长的片段，并直接混入旁白（不足部分补静音）
+
+    audio_offset 大于0时旁白从该位置开始（开头部分已在过渡片段中播放）
+    """
+    args = ['-loop', '1', '-framerate', str(fps), '-i', image_path]
+    if audio_path and os.path.exists(audio_path):
+        if audio_offset > 0:
+            args += ['-ss', f'{audio_offset:.3f}']
+        args += ['-i', audio_path, '-af', 'apad']
+    else:
+        args += ['-f', 'lavfi', '-i', f'anullsrc=r={SEGMENT_AUDIO_FPS}:cl=stereo']
+    args += ['-map', '0:v', '-map', '1:a', '-t', f'{duration:.3f}'] + _segment_codec_args(fps) + [output_path]
+    _run_ffmpeg(args)
+
+def _segment_codec_args(fps):
+    """
+    所有场景片段和过渡片段共用的编码参数，参数一致才能用concat分离器直接拼接
+    """
+    return [
+        # libx264 + yuv420p 要求宽高为偶数
+        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+        '-c:v', VIDEO_CODEC, '-tune', 'stillimage', '-preset', 'medium', '-pix_fmt', 'yuv420p', '-r', str(fps),
+        '-g', str(_keyframe_interval(fps)),
+        '-c:a', AUDIO_CODEC, '-ar', str(SEGMENT_AUDIO_FPS), '-ac', '2'
+    ]
+
+def _keyframe_interval(fps):
+    """
+    片段的关键帧间隔（帧数），与HLS分片时长一致，转为HLS时每个分片都能在关键帧处切开
+    """
+    return max(1, int(fps * HLS_SEGMENT_SECONDS))
+
+def _make_silence(duration):
+    """
+    创建指定时长的双声道静音音频片段
+    """
+    def make_frame(t):
+        if np.ndim(t) == 0:
+            return np.zeros(2)
+        return np.zeros((len(t), 2))
+    return AudioClip(make_frame, duration=duration, fps=SEGMENT_AUDIO_FPS)
+
 # 为了兼容性，保留原始函数名但调用新函数
 def create_video_from_images_and_audio(image_paths, audio_paths, output_path, fps=None):
     """
@@ -207,3 +529,87 @@ class CompositeAudioClip:
         # 防止音频过载
         result = np.clip(result, -1.0, 1.0)
         return result
+
+class HLSPlaylist:
+    """
+    渐进式HLS输出：每编码完一个场景片段就转为MPEG-TS分片并追加到播放列表
+
+    播放列表为EVENT类型，生成过程中播放器会定期重新加载并播放新追加的分片，
+    观众在第一个场景编码完成后即可开始观看，全部完成后写入 EXT-X-ENDLIST。
+    分片由已编码的片段直接复制流得到，不重新编码
+    """
+
+    def __init__(self, output_dir, segment_seconds=None):
+        """
+        Args:
+            output_dir (str): 分片和播放列表的输出目录
+            segment_seconds (int): 分片时长（秒），默认使用配置中的HLS_SEGMENT_SECONDS
+        """
+        self.output_dir = output_dir
+        self.playlist_path = os.path.join(output_dir, HLS_PLAYLIST_NAME)
+        self.segment_seconds = segment_seconds or HLS_SEGMENT_SECONDS
+        self._entries = []
+        self._offset = 0.0
+        self._count = 0
+        self._ended = False
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        self._write()
+
+    def append(self, segment_path):
+        """
+        把一个已编码的片段（场景或过渡）切分为TS分片并追加到播放列表
+
+        Args:
+            segment_path (str): 片段路径
+
+        Returns:
+            int: 追加的分片数
+        """
+        with self._lock:
+            prefix = f"part_{self._count:04d}"
+            list_path = os.path.join(self.output_dir, prefix + '.csv')
+            # 时间戳按已追加的总时长偏移，各分片在播放器中连续播放
+            _run_ffmpeg([
+                '-i', segment_path, '-map', '0', '-c', 'copy',
+                '-f', 'segment', '-segment_format', 'mpegts', '-segment_time', str(self.segment_seconds),
+                '-segment_list', list_path, '-segment_list_type', 'csv',
+                '-output_ts_offset', f'{self._offset:.3f}',
+                os.path.join(self.output_dir, prefix + '_%03d.ts')
+            ])
+            with open(list_path, newline='', encoding='utf-8') as f:
+                parts = [(os.path.basename(row[0]), float(row[2]) - float(row[1])) for row in csv.reader(f) if row]
+            os.remove(list_path)
+
+            self._entries.extend(parts)
+            self._offset += sum(duration for _, duration in parts)
+            self._count += 1
+            self._write()
+            return len(parts)
+
+    def finish(self):
+        """
+        标记播放列表结束，播放器不再重新加载
+        """
+        with self._lock:
+            self._ended = True
+            self._write()
+
+    def _write(self):
+        # 先写入临时文件再替换，播放器不会读到写了一半的播放列表
+        target = max([self.segment_seconds] + [math.ceil(duration) for _, duration in self._entries])
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:EVENT'
+        ]
+        for name, duration in self._entries:
+            lines += [f'#EXTINF:{duration:.3f},', name]
+        if self._ended:
+            lines.append('#EXT-X-ENDLIST')
+        tmp_path = self.playlist_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.playlist_path)